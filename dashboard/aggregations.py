@@ -0,0 +1,249 @@
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from mappings import (
+    CATEGORY_MAPPING,
+    CITY_MAPPING,
+    PAYMENT_MAPPING,
+    STATE_MAPPING,
+    map_labels,
+)
+
+# panel -> (dimension, measure, metric, label column, value column, labeler)
+# Metrics: "nunique" counts distinct measure keys, "sum" adds the measure,
+# "count" counts rows. Output matches the matching get_* function.
+TOP_N_PANELS = {
+    "top_cities": (
+        "customer_city",
+        "customer_unique_id",
+        "nunique",
+        "City",
+        "Number of Customers",
+        partial(map_labels, mapping=CITY_MAPPING, lowercase=True),
+    ),
+    "top_states": (
+        "customer_state",
+        "customer_unique_id",
+        "nunique",
+        "State",
+        "Number of Customers",
+        partial(map_labels, mapping=STATE_MAPPING),
+    ),
+    "top_categories_orders": (
+        "product_category_name_english",
+        "order_id",
+        "nunique",
+        "Category",
+        "Number of Orders",
+        partial(map_labels, mapping=CATEGORY_MAPPING),
+    ),
+    "top_categories_revenue": (
+        "product_category_name_english",
+        "price",
+        "sum",
+        "Category",
+        "Total Revenue",
+        partial(map_labels, mapping=CATEGORY_MAPPING),
+    ),
+    "payment_counts": (
+        "payment_type",
+        None,
+        "count",
+        "Payment",
+        "Count",
+        partial(map_labels, mapping=PAYMENT_MAPPING),
+    ),
+    "payment_revenue": (
+        "payment_type",
+        "payment_value",
+        "sum",
+        "Payment",
+        "Total Revenue",
+        partial(map_labels, mapping=PAYMENT_MAPPING),
+    ),
+}
+
+
+def factorize(values, sort=False):
+    """Return (int64 codes, uniques) for a column; missing values get code -1."""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy(dtype="int64"), values.cat.categories
+    codes, uniques = pd.factorize(values, sort=sort)
+    return codes.astype("int64", copy=False), uniques
+
+
+def distinct_counts(group_codes, key_codes, n_groups, n_keys):
+    """Count distinct keys per group from integer codes (-1 means missing)."""
+    # Encode each (group, key) pair as one int64, dedupe, then count per group
+    valid = (group_codes >= 0) & (key_codes >= 0)
+    pairs = pd.unique(group_codes[valid] * n_keys + key_codes[valid])
+    return np.bincount(pairs // n_keys, minlength=n_groups)
+
+
+def format_panel(values, label, value_name, labeler):
+    """Turn a per-group Series into a panel frame, as the get_* functions do."""
+    key = values.index.name
+    return (
+        values.reset_index()
+        .assign(**{label: lambda x: labeler(x[key])})
+        .drop(columns=key)
+        .rename(columns={values.name: value_name})
+    )
+
+
+def empty_panels(panels=TOP_N_PANELS):
+    """Return empty panel frames with the expected columns."""
+    return {
+        name: pd.DataFrame(columns=[label, value_name])
+        for name, (_, _, _, label, value_name, _) in panels.items()
+    }
+
+
+def compute_top_n(df, n=5, panels=TOP_N_PANELS):
+    """Compute every top-N panel from one factorization of the filtered rows.
+
+    Each dimension and ID column is converted to integer codes once and the
+    per-group metrics are reduced with ``bincount``, instead of one
+    ``groupby`` over string keys per panel. Returns a dict of DataFrames
+    keyed like ``TOP_N_PANELS``.
+    """
+    if df.empty:
+        return empty_panels(panels)
+
+    codes = {}
+
+    def get_codes(column, sort=False):
+        if column not in codes:
+            codes[column] = factorize(df[column], sort=sort)
+        return codes[column]
+
+    results = {}
+    for name, (dim, measure, metric, label, value_name, labeler) in panels.items():
+        dim_codes, dim_uniques = get_codes(dim, sort=True)
+        n_groups = len(dim_uniques)
+        valid = dim_codes >= 0
+        rows = np.bincount(dim_codes[valid], minlength=n_groups)
+
+        if metric == "nunique":
+            key_codes, key_uniques = get_codes(measure)
+            values = distinct_counts(dim_codes, key_codes, n_groups, len(key_uniques))
+        elif metric == "sum":
+            weights = np.nan_to_num(df[measure].to_numpy(dtype="float64")[valid])
+            values = np.bincount(dim_codes[valid], weights=weights, minlength=n_groups)
+        else:
+            values = rows
+
+        # Groups with no rows would not appear in a groupby either
+        observed = rows > 0
+        series = pd.Series(
+            values[observed],
+            index=pd.Index(np.asarray(dim_uniques)[observed], name=dim),
+            name=measure or "count",
+        )
+        results[name] = format_panel(series.nlargest(n), label, value_name, labeler)
+
+    return results
+
+
+# One groupby per panel; compute_top_n returns the same frames from codes
+def get_top_cities(df, n=5):
+    if df.empty:
+        return pd.DataFrame(columns=["City", "Number of Customers"])
+
+    return (
+        df.groupby("customer_city", observed=True)["customer_unique_id"]
+        .nunique()
+        .nlargest(n)
+        .reset_index()
+        .assign(
+            City=lambda x: map_labels(x["customer_city"], CITY_MAPPING, lowercase=True)
+        )
+        .drop(columns="customer_city")
+        .rename(columns={"customer_unique_id": "Number of Customers"})
+    )
+
+
+def get_top_states(df, n=5):
+    if df.empty:
+        return pd.DataFrame(columns=["State", "Number of Customers"])
+
+    return (
+        df.groupby("customer_state", observed=True)["customer_unique_id"]
+        .nunique()
+        .nlargest(n)
+        .reset_index()
+        .assign(State=lambda x: map_labels(x["customer_state"], STATE_MAPPING))
+        .drop(columns="customer_state")
+        .rename(columns={"customer_unique_id": "Number of Customers"})
+    )
+
+
+def get_top_categories_by_orders(df, n=5):
+    if df.empty:
+        return pd.DataFrame(columns=["Category", "Number of Orders"])
+
+    return (
+        df.groupby("product_category_name_english", observed=True)["order_id"]
+        .nunique()
+        .nlargest(n)
+        .reset_index()
+        .assign(
+            Category=lambda x: map_labels(
+                x["product_category_name_english"], CATEGORY_MAPPING
+            )
+        )
+        .drop(columns="product_category_name_english")
+        .rename(columns={"order_id": "Number of Orders"})
+    )
+
+
+def get_top_categories_by_revenue(df, n=5):
+    if df.empty:
+        return pd.DataFrame(columns=["Category", "Total Revenue"])
+
+    return (
+        df.groupby("product_category_name_english", observed=True)["price"]
+        .sum()
+        .nlargest(n)
+        .reset_index()
+        .assign(
+            Category=lambda x: map_labels(
+                x["product_category_name_english"], CATEGORY_MAPPING
+            )
+        )
+        .drop(columns="product_category_name_english")
+        .rename(columns={"price": "Total Revenue"})
+    )
+
+
+def get_payment_counts(df, n=5):
+    if df.empty:
+        return pd.DataFrame(columns=["Payment", "Count"])
+
+    return (
+        df["payment_type"]
+        .value_counts()
+        .loc[lambda x: x > 0]  # Categorical columns also count unused categories
+        .nlargest(n)
+        .reset_index()
+        .assign(Payment=lambda x: map_labels(x["payment_type"], PAYMENT_MAPPING))
+        .drop(columns="payment_type")
+        .rename(columns={"count": "Count"})
+    )
+
+
+def get_payment_revenue(df, n=5):
+    if df.empty:
+        return pd.DataFrame(columns=["Payment", "Total Revenue"])
+
+    return (
+        df.groupby("payment_type", observed=True)["payment_value"]
+        .sum()
+        .nlargest(n)
+        .reset_index()
+        .assign(Payment=lambda x: map_labels(x["payment_type"], PAYMENT_MAPPING))
+        .drop(columns="payment_type")
+        .rename(columns={"payment_value": "Total Revenue"})
+    )
@@ -0,0 +1,302 @@
+"""Compute the dashboard metrics without the UI, as JSON from a CLI or HTTP.
+
+Usage:
+    python dashboard/analytics.py report --start 2017-01-01 --end 2017-12-31 -n 5
+    python dashboard/analytics.py report --state SP --payment-type boleto
+    python dashboard/analytics.py batch --ranges ranges.csv --output reports.json
+    python dashboard/analytics.py serve --port 8000
+
+``report`` prints the metrics of one date range. ``batch`` loads the data
+once and reports every range of a CSV with ``start`` and ``end`` columns
+(by default every purchase month). ``serve`` answers
+``GET /metrics?start=...&end=...&n=...&approximate=1`` on localhost; the
+filters are repeatable parameters, e.g. ``&state=SP&state=RJ``.
+
+The reports match the dashboard's pandas backend. This module imports
+neither Streamlit nor matplotlib, so other tools can reuse it.
+"""
+
+import argparse
+import json
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pandas as pd
+
+from data_loader import SORT_COLUMN
+from filters import FILTER_COLUMNS, FILTER_OPTIONS, build_filter_index, filter_star
+from rfm import CUSTOMER_SEGMENTS, calculate_rfm_star, customer_totals, rfm_from_totals
+from star import (
+    approx_star_top_n,
+    build_star_rollup,
+    compute_star_top_n,
+    load_star_schema,
+    query_star_rollup,
+    slice_star,
+    star_key_hashes,
+)
+
+
+def open_dataset(path, shared=False):
+    """Load ``path`` once with the rollups and totals every report reuses."""
+    model = load_star_schema(path, shared=shared)
+    customers, totals = customer_totals(model)
+    return {
+        "model": model,
+        "rollup": build_star_rollup(model),
+        "customers": customers,
+        "totals": totals,
+        # Built on the first approximate and the first filtered report
+        "key_hashes": None,
+        "filter_index": None,
+    }
+
+
+def date_bounds(dataset):
+    """First and last purchase date of the dataset, or None for both."""
+    times = dataset["model"]["orders"][SORT_COLUMN].dropna()
+    if times.empty:
+        return None, None
+    return times.iloc[0].date(), times.iloc[-1].date()
+
+
+def _filters(selections):
+    # The selections that filter anything, in a stable order
+    return {
+        column: list(labels)
+        for column, labels in sorted((selections or {}).items())
+        if len(labels)
+    }
+
+
+def select_rows(dataset, start_date, end_date, selections=None):
+    """The star-schema rows of a date range passing the selected filters.
+
+    ``selections`` maps filter columns to the labels to keep; the filter
+    index is built on the first filtered call unless the dataset has one.
+    """
+    if not _filters(selections):
+        return slice_star(dataset["model"], start_date, end_date)
+    if dataset.get("filter_index") is None:
+        dataset["filter_index"] = build_filter_index(dataset["model"])
+    return filter_star(
+        dataset["model"], dataset["filter_index"], start_date, end_date, selections
+    )
+
+
+def report_panels(
+    dataset, filtered, start_date, end_date, n=5, approximate=False, selections=None
+):
+    """Top-``n`` panels of the rows ``select_rows`` returned."""
+    if _filters(selections):
+        # The rollups are per day only, so filtered panels read the rows
+        return compute_star_top_n(filtered, n)
+    if approximate:
+        if dataset.get("key_hashes") is None:
+            dataset["key_hashes"] = star_key_hashes(dataset["model"])
+        return approx_star_top_n(
+            dataset["model"],
+            dataset["key_hashes"],
+            dataset["rollup"],
+            start_date,
+            end_date,
+            n,
+        )
+    return query_star_rollup(dataset["rollup"], start_date, end_date, n=n)
+
+
+def report_rfm(
+    dataset, filtered, start_date, end_date, approximate=False, selections=None
+):
+    """RFM table of the rows ``select_rows`` returned."""
+    first, last = date_bounds(dataset)
+    if not _filters(selections) and start_date <= first and end_date >= last:
+        # The per-customer totals already cover every order
+        return rfm_from_totals(dataset["customers"], dataset["totals"], approximate)
+    return calculate_rfm_star(filtered, approximate)
+
+
+def compute_report(
+    dataset, start_date=None, end_date=None, n=5, approximate=False, selections=None
+):
+    """Order count, top-``n`` panels and RFM table of a date range.
+
+    Missing dates default to the first and last purchase date.
+    ``selections`` maps filter columns (see filters.py) to the labels to
+    keep, e.g. ``{"customer_state": ["SP", "RJ"]}``.
+    """
+    if n < 1:
+        raise ValueError("n must be at least 1")
+    first, last = date_bounds(dataset)
+    start = pd.Timestamp(start_date).date() if start_date else first
+    end = pd.Timestamp(end_date).date() if end_date else last
+    if start is None or end is None:
+        raise ValueError("the dataset has no dated orders")
+    unknown = set(_filters(selections)) - set(FILTER_OPTIONS)
+    if unknown:
+        raise ValueError(f"unknown filter columns: {', '.join(sorted(unknown))}")
+
+    filtered = select_rows(dataset, start, end, selections)
+    return {
+        "start": start,
+        "end": end,
+        "n": n,
+        "approximate": approximate,
+        "filters": _filters(selections),
+        "orders": len(filtered["orders"]),
+        "panels": report_panels(
+            dataset, filtered, start, end, n, approximate, selections
+        ),
+        "rfm": report_rfm(dataset, filtered, start, end, approximate, selections),
+    }
+
+
+def report_json(report):
+    """JSON-ready form of a report: panel rows and an RFM summary."""
+    rfm = report["rfm"]
+    segments = rfm["Customer_Segment"].value_counts()
+    return {
+        "start": report["start"].isoformat(),
+        "end": report["end"].isoformat(),
+        "n": report["n"],
+        "approximate": report["approximate"],
+        "filters": report["filters"],
+        "orders": report["orders"],
+        "panels": {
+            name: json.loads(panel.to_json(orient="records"))
+            for name, panel in report["panels"].items()
+        },
+        "rfm": {
+            "customers": len(rfm),
+            "segments": {
+                segment: int(segments.get(segment, 0)) for segment in CUSTOMER_SEGMENTS
+            },
+            "medians": {
+                column: float(rfm[column].median()) if len(rfm) else None
+                for column in ["Recency", "Frequency", "Monetary"]
+            },
+        },
+    }
+
+
+def month_ranges(dataset):
+    """(first day, last day) of every month from the first to the last purchase."""
+    first, last = date_bounds(dataset)
+    if first is None:
+        return []
+    months = pd.period_range(first, last, freq="M")
+    return list(zip(months.start_time.date, months.end_time.date))
+
+
+def batch_reports(dataset, ranges, n=5, approximate=False, selections=None):
+    """JSON reports of many date ranges over one loaded dataset."""
+    return [
+        report_json(compute_report(dataset, start, end, n, approximate, selections))
+        for start, end in ranges
+    ]
+
+
+def make_server(dataset, host="127.0.0.1", port=8000):
+    """HTTP server answering ``GET /metrics`` with a JSON report."""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlsplit(self.path)
+            if url.path != "/metrics":
+                self.send_error(404)
+                return
+            params = parse_qs(url.query)
+            query = {key: values[-1] for key, values in params.items()}
+            selections = {
+                column: params.get(name, []) for column, name in FILTER_OPTIONS.items()
+            }
+            try:
+                report = compute_report(
+                    dataset,
+                    query.get("start"),
+                    query.get("end"),
+                    int(query.get("n", 5)),
+                    query.get("approximate") == "1",
+                    selections,
+                )
+            except ValueError as e:
+                self.send_error(400, str(e))
+                return
+            body = json.dumps(report_json(report)).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return ThreadingHTTPServer((host, port), MetricsHandler)
+
+
+def main(argv=None):
+    # Options shared by every command
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--data", default="dashboard/main_data.csv")
+    common.add_argument("-n", type=int, default=5)
+    common.add_argument("--approximate", action="store_true")
+    # One repeatable option per filter column, e.g. --state SP --state RJ
+    for column, name in FILTER_OPTIONS.items():
+        common.add_argument(
+            f"--{name}",
+            dest=column,
+            action="append",
+            default=[],
+            help=f"keep only this {FILTER_COLUMNS[column][1].lower()}",
+        )
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    report = commands.add_parser(
+        "report", parents=[common], help="metrics of one date range"
+    )
+    report.add_argument("--start", help="first purchase date (default: earliest)")
+    report.add_argument("--end", help="last purchase date (default: latest)")
+
+    batch = commands.add_parser(
+        "batch", parents=[common], help="metrics of many date ranges"
+    )
+    batch.add_argument("--ranges", help="CSV with start and end columns")
+    batch.add_argument("--output", help="JSON file (default: stdout)")
+
+    serve = commands.add_parser(
+        "serve", parents=[common], help="serve metrics over HTTP"
+    )
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args(argv)
+
+    dataset = open_dataset(args.data)
+    selections = {column: getattr(args, column) for column in FILTER_OPTIONS}
+    if args.command == "report":
+        result = report_json(
+            compute_report(
+                dataset, args.start, args.end, args.n, args.approximate, selections
+            )
+        )
+    elif args.command == "batch":
+        if args.ranges:
+            ranges = pd.read_csv(args.ranges)[["start", "end"]].itertuples(index=False)
+        else:
+            ranges = month_ranges(dataset)
+        result = batch_reports(dataset, ranges, args.n, args.approximate, selections)
+    else:
+        server = make_server(dataset, args.host, args.port)
+        print(f"Serving metrics on http://{args.host}:{args.port}/metrics")
+        server.serve_forever()
+        return
+
+    if args.command == "batch" and args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    else:
+        json.dump(result, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
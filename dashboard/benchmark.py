@@ -0,0 +1,278 @@
+"""Time the dashboard's compute functions on synthetic data.
+
+Usage:
+    python dashboard/benchmark.py --sizes 100000 1000000 --output bench.json
+    python dashboard/benchmark.py --compare bench.json --output bench-new.json
+    python dashboard/benchmark.py --startup --sizes 100000 --output startup.json
+
+Results are written as JSON so runs from different commits can be compared.
+Everything runs offline on generated data.
+
+``--startup`` times whole dashboard starts instead: every run is a fresh
+interpreter that imports the app (the wait before anything is painted)
+and then renders it once with Streamlit's AppTest. Starts are measured
+with no cache, with the cached tables only, and with a snapshot.py record.
+"""
+
+import argparse
+import json
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import UTC, datetime
+from pathlib import Path
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+import dashboard
+from aggregations import (
+    compute_top_n,
+    get_payment_counts,
+    get_payment_revenue,
+    get_top_categories_by_orders,
+    get_top_categories_by_revenue,
+    get_top_cities,
+    get_top_states,
+)
+from chart_cache import cached_chart
+from data_loader import (
+    apply_dtypes,
+    encode_ids,
+    preprocess_dataframe,
+    slice_date_range,
+    sort_by_timestamp,
+)
+from rfm import calculate_rfm, calculate_rfm_star
+from rollup import build_daily_rollup, query_rollup
+from star import build_star_schema, slice_star
+from synthetic import generate_main_data
+
+DEFAULT_SIZES = [100_000, 1_000_000, 10_000_000]
+
+# Run by every startup sample, from a folder holding a copy of the app
+STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, "dashboard")
+import dashboard
+imported = time.perf_counter()
+plotting = "matplotlib" in sys.modules
+from streamlit.testing.v1 import AppTest
+ready = time.perf_counter()
+at = AppTest.from_file("dashboard/dashboard.py", default_timeout=3600).run()
+print(json.dumps({
+    "import": imported - start,
+    "first_run": time.perf_counter() - ready,
+    "plotting_at_import": plotting,
+    "errors": [str(e.value) for e in at.exception],
+}))
+"""
+
+
+def _render(data, x, y):
+    fig = dashboard.create_bar_plot(data, x, y, "Benchmark")
+    fig.canvas.draw()
+    plt.close(fig)
+
+
+def benchmark_cases(raw):
+    """Return (name, callable) pairs for one generated dataset."""
+    df = sort_by_timestamp(encode_ids(preprocess_dataframe(apply_dtypes(raw.copy()))))
+    dates = df["order_purchase_timestamp"]
+    start = (dates.min() + (dates.max() - dates.min()) / 4).date()
+    end = (dates.max() - (dates.max() - dates.min()) / 4).date()
+    filtered = slice_date_range(df, start, end)
+    model = build_star_schema(df)
+    rollup = build_daily_rollup(df)
+    top_cities = get_top_cities(filtered)
+
+    return [
+        ("preprocess_dataframe", lambda: preprocess_dataframe(raw.copy())),
+        (
+            "date_filter_mask",
+            lambda: df.loc[dates.dt.date.between(start, end)],
+        ),
+        ("date_filter_slice", lambda: slice_date_range(df, start, end)),
+        ("get_top_cities", lambda: get_top_cities(filtered)),
+        ("get_top_states", lambda: get_top_states(filtered)),
+        (
+            "get_top_categories_by_orders",
+            lambda: get_top_categories_by_orders(filtered),
+        ),
+        (
+            "get_top_categories_by_revenue",
+            lambda: get_top_categories_by_revenue(filtered),
+        ),
+        ("get_payment_counts", lambda: get_payment_counts(filtered)),
+        ("get_payment_revenue", lambda: get_payment_revenue(filtered)),
+        ("compute_top_n", lambda: compute_top_n(filtered)),
+        ("query_rollup", lambda: query_rollup(rollup, start, end)),
+        ("calculate_rfm", lambda: calculate_rfm(filtered)),
+        (
+            "calculate_rfm_star",
+            lambda: calculate_rfm_star(slice_star(model, start, end)),
+        ),
+        (
+            "create_bar_plot",
+            lambda: _render(top_cities, "Number of Customers", "City"),
+        ),
+        (
+            "cached_chart",
+            lambda: cached_chart(
+                dashboard.create_bar_plot,
+                top_cities,
+                "Number of Customers",
+                "City",
+                "Benchmark",
+            ),
+        ),
+    ]
+
+
+def _start_app(folder):
+    done = subprocess.run(
+        [sys.executable, "-c", STARTUP_SCRIPT],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=folder,
+    )
+    sample = json.loads(done.stdout.splitlines()[-1])
+    if sample["errors"]:
+        raise RuntimeError(f"dashboard failed to start: {sample['errors']}")
+    return sample
+
+
+def startup_cases(raw, repeat):
+    """Yield (name, wall times) of cold starts of the app on ``raw``."""
+    with tempfile.TemporaryDirectory() as folder:
+        app = Path(folder) / "dashboard"
+        shutil.copytree(
+            Path(__file__).parent,
+            app,
+            ignore=shutil.ignore_patterns(".cache", "__pycache__", "main_data*"),
+        )
+        raw.to_csv(app / "main_data.csv", index=False)
+
+        for case in ["no_cache", "cached_tables", "snapshot"]:
+            if case == "snapshot":
+                subprocess.run(
+                    [sys.executable, "dashboard/snapshot.py"],
+                    capture_output=True,
+                    check=True,
+                    cwd=folder,
+                )
+            samples = []
+            for _ in range(repeat):
+                if case == "no_cache":
+                    shutil.rmtree(app / ".cache", ignore_errors=True)
+                samples.append(_start_app(folder))
+            for stage in ["import", "first_run"]:
+                yield f"startup_{case}_{stage}", [sample[stage] for sample in samples]
+
+
+def time_call(func, repeat):
+    """Return the wall times in seconds of ``repeat`` calls."""
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        runs.append(time.perf_counter() - start)
+    return runs
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _timed_cases(raw, repeat, startup):
+    if startup:
+        yield from startup_cases(raw, repeat)
+        return
+    for name, func in benchmark_cases(raw):
+        yield name, time_call(func, repeat)
+
+
+def run_benchmarks(sizes, repeat=3, seed=0, startup=False):
+    """Run every case on every size and return the JSON-ready results."""
+    plt.switch_backend("Agg")  # Render off-screen, no display needed
+    results = []
+    for size in sizes:
+        raw = generate_main_data(size, seed)
+        for name, runs in _timed_cases(raw, repeat, startup):
+            results.append(
+                {
+                    "size": size,
+                    "name": name,
+                    "best_s": min(runs),
+                    "mean_s": float(np.mean(runs)),
+                    "runs_s": runs,
+                }
+            )
+            print(f"{size:>10}  {name:<32}{min(runs):>10.4f}s")
+    return {
+        "meta": {
+            "commit": _commit(),
+            "created": datetime.now(UTC).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "repeat": repeat,
+            "seed": seed,
+            "startup": startup,
+        },
+        "results": results,
+    }
+
+
+def compare(baseline, current):
+    """Return one line per case with the best-time ratio against a baseline."""
+    before = {(r["size"], r["name"]): r["best_s"] for r in baseline["results"]}
+    lines = []
+    for r in current["results"]:
+        key = (r["size"], r["name"])
+        if key in before and before[key] > 0:
+            ratio = r["best_s"] / before[key]
+            lines.append(f"{r['size']:>10}  {r['name']:<32}{ratio:>8.2f}x")
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument("--compare", help="earlier results JSON to compare against")
+    parser.add_argument(
+        "--startup", action="store_true", help="time cold dashboard starts instead"
+    )
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.sizes, args.repeat, args.seed, args.startup)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print("\n".join(compare(baseline, report)))
+
+
+if __name__ == "__main__":
+    main()
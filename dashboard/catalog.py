@@ -0,0 +1,181 @@
+"""Seller and product panels from the catalog files in ``data/``.
+
+The item rows built by pipeline.py carry their ``seller_id`` and
+``product_id``. Each catalog is joined once per loaded model to the codes
+of those ID columns, leaving arrays indexed by the code: the seller's
+state and city, and the product's weight and size bucket. A rerun gathers
+and ``bincount``s the codes of its (date-sliced, filtered) item rows, so
+the panels follow the time span and the sidebar filters.
+
+Sources without the ID columns (the notebook's main_data.csv) have no
+catalog panels.
+"""
+
+from functools import partial
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from aggregations import distinct_counts, format_panel
+from mappings import CITY_MAPPING, STATE_MAPPING, map_labels
+
+SELLERS_FILE = "sellers_dataset.csv"
+PRODUCTS_FILE = "products_dataset.csv"
+
+# Item columns the catalogs are joined on
+CATALOG_KEYS = ["seller_id", "product_id"]
+
+# Attribute -> (bin edges, bucket labels); bins include their lower edge
+PRODUCT_BUCKETS = {
+    "weight": (
+        [0, 250, 1000, 5000, 15000, np.inf],
+        ["< 250 g", "250 g - 1 kg", "1 - 5 kg", "5 - 15 kg", ">= 15 kg"],
+    ),
+    "size": (
+        [0, 1000, 5000, 20000, 60000, np.inf],
+        ["< 1 L", "1 - 5 L", "5 - 20 L", "20 - 60 L", ">= 60 L"],
+    ),
+}
+
+# Seller location -> (label column, labeler)
+SELLER_LOCATIONS = {
+    "seller_state": ("State", partial(map_labels, mapping=STATE_MAPPING)),
+    "seller_city": ("City", partial(map_labels, mapping=CITY_MAPPING, lowercase=True)),
+}
+
+
+def catalog_mtimes(folder):
+    """Modification times of the catalog files, or None if one is missing."""
+    paths = [Path(folder) / name for name in [SELLERS_FILE, PRODUCTS_FILE]]
+    if not all(path.exists() for path in paths):
+        return None
+    return tuple(path.stat().st_mtime_ns for path in paths)
+
+
+def read_catalog(folder):
+    """Every seller's location and every product's attribute buckets."""
+    folder = Path(folder)
+    sellers = pd.read_csv(
+        folder / SELLERS_FILE,
+        usecols=["seller_id", "seller_city", "seller_state"],
+        dtype="string",
+    )
+    sellers["seller_city"] = sellers["seller_city"].str.lower()
+    products = pd.read_csv(
+        folder / PRODUCTS_FILE,
+        usecols=[
+            "product_id",
+            "product_weight_g",
+            "product_length_cm",
+            "product_height_cm",
+            "product_width_cm",
+        ],
+        dtype={"product_id": "string"},
+    )
+
+    attributes = {
+        "weight": products["product_weight_g"],
+        "size": products["product_length_cm"]
+        * products["product_height_cm"]
+        * products["product_width_cm"],
+    }
+    buckets = {
+        name: pd.cut(values, edges, right=False, labels=labels).cat.codes.to_numpy()
+        for (name, values), (edges, labels) in zip(
+            attributes.items(), PRODUCT_BUCKETS.values()
+        )
+    }
+    return {
+        "sellers": sellers.drop_duplicates("seller_id"),
+        "products": pd.DataFrame(
+            {"product_id": products["product_id"], **buckets}
+        ).drop_duplicates("product_id"),
+    }
+
+
+def _lookup(categories, ids, values):
+    # Value per category code of an ID column; IDs missing from the catalog
+    # get -1
+    positions = pd.Index(ids).get_indexer(categories)
+    return np.where(positions >= 0, np.asarray(values)[positions], -1)
+
+
+def build_catalog_index(model, catalog):
+    """Join the catalogs to the seller and product codes of the model once.
+
+    Returns None when the item rows carry no seller or product IDs.
+    Otherwise returns, per seller location, the location code of every
+    seller code and the location labels, and per product attribute the
+    bucket code of every product code.
+    """
+    items = model["items"]
+    if not all(column in items.columns for column in CATALOG_KEYS):
+        return None
+
+    sellers = catalog["sellers"]
+    seller_ids = items["seller_id"].cat.categories
+    locations = {}
+    for column in SELLER_LOCATIONS:
+        codes, labels = pd.factorize(sellers[column], sort=True)
+        locations[column] = (_lookup(seller_ids, sellers["seller_id"], codes), labels)
+
+    products = catalog["products"]
+    product_ids = items["product_id"].cat.categories
+    return {
+        "n_sellers": len(seller_ids),
+        "locations": locations,
+        "buckets": {
+            name: _lookup(product_ids, products["product_id"], products[name])
+            for name in PRODUCT_BUCKETS
+        },
+    }
+
+
+def query_catalog(index, model, n=5):
+    """Seller and product-attribute panels of the (sliced) star-schema tables."""
+    items = model["items"]
+    sellers = items["seller_id"].cat.codes.to_numpy(dtype="int64")
+    products = items["product_id"].cat.codes.to_numpy(dtype="int64")
+    prices = np.nan_to_num(items["price"].to_numpy(dtype="float64"))
+
+    panels = {}
+    for column, (label, labeler) in SELLER_LOCATIONS.items():
+        location_of, labels = index["locations"][column]
+        locations = np.where(sellers >= 0, location_of[sellers], -1)
+        valid = locations >= 0
+        # Sellers with at least one sale, and their revenue, per location
+        values = {
+            "active": distinct_counts(
+                locations, sellers, len(labels), index["n_sellers"]
+            ),
+            "revenue": np.bincount(
+                locations[valid], weights=prices[valid], minlength=len(labels)
+            ),
+        }
+        observed = np.bincount(locations[valid], minlength=len(labels)) > 0
+        for metric, value_name in [
+            ("active", "Number of Sellers"),
+            ("revenue", "Total Revenue"),
+        ]:
+            series = pd.Series(
+                values[metric][observed],
+                index=pd.Index(np.asarray(labels)[observed], name=column),
+                name=metric,
+            )
+            panels[f"{column}_{metric}"] = format_panel(
+                series.nlargest(n), label, value_name, labeler
+            )
+
+    for name, (_, bucket_labels) in PRODUCT_BUCKETS.items():
+        buckets = np.where(products >= 0, index["buckets"][name][products], -1)
+        valid = buckets >= 0
+        panels[f"{name}_revenue"] = pd.DataFrame(
+            {
+                name.title(): bucket_labels,
+                "Total Revenue": np.bincount(
+                    buckets[valid], weights=prices[valid], minlength=len(bucket_labels)
+                ),
+            }
+        )
+    return panels
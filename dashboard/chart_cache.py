@@ -0,0 +1,85 @@
+import hashlib
+import io
+import os
+import threading
+
+import pandas as pd
+from cachetools import LRUCache
+
+# Memory budget of the rendered-chart cache in MiB
+MAX_MB_ENV = "DASHBOARD_CHART_CACHE_MB"
+DEFAULT_MAX_MB = 64
+
+# Same output st.pyplot produces for a figure
+SAVEFIG_OPTIONS = {"format": "png", "dpi": 200, "bbox_inches": "tight"}
+
+_lock = threading.Lock()
+_cache = LRUCache(
+    maxsize=int(float(os.environ.get(MAX_MB_ENV, DEFAULT_MAX_MB)) * 2**20),
+    getsizeof=len,
+)
+
+
+def _update_digest(digest, value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        digest.update(repr(type(value).__name__).encode())
+        if isinstance(value, pd.DataFrame):
+            digest.update(repr(list(value.columns)).encode())
+            digest.update(repr(list(value.dtypes.astype(str))).encode())
+        else:
+            digest.update(repr((value.name, str(value.dtype))).encode())
+        hashes = pd.util.hash_pandas_object(value, index=True)
+        digest.update(hashes.to_numpy().tobytes())
+    else:
+        digest.update(repr(value).encode())
+
+
+def chart_key(make_figure, args, kwargs):
+    """Content hash of the plotted data, the plot function and its parameters."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{make_figure.__module__}.{make_figure.__qualname__}".encode())
+    for value in args:
+        _update_digest(digest, value)
+    for name in sorted(kwargs):
+        digest.update(name.encode())
+        _update_digest(digest, kwargs[name])
+    return digest.hexdigest()
+
+
+def render_png(fig):
+    """Render a figure to PNG bytes and close it."""
+    import matplotlib.pyplot as plt
+
+    image = io.BytesIO()
+    try:
+        fig.savefig(image, **SAVEFIG_OPTIONS)
+    finally:
+        plt.close(fig)
+    return image.getvalue()
+
+
+def cached_chart(make_figure, *args, **kwargs):
+    """Return the PNG of ``make_figure(*args, **kwargs)``, drawing it only once.
+
+    Images are shared by all sessions and evicted least recently used first
+    once the cache holds more than its memory budget.
+    """
+    key = chart_key(make_figure, args, kwargs)
+    with _lock:
+        image = _cache.get(key)
+    if image is None:
+        image = render_png(make_figure(*args, **kwargs))
+        with _lock:
+            if len(image) <= _cache.maxsize:
+                _cache[key] = image
+    return image
+
+
+def cache_info():
+    """Number of cached images, bytes held and the byte budget."""
+    with _lock:
+        return {
+            "charts": len(_cache),
+            "bytes": _cache.currsize,
+            "max_bytes": _cache.maxsize,
+        }
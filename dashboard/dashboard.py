@@ -1,427 +1,321 @@
+import os
+from functools import partial
 from pathlib import Path
 
-import matplotlib.pyplot as plt
 import pandas as pd
-import seaborn as sns
 import streamlit as st
 
-# Data mappings
-CITY_MAPPING = {
-    "sao paulo": "São Paulo",
-    "rio de janeiro": "Rio de Janeiro",
-    "belo horizonte": "Belo Horizonte",
-    "brasilia": "Brasília",
-    "curitiba": "Curitiba",
-}
-
-STATE_MAPPING = {
-    "AC": "Acre",
-    "AL": "Alagoas",
-    "AP": "Amapá",
-    "AM": "Amazonas",
-    "BA": "Bahia",
-    "CE": "Ceará",
-    "DF": "Distrito Federal",
-    "ES": "Espírito Santo",
-    "GO": "Goiás",
-    "MA": "Maranhão",
-    "MT": "Mato Grosso",
-    "MS": "Mato Grosso do Sul",
-    "MG": "Minas Gerais",
-    "PA": "Pará",
-    "PB": "Paraíba",
-    "PR": "Paraná",
-    "PE": "Pernambuco",
-    "PI": "Piauí",
-    "RJ": "Rio de Janeiro",
-    "RN": "Rio Grande do Norte",
-    "RS": "Rio Grande do Sul",
-    "RO": "Rondônia",
-    "RR": "Roraima",
-    "SC": "Santa Catarina",
-    "SP": "São Paulo",
-    "SE": "Sergipe",
-    "TO": "Tocantins",
-}
-
-# Merged duplicate categories
-CATEGORY_MAPPING = {
-    "office_furniture": "Office Furniture",
-    "housewares": "Housewares",
-    "home_confort": "Home Comfort",
-    "home_comfort_2": "Home Comfort",
-    "sports_leisure": "Sports & Leisure",
-    "computers_accessories": "Computers & Accessories",
-    "toys": "Toys",
-    "furniture_decor": "Furniture & Decor",
-    "auto": "Automotive",
-    "air_conditioning": "Air Conditioning",
-    "telephony": "Telephony",
-    "health_beauty": "Health & Beauty",
-    "garden_tools": "Garden Tools",
-    "pet_shop": "Pet Shop",
-    "bed_bath_table": "Bed, Bath & Table",
-    "baby": "Baby Products",
-    "watches_gifts": "Watches & Gifts",
-    "kitchen_dining_laundry_garden_furniture": "Kitchen, Dining & Garden Furniture",
-    "perfumery": "Perfumery",
-    "art": "Art",
-    "stationery": "Stationery",
-    "fashio_female_clothing": "Women's Clothing",
-    "consoles_games": "Consoles & Games",
-    "construction_tools_lights": "Construction Tools & Lights",
-    "food_drink": "Food & Drink",
-    "drinks": "Beverages",
-    "cool_stuff": "Cool Stuff",
-    "fashion_bags_accessories": "Bags & Accessories",
-    "home_construction": "Home Construction",
-    "luggage_accessories": "Luggage & Accessories",
-    "electronics": "Electronics",
-    "home_appliances": "Home Appliances",
-    "home_appliances_2": "Home Appliances",
-    "fashion_male_clothing": "Men's Clothing",
-    "small_appliances": "Small Appliances",
-    "small_appliances_home_oven_and_coffee": "Oven & Coffee Appliances",
-    "books_general_interest": "Books - General",
-    "costruction_tools_tools": "Construction Tools",
-    "signaling_and_security": "Signaling & Security",
-    "musical_instruments": "Musical Instruments",
-    "construction_tools_construction": "Construction Equipment",
-    "music": "Music",
-    "fashion_shoes": "Shoes",
-    "industry_commerce_and_business": "Industry & Commerce",
-    "fashion_underwear_beach": "Underwear & Beachwear",
-    "dvds_blu_ray": "DVDs & Blu-ray",
-    "construction_tools_safety": "Construction Safety",
-    "food": "Food",
-    "fixed_telephony": "Fixed Telephony",
-    "furniture_living_room": "Living Room Furniture",
-    "tablets_printing_image": "Tablets & Printing",
-    "market_place": "Marketplace",
-    "christmas_supplies": "Christmas Supplies",
-    "agro_industry_and_commerce": "Agro Industry & Commerce",
-    "costruction_tools_garden": "Garden Construction Tools",
-    "computers": "Computers",
-    "furniture_bedroom": "Bedroom Furniture",
-    "audio": "Audio",
-    "books_imported": "Imported Books",
-    "books_technical": "Technical Books",
-    "party_supplies": "Party Supplies",
-    "furniture_mattress_and_upholstery": "Mattresses & Upholstery",
-    "la_cuisine": "La Cuisine",
-    "flowers": "Flowers",
-    "diapers_and_hygiene": "Diapers & Hygiene",
-    "cine_photo": "Cinema & Photography",
-    "cds_dvds_musicals": "CDs, DVDs & Musicals",
-    "fashion_sport": "Sportswear",
-    "arts_and_craftmanship": "Arts & Craftsmanship",
-    "fashion_childrens_clothes": "Children's Clothing",
-    "security_and_services": "Security & Services",
-}
-
-PAYMENT_MAPPING = {
-    "credit_card": "Credit Card",
-    "boleto": "Boleto",
-    "voucher": "Voucher",
-    "debit_card": "Debit Card",
-    "not_defined": "Not Defined",
-}
-
-
-def get_top_cities(df, n=5):
-    if df.empty:
-        return pd.DataFrame(columns=["City", "Number of Customers"])
-
-    return (
-        df.groupby("customer_city")["customer_unique_id"]
-        .nunique()
-        .nlargest(n)
-        .reset_index()
-        .assign(
-            City=lambda x: x["customer_city"]
-            .str.lower()
-            .map(CITY_MAPPING)
-            .fillna(x["customer_city"])
-        )
-        .drop(columns="customer_city")
-        .rename(columns={"customer_unique_id": "Number of Customers"})
-    )
+import duckdb_backend
+import export
+import refresh
+import result_cache
+import rfm_history
+import rfm_state
+import snapshot
+import streaming
+from analytics import compute_report, report_panels, report_rfm, select_rows
+from catalog import build_catalog_index, catalog_mtimes, query_catalog, read_catalog
+from chart_cache import cache_info, cached_chart
+from data_loader import id_memory_usage, source_fingerprint
+from filters import FILTER_COLUMNS, build_filter_index
+from instrumentation import (
+    RerunTrace,
+    configure_logging,
+    env_enabled,
+    start_metrics_server,
+)
+from rfm import CUSTOMER_SEGMENTS
+from sketches import HLL_BOUND, HLL_EXACT_BELOW, QUANTILE_ALPHA
+from star import (
+    build_star_rollup,
+    load_star_schema,
+    star_key_hashes,
+)
+from trends import build_trends, month_span, monthly_counts, query_trends
+
+# Query backend: "pandas" (default), "duckdb" or "streaming"
+BACKEND_ENV = "DASHBOARD_BACKEND"
+# Memory-map the loaded tables from Arrow files when set to 1
+SHARED_ENV = "DASHBOARD_SHARED_DATA"
+# Watch the source and merge rows appended to it when set to 1
+REFRESH_ENV = "DASHBOARD_REFRESH"
+# Folder the export panel writes to
+EXPORT_DIR_ENV = "DASHBOARD_EXPORT_DIR"
+DEFAULT_EXPORT_DIR = "dashboard/exports"
+# Panel size the sidebar starts with, and the one prewarmed
+DEFAULT_TOP_N = 5
+
+
+def _pyplot():
+    # Plotting libraries load when the first chart is drawn, not at startup
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    return plt, sns
 
 
-def get_top_states(df, n=5):
-    if df.empty:
-        return pd.DataFrame(columns=["State", "Number of Customers"])
+# Plotting function
+def create_bar_plot(data, x, y, title, rotate_x=False):
+    """Create bar plot visualization with consistent styling."""
+    plt, sns = _pyplot()
+    if data.empty:
+        # Return empty figure if no data
+        fig, ax = plt.subplots(figsize=(10, 6))
+        ax.text(0.5, 0.5, "No data available", ha="center", va="center")
+        ax.set(title=title)
+        return fig
+
+    fig, ax = plt.subplots(figsize=(10, 6))
+    sns.barplot(data=data, x=x, y=y, ax=ax)
+    ax.set(xlabel=None, ylabel=None, title=title)
+    if rotate_x:
+        plt.xticks(rotation=45)
+    plt.tight_layout()
+    return fig
 
-    return (
-        df.groupby("customer_state")["customer_unique_id"]
-        .nunique()
-        .nlargest(n)
-        .reset_index()
-        .assign(
-            State=lambda x: x["customer_state"]
-            .map(STATE_MAPPING)
-            .fillna(x["customer_state"])
-        )
-        .drop(columns="customer_state")
-        .rename(columns={"customer_unique_id": "Number of Customers"})
-    )
 
+def create_rfm_distribution_plot(rfm_data):
+    """Create Recency, Frequency and Monetary histograms side by side."""
+    plt, sns = _pyplot()
+    fig, axes = plt.subplots(1, 3, figsize=(18, 5))
+    for ax, col, color, title, xlabel in [
+        (
+            axes[0],
+            "Recency",
+            "blue",
+            "Recency Distribution",
+            "Days Since Last Transaction",
+        ),
+        (
+            axes[1],
+            "Frequency",
+            "green",
+            "Frequency Distribution",
+            "Number of Unique Transactions",
+        ),
+        (axes[2], "Monetary", "red", "Monetary Distribution", "Total Payment (R$)"),
+    ]:
+        sns.histplot(rfm_data[col], bins=20, kde=True, ax=ax, color=color)
+        ax.set(title=title, xlabel=xlabel)
+    plt.tight_layout()
+    return fig
 
-def get_top_categories_by_orders(df, n=5):
-    if df.empty:
-        return pd.DataFrame(columns=["Category", "Number of Orders"])
 
-    return (
-        df.groupby("product_category_name_english")["order_id"]
-        .nunique()
-        .nlargest(n)
-        .reset_index()
-        .assign(
-            Category=lambda x: x["product_category_name_english"]
-            .map(CATEGORY_MAPPING)
-            .fillna(x["product_category_name_english"])
+def create_segment_plot(rfm_data):
+    """Create the customer count per RFM segment chart."""
+    plt, sns = _pyplot()
+    segments_order = [
+        "Loyal Customer",
+        "Potential Loyalist",
+        "At Risk",
+        "Lost Customer",
+    ]
+    rfm_data = rfm_data.assign(
+        Customer_Segment=pd.Categorical(
+            rfm_data["Customer_Segment"], categories=segments_order, ordered=True
         )
-        .drop(columns="product_category_name_english")
-        .rename(columns={"order_id": "Number of Orders"})
     )
 
+    fig, ax = plt.subplots(figsize=(8, 5))
+    sns.countplot(data=rfm_data, x="Customer_Segment", order=segments_order, ax=ax)
+    for p in ax.patches:
+        ax.annotate(
+            f"{int(p.get_height())}",
+            (p.get_x() + p.get_width() / 2.0, p.get_height()),
+            ha="center",
+            va="baseline",
+            xytext=(0, 5),
+            textcoords="offset points",
+        )
+    ax.set(title="Customer Count per RFM Segment", xlabel=None, ylabel=None)
+    plt.tight_layout()
+    return fig
 
-def get_top_categories_by_revenue(df, n=5):
-    if df.empty:
-        return pd.DataFrame(columns=["Category", "Total Revenue"])
 
-    return (
-        df.groupby("product_category_name_english")["price"]
-        .sum()
-        .nlargest(n)
-        .reset_index()
-        .assign(
-            Category=lambda x: x["product_category_name_english"]
-            .map(CATEGORY_MAPPING)
-            .fillna(x["product_category_name_english"])
-        )
-        .drop(columns="product_category_name_english")
-        .rename(columns={"price": "Total Revenue"})
-    )
+def create_segment_history_plot(history):
+    """Create the month-end customer count per RFM segment chart."""
+    plt, _ = _pyplot()
+    fig, ax = plt.subplots(figsize=(10, 5))
+    for segment in CUSTOMER_SEGMENTS:
+        ax.plot(history["month"], history[segment], marker="o", label=segment)
+    ax.set(title="Customers per RFM Segment at Month End", xlabel=None, ylabel=None)
+    ax.legend()
+    plt.tight_layout()
+    return fig
 
 
-def get_payment_counts(df, n=5):
-    if df.empty:
-        return pd.DataFrame(columns=["Payment", "Count"])
+def create_trend_plot(data, y, title, hue=None):
+    """Create a monthly line chart, one line per ``hue`` value if given."""
+    plt, sns = _pyplot()
+    fig, ax = plt.subplots(figsize=(12, 6))
+    sns.lineplot(data=data, x="Month", y=y, hue=hue, marker="o", ax=ax)
+    ax.set(xlabel=None, ylabel=None, title=title)
+    plt.xticks(rotation=45)
+    plt.tight_layout()
+    return fig
 
-    return (
-        df["payment_type"]
-        .value_counts()
-        .nlargest(n)
-        .reset_index()
-        .assign(
-            Payment=lambda x: x["payment_type"]
-            .map(PAYMENT_MAPPING)
-            .fillna(x["payment_type"])
-        )
-        .drop(columns="payment_type")
-        .rename(columns={"count": "Count"})
-    )
 
+def show_chart(trace, make_figure, *args, **kwargs):
+    """Draw a chart from the shared image cache, timed as the render stage."""
+    with trace.stage("render"):
+        st.image(cached_chart(make_figure, *args, **kwargs), use_container_width=True)
 
-def get_payment_revenue(df, n=5):
-    if df.empty:
-        return pd.DataFrame(columns=["Payment", "Total Revenue"])
 
-    return (
-        df.groupby("payment_type")["payment_value"]
-        .sum()
-        .nlargest(n)
-        .reset_index()
-        .assign(
-            Payment=lambda x: x["payment_type"]
-            .map(PAYMENT_MAPPING)
-            .fillna(x["payment_type"])
-        )
-        .drop(columns="payment_type")
-        .rename(columns={"payment_value": "Total Revenue"})
-    )
+@st.cache_resource(show_spinner="Loading data...")
+def load_data(data_path, mtime_ns, digest):
+    """Load the star-schema tables once per source version, for all sessions."""
+    return load_star_schema(data_path, digest, shared=os.environ.get(SHARED_ENV) == "1")
 
 
-def calculate_rfm(df):
-    if df.empty:
-        return pd.DataFrame(
-            columns=[
-                "Recency",
-                "Frequency",
-                "Monetary",
-                "R_Score",
-                "F_Score",
-                "M_Score",
-                "RFM_Segment",
-                "RFM_Score",
-                "Customer_Segment",
-            ]
-        )
+def model_id_memory(model):
+    """Footprint of the encoded ID columns against plain Python strings."""
+    strings, encoded = zip(*(id_memory_usage(table) for table in model.values()))
+    return sum(strings), sum(encoded)
 
-    df["order_purchase_timestamp"] = pd.to_datetime(
-        df["order_purchase_timestamp"], errors="coerce"
-    )
 
-    valid_df = df.dropna(subset=["order_purchase_timestamp", "customer_unique_id"])
-
-    if valid_df.empty:
-        return pd.DataFrame(
-            columns=[
-                "Recency",
-                "Frequency",
-                "Monetary",
-                "R_Score",
-                "F_Score",
-                "M_Score",
-                "RFM_Segment",
-                "RFM_Score",
-                "Customer_Segment",
-            ]
-        )
+@st.cache_data(show_spinner=False)
+def load_id_memory(data_path, mtime_ns, digest):
+    """ID column footprint of one source version."""
+    return model_id_memory(load_data(data_path, mtime_ns, digest))
 
-    ref_date = valid_df["order_purchase_timestamp"].dt.date.max()
 
-    rfm = (
-        valid_df.groupby("customer_unique_id")
-        .agg(
-            {
-                "order_purchase_timestamp": lambda x: (ref_date - x.max().date()).days,
-                "order_id": "nunique",
-                "payment_value": "sum",
-            }
-        )
-        .rename(
-            columns={
-                "order_purchase_timestamp": "Recency",
-                "order_id": "Frequency",
-                "payment_value": "Monetary",
-            }
-        )
-    )
+@st.cache_resource(show_spinner="Loading data...")
+def load_live(data_path):
+    """Load the data once and keep it current as the source grows."""
+    return refresh.open_live(data_path, shared=os.environ.get(SHARED_ENV) == "1")
 
-    for col, labels in [
-        ("Recency", [5, 4, 3, 2, 1]),  # Higher score for lower recency
-        ("Frequency", [1, 2, 3, 4, 5]),  # Higher score for higher frequency
-        ("Monetary", [1, 2, 3, 4, 5]),  # Higher score for higher monetary value
-    ]:
-        try:
-            if col == "Recency":
-                # For recency, lower is better
-                rfm[f"{col[0]}_Score"] = pd.qcut(
-                    rfm[col], q=5, labels=labels, duplicates="drop"
-                )
-            else:
-                # For frequency and monetary, higher is better
-                # Use rank for frequency to handle potential duplicates
-                column_data = (
-                    rfm[col] if col != "Frequency" else rfm[col].rank(method="first")
-                )
 
-                # Check if we have at least 5 unique values for qcut
-                if len(column_data.unique()) >= 5:
-                    rfm[f"{col[0]}_Score"] = pd.qcut(
-                        column_data, q=5, labels=labels, duplicates="drop"
-                    )
-                else:
-                    # Use quantile-based manual binning for fewer unique values
-                    percentiles = [0, 0.2, 0.4, 0.6, 0.8, 1.0]
-                    bins = [column_data.quantile(p) for p in percentiles]
-                    # Ensure bins are unique
-                    bins = sorted(set(bins))
-                    # If still not enough bins, fall back to equal bins
-                    if len(bins) < 3:
-                        bins = [
-                            column_data.min(),
-                            column_data.median(),
-                            column_data.max(),
-                        ]
-
-                    if len(bins) >= 2:  # Need at least 2 bins
-                        rfm[f"{col[0]}_Score"] = pd.cut(
-                            column_data,
-                            bins=bins,
-                            labels=labels[: len(bins) - 1],
-                            include_lowest=True,
-                        )
-                    else:
-                        rfm[f"{col[0]}_Score"] = 3  # Neutral middle score if can't bin
-        except ValueError:
-            # Fallback to manual scoring if qcut fails
-            rfm[f"{col[0]}_Score"] = 3  # Assign neutral score as fallback
-
-    # Ensure all scores are integers for calculation
-    for score_col in ["R_Score", "F_Score", "M_Score"]:
-        if rfm[score_col].dtype != "int64":
-            rfm[score_col] = rfm[score_col].astype("int64")
-
-    rfm["RFM_Segment"] = (
-        rfm[["R_Score", "F_Score", "M_Score"]].astype(str).agg("".join, axis=1)
-    )
-    rfm["RFM_Score"] = rfm[["R_Score", "F_Score", "M_Score"]].sum(axis=1)
+@st.cache_resource(show_spinner="Building daily rollup...")
+def load_rollup(data_path, mtime_ns, digest):
+    """Build the per-day panel rollups once per source version."""
+    return build_star_rollup(load_data(data_path, mtime_ns, digest))
+
+
+@st.cache_resource(show_spinner="Hashing keys...")
+def load_key_hashes(data_path, mtime_ns, digest):
+    """Hash the distinct-count keys once per source version."""
+    return star_key_hashes(load_data(data_path, mtime_ns, digest))
+
 
-    rfm["Customer_Segment"] = pd.cut(
-        rfm["RFM_Score"],
-        bins=[-1, 5, 8, 11, float("inf")],
-        labels=["Lost Customer", "At Risk", "Potential Loyalist", "Loyal Customer"],
+@st.cache_resource(show_spinner="Indexing filters...")
+def load_filter_index(data_path, mtime_ns, digest):
+    """Build the filter bitmaps once per source version, for all sessions."""
+    return build_filter_index(load_data(data_path, mtime_ns, digest))
+
+
+@st.cache_resource(show_spinner="Building monthly trends...")
+def load_trends(data_path, mtime_ns, digest):
+    """Index first purchases and monthly totals once per source version."""
+    return build_trends(load_data(data_path, mtime_ns, digest))
+
+
+@st.cache_resource(show_spinner="Reading catalogs...")
+def load_catalog(catalog_dir, mtimes):
+    """Seller and product catalogs, read once per file version."""
+    return read_catalog(catalog_dir)
+
+
+@st.cache_resource(show_spinner="Joining catalogs...")
+def load_catalog_index(data_path, mtime_ns, digest, catalog_dir, mtimes):
+    """Join the catalogs to the seller and product codes of a source version."""
+    return build_catalog_index(
+        load_data(data_path, mtime_ns, digest), load_catalog(catalog_dir, mtimes)
     )
-    return rfm
 
 
-# Plotting function
-def create_bar_plot(data, x, y, title, rotate_x=False):
-    """Create bar plot visualization with consistent styling."""
-    if data.empty:
-        # Return empty figure if no data
-        fig, ax = plt.subplots(figsize=(10, 6))
-        ax.text(0.5, 0.5, "No data available", ha="center", va="center")
-        ax.set(title=title)
-        return fig
+@st.cache_resource(show_spinner="Updating RFM state...")
+def load_rfm_state(data_path, mtime_ns, digest):
+    """Sync the saved per-customer RFM state once per source version."""
+    return rfm_state.sync_state(data_path, digest=digest)
 
-    fig, ax = plt.subplots(figsize=(10, 6))
-    sns.barplot(data=data, x=x, y=y, ax=ax)
-    ax.set(xlabel=None, ylabel=None, title=title)
-    if rotate_x:
-        plt.xticks(rotation=45)
-    plt.tight_layout()
-    return fig
 
+@st.cache_data(show_spinner=False)
+def load_rfm_history(history_path, mtime_ns):
+    """Month-end segment counts saved by rfm_history.py."""
+    return pd.read_parquet(history_path)
 
-# Preprocess datetime columns consistently
-def preprocess_dataframe(df):
-    """Process datetime columns consistently."""
-    if df.empty:
-        return df
 
-    # Convert all timestamp columns to datetime
-    datetime_columns = [
-        "order_purchase_timestamp",
-        "order_approved_at",
-        "order_delivered_carrier_date",
-        "order_delivered_customer_date",
-        "order_estimated_delivery_date",
-    ]
+@st.cache_resource(show_spinner="Connecting to DuckDB...")
+def load_duckdb(data_path, mtime_ns, digest):
+    """Open one DuckDB view over the source per source version."""
+    return duckdb_backend.connect(data_path)
 
-    for col in datetime_columns:
-        if col in df.columns:
-            df[col] = pd.to_datetime(df[col], errors="coerce")
 
-    return df
+@st.cache_data(show_spinner="Scanning purchase dates...")
+def load_stream_bounds(data_path, mtime_ns, digest):
+    """Date bounds of the source, found in one chunked pass."""
+    return streaming.date_bounds(data_path)
 
 
-# Main app
-def main():
-    st.set_page_config(
-        page_title="E-Commerce Dashboard",
-        page_icon="📊",
-        layout="wide",
-    )
+@st.cache_data(show_spinner="Streaming data...", max_entries=8)
+def load_stream_metrics(data_path, mtime_ns, digest, start_date, end_date, n):
+    """All dashboard metrics of a date range, found in one chunked pass."""
+    return streaming.stream_metrics(data_path, start_date, end_date, n)
+
+
+def prewarm_results(version, dataset, min_date, max_date):
+    """Compute the unfiltered default view of common ranges in the background."""
+    keys = [
+        result_cache.result_key(version, start, end, {}, DEFAULT_TOP_N, False)
+        for start, end in result_cache.common_ranges(min_date, max_date)
+    ]
+
+    def compute(key):
+        _, start, end, _, n, approximate = key
+        return compute_report(dataset, start, end, n, approximate)
 
+    result_cache.prewarm(version, keys, compute)
+
+
+def render_dashboard(trace):
+    """Load, filter and aggregate the data, then draw every panel."""
     # Load data
     try:
-        data_path = Path("./dashboard/main_data.csv")
-        df = pd.read_csv(data_path)
-        df = preprocess_dataframe(df)  # Process all datetime columns consistently
+        # Prefer the month partitions written by pipeline.py over the CSV
+        data_path = Path("./dashboard/main_data")
+        if not data_path.is_dir():
+            data_path = data_path.with_suffix(".csv")
+        backend = os.environ.get(BACKEND_ENV, "pandas")
+        # Live data is merged as the source grows, instead of reloaded by version
+        live = startup = None
+        with trace.stage("load") as stage:
+            if backend == "pandas" and os.environ.get(REFRESH_ENV) == "1":
+                live = refresh.current(load_live(str(data_path)))
+            elif startup := snapshot.read_snapshot(data_path):
+                # Prebuilt by snapshot.py, so the source need not be hashed
+                fingerprint = startup["mtime_ns"], startup["digest"]
+            else:
+                fingerprint = source_fingerprint(data_path)
+            # DuckDB and streaming load only the date bounds up front
+            if backend == "duckdb":
+                con = load_duckdb(str(data_path), *fingerprint)
+                if startup:
+                    bounds = startup["bounds"]
+                else:
+                    bounds = duckdb_backend.date_bounds(con)
+            elif backend == "streaming":
+                if startup:
+                    bounds = startup["bounds"]
+                else:
+                    bounds = load_stream_bounds(str(data_path), *fingerprint)
+            else:
+                if live:
+                    model = live["model"]
+                else:
+                    model = load_data(str(data_path), *fingerprint)
+                stage["rows_out"] = sum(len(table) for table in model.values())
+                if trace.enabled:
+                    trace.memory["ID columns"] = (
+                        refresh.derived(live, "id_memory", model_id_memory)
+                        if live
+                        else load_id_memory(str(data_path), *fingerprint)
+                    )
+                if startup:
+                    bounds = startup["bounds"]
+                else:
+                    times = model["orders"]["order_purchase_timestamp"]
+                    bounds = times.min(), times.max()
+            df = pd.DataFrame({"order_purchase_timestamp": bounds})
     except FileNotFoundError:
         st.error(f"Data file not found at {data_path}. Please check the file path.")
         return
@@ -454,32 +348,187 @@ def main():
                 # Handle case when streamlit returns a tuple instead of individual dates
                 start_date, end_date = start_date
 
-            mask = df[date_column].dt.date.between(start_date, end_date)
-            filtered_df = df.loc[mask]
+            top_n = st.number_input(
+                "Top N",
+                min_value=1,
+                max_value=20,
+                value=DEFAULT_TOP_N,
+                key="top_n",
+            )
+            # Slicing by other columns uses the bitmap indexes of filters.py
+            selections = {}
+            if backend == "pandas":
+                for column, (table, label, labeler) in FILTER_COLUMNS.items():
+                    values = model[table][column].cat.categories
+                    names = dict(zip(values, labeler(pd.Series(values))))
+                    selections[column] = st.multiselect(
+                        label, list(values), format_func=names.get, key=column
+                    )
+            filtering = any(selections.values())
+
+            rows_in = len(model["orders"]) if backend == "pandas" else None
+            with trace.stage("filter", rows_in=rows_in) as stage:
+                if backend == "duckdb":
+                    n_orders = duckdb_backend.count_orders(con, start_date, end_date)
+                elif backend == "streaming":
+                    # One pass computes every metric; later stages only read it
+                    metrics = load_stream_metrics(
+                        str(data_path), *fingerprint, start_date, end_date, top_n
+                    )
+                    n_orders = metrics["orders"]
+                else:
+                    # What compute_report reads; a fresh dict per rerun, so
+                    # the indexes added below never outlive their version
+                    if live:
+                        dataset = dict(live)
+                    else:
+                        dataset = {
+                            "model": model,
+                            "rollup": load_rollup(str(data_path), *fingerprint),
+                            **load_rfm_state(str(data_path), *fingerprint),
+                        }
+                    if filtering:
+                        if live:
+                            index = refresh.derived(
+                                live, "filter_index", build_filter_index
+                            )
+                        else:
+                            index = load_filter_index(str(data_path), *fingerprint)
+                        dataset["filter_index"] = index
+                    filtered = select_rows(dataset, start_date, end_date, selections)
+                    n_orders = len(filtered["orders"])
+                stage["rows_out"] = n_orders
         else:
             st.error(f"No valid dates found in {date_column} column.")
-            filtered_df = pd.DataFrame()
-
-        st.write(f"Filtered data: {len(filtered_df)} records")
+            n_orders = 0
+
+        st.write(f"Filtered data: {n_orders} orders")
+        # Streaming is exact and has no approximate variant
+        approximate = backend != "streaming" and st.toggle(
+            "Approximate mode",
+            key="approximate",
+            help="Estimate the distinct counts of large groups with HyperLogLog "
+            "and RFM bins with a quantile sketch. Distinct counts stay exact "
+            "on the DuckDB backend and in panels sliced by state, category or "
+            "payment type.",
+        )
 
     # Check if filtered data is empty
-    if filtered_df.empty:
+    if n_orders == 0:
         st.warning(
             "No data available for the selected date range. Please adjust your filters."
         )
         return
 
+    # Panels and RFM of a view already computed, in any session, are reused
+    result = None
+    if backend == "pandas":
+        if live:
+            version = "live", live["version"]
+        else:
+            version = str(data_path), *fingerprint
+        result_cache.use_version(version)
+        prewarm_results(version, dataset, min_date, max_date)
+        result_key = result_cache.result_key(
+            version, start_date, end_date, selections, top_n, approximate
+        )
+        result = result_cache.get_result(result_key)
+
     # Data preparation
-    top_cities = get_top_cities(filtered_df)
-    top_states = get_top_states(filtered_df)
-    top_categories_orders = get_top_categories_by_orders(filtered_df)
-    top_categories_revenue = get_top_categories_by_revenue(filtered_df)
-    payment_counts = get_payment_counts(filtered_df)
-    payment_revenue = get_payment_revenue(filtered_df)
-    rfm_data = calculate_rfm(filtered_df)
+    with trace.stage("aggregate", rows_in=n_orders) as stage:
+        if backend == "duckdb":
+            panels = duckdb_backend.query_top_n(con, start_date, end_date, n=top_n)
+        elif backend == "streaming":
+            panels = metrics["panels"]
+        elif result:
+            panels = result["panels"]
+        else:
+            if approximate and not filtering:
+                if live:
+                    hashes = refresh.derived(live, "key_hashes", star_key_hashes)
+                else:
+                    hashes = load_key_hashes(str(data_path), *fingerprint)
+                dataset["key_hashes"] = hashes
+            panels = report_panels(
+                dataset, filtered, start_date, end_date, top_n, approximate, selections
+            )
+        stage["rows_out"] = sum(len(panel) for panel in panels.values())
+    top_cities = panels["top_cities"]
+    top_states = panels["top_states"]
+    top_categories_orders = panels["top_categories_orders"]
+    top_categories_revenue = panels["top_categories_revenue"]
+    payment_counts = panels["payment_counts"]
+    payment_revenue = panels["payment_revenue"]
+    with trace.stage("rfm", rows_in=n_orders) as stage:
+        if backend == "duckdb":
+            rfm_data = duckdb_backend.query_rfm(
+                con, start_date, end_date, approximate=approximate
+            )
+        elif backend == "streaming":
+            rfm_data = metrics["rfm"]
+        elif result:
+            rfm_data = result["rfm"]
+        else:
+            # Per-customer totals cover the full range; no rows are read
+            rfm_data = report_rfm(
+                dataset, filtered, start_date, end_date, approximate, selections
+            )
+        stage["rows_out"] = len(rfm_data)
+    if backend == "pandas" and not result:
+        result_cache.put_result(result_key, {"panels": panels, "rfm": rfm_data})
+    if backend == "pandas":
+        with trace.stage("trends", rows_in=n_orders) as stage:
+            if live:
+                trends = refresh.derived(live, "trends", build_trends)
+            else:
+                trends = load_trends(str(data_path), *fingerprint)
+            # Filtered data is recounted over whole months, like the monthly
+            # totals the unfiltered view reads
+            counts = None
+            if filtering:
+                months = select_rows(
+                    dataset, *month_span(start_date, end_date), selections
+                )
+                counts = monthly_counts(months, trends)
+            trend_panels = query_trends(trends, start_date, end_date, top_n, counts)
+            stage["rows_out"] = len(trend_panels["new_customers"])
+
+    # Seller and product catalogs shipped next to the notebook
+    catalog_dir = Path("./data")
+    mtimes = catalog_mtimes(catalog_dir) if backend == "pandas" else None
+    if mtimes:
+        with trace.stage("catalog", rows_in=n_orders) as stage:
+            if live:
+                catalog = load_catalog(str(catalog_dir), mtimes)
+                catalog_index = refresh.derived(
+                    live,
+                    "catalog_index",
+                    partial(build_catalog_index, catalog=catalog),
+                )
+            else:
+                catalog_index = load_catalog_index(
+                    str(data_path), *fingerprint, str(catalog_dir), mtimes
+                )
+            catalog_panels = None
+            if catalog_index is not None:
+                catalog_panels = query_catalog(catalog_index, filtered, top_n)
+                stage["rows_out"] = sum(len(panel) for panel in catalog_panels.values())
 
     # Dashboard
     st.title("E-Commerce Public Dataset :star:")
+    if approximate:
+        counts = ""
+        if backend == "pandas" and not filtering:
+            # The HyperLogLog bound is probabilistic, unlike the quantile one
+            counts = (
+                f"Customer and order counts of groups with {HLL_EXACT_BELOW:,} "
+                f"rows or more are estimates, about 95% of them within "
+                f"±{HLL_BOUND:.0%}; smaller groups are exact. "
+            )
+        st.caption(
+            f":orange-background[Approximate] {counts}RFM bin edges are within "
+            f"±{QUANTILE_ALPHA:.0%} of the exact values."
+        )
 
     # Locations
     st.header("Top Locations by Customer Count")
@@ -487,26 +536,26 @@ def main():
 
     with location_tabs[0]:
         if not top_cities.empty:
-            st.pyplot(
-                create_bar_plot(
-                    top_cities,
-                    "Number of Customers",
-                    "City",
-                    "Top 5 Cities by Customer Count",
-                )
+            show_chart(
+                trace,
+                create_bar_plot,
+                top_cities,
+                "Number of Customers",
+                "City",
+                f"Top {top_n} Cities by Customer Count",
             )
         else:
             st.info("No city data available for the selected period.")
 
     with location_tabs[1]:
         if not top_states.empty:
-            st.pyplot(
-                create_bar_plot(
-                    top_states,
-                    "Number of Customers",
-                    "State",
-                    "Top 5 States by Customer Count",
-                )
+            show_chart(
+                trace,
+                create_bar_plot,
+                top_states,
+                "Number of Customers",
+                "State",
+                f"Top {top_n} States by Customer Count",
             )
         else:
             st.info("No state data available for the selected period.")
@@ -517,26 +566,26 @@ def main():
 
     with product_tabs[0]:
         if not top_categories_orders.empty:
-            st.pyplot(
-                create_bar_plot(
-                    top_categories_orders,
-                    "Number of Orders",
-                    "Category",
-                    "Top 5 Product Categories by Orders",
-                )
+            show_chart(
+                trace,
+                create_bar_plot,
+                top_categories_orders,
+                "Number of Orders",
+                "Category",
+                f"Top {top_n} Product Categories by Orders",
             )
         else:
             st.info("No product order data available for the selected period.")
 
     with product_tabs[1]:
         if not top_categories_revenue.empty:
-            st.pyplot(
-                create_bar_plot(
-                    top_categories_revenue,
-                    "Total Revenue",
-                    "Category",
-                    "Top 5 Product Categories by Revenue",
-                )
+            show_chart(
+                trace,
+                create_bar_plot,
+                top_categories_revenue,
+                "Total Revenue",
+                "Category",
+                f"Top {top_n} Product Categories by Revenue",
             )
         else:
             st.info("No product revenue data available for the selected period.")
@@ -547,92 +596,246 @@ def main():
 
     with payment_tabs[0]:
         if not payment_counts.empty:
-            st.pyplot(
-                create_bar_plot(
-                    payment_counts,
-                    "Payment",
-                    "Count",
-                    "Top 5 Payment Methods by Usage",
-                    rotate_x=True,
-                )
+            show_chart(
+                trace,
+                create_bar_plot,
+                payment_counts,
+                "Payment",
+                "Count",
+                f"Top {top_n} Payment Methods by Usage",
+                rotate_x=True,
             )
         else:
             st.info("No payment usage data available for the selected period.")
 
     with payment_tabs[1]:
         if not payment_revenue.empty:
-            st.pyplot(
-                create_bar_plot(
-                    payment_revenue,
-                    "Payment",
-                    "Total Revenue",
-                    "Top 5 Payment Methods by Revenue",
-                    rotate_x=True,
-                )
+            show_chart(
+                trace,
+                create_bar_plot,
+                payment_revenue,
+                "Payment",
+                "Total Revenue",
+                f"Top {top_n} Payment Methods by Revenue",
+                rotate_x=True,
             )
         else:
             st.info("No payment revenue data available for the selected period.")
 
-    # RFM Analysis
-    if not rfm_data.empty:
-        st.header("RFM Distribution")
-        fig, axes = plt.subplots(1, 3, figsize=(18, 5))
-        for ax, col, color, title, xlabel in [
+    # Monthly trends
+    st.header("Monthly Trends")
+    if backend == "pandas":
+        trend_tabs = st.tabs(["New Customers", "Top Categories"])
+        with trend_tabs[0]:
+            show_chart(
+                trace,
+                create_trend_plot,
+                trend_panels["new_customers"],
+                "New Customers",
+                "New Customers per Month",
+            )
+        with trend_tabs[1]:
+            if not trend_panels["category_trends"].empty:
+                show_chart(
+                    trace,
+                    create_trend_plot,
+                    trend_panels["category_trends"],
+                    "Orders",
+                    f"Monthly Orders of the Top {top_n} Product Categories",
+                    hue="Category",
+                )
+            else:
+                st.info("No product order data available for the selected period.")
+        st.caption("Counted over whole months overlapping the selected time span.")
+    else:
+        st.info("Monthly trends are available with the pandas backend.")
+
+    # Sellers and products
+    st.header("Sellers and Product Attributes")
+    if mtimes and catalog_panels is not None:
+        seller_tabs = st.tabs(
+            [
+                "Sellers by State",
+                "Sellers by City",
+                "Revenue by Seller State",
+                "Weight",
+                "Size",
+            ]
+        )
+        for tab, name, x, y, title in [
+            (
+                seller_tabs[0],
+                "seller_state_active",
+                "Number of Sellers",
+                "State",
+                f"Top {top_n} States by Sellers with Sales",
+            ),
+            (
+                seller_tabs[1],
+                "seller_city_active",
+                "Number of Sellers",
+                "City",
+                f"Top {top_n} Cities by Sellers with Sales",
+            ),
+            (
+                seller_tabs[2],
+                "seller_state_revenue",
+                "Total Revenue",
+                "State",
+                f"Top {top_n} Seller States by Revenue",
+            ),
             (
-                axes[0],
-                "Recency",
-                "blue",
-                "Recency Distribution",
-                "Days Since Last Transaction",
+                seller_tabs[3],
+                "weight_revenue",
+                "Weight",
+                "Total Revenue",
+                "Revenue by Product Weight",
             ),
             (
-                axes[1],
-                "Frequency",
-                "green",
-                "Frequency Distribution",
-                "Number of Unique Transactions",
+                seller_tabs[4],
+                "size_revenue",
+                "Size",
+                "Total Revenue",
+                "Revenue by Product Size",
             ),
-            (axes[2], "Monetary", "red", "Monetary Distribution", "Total Payment (R$)"),
         ]:
-            sns.histplot(rfm_data[col], bins=20, kde=True, ax=ax, color=color)
-            ax.set(title=title, xlabel=xlabel)
-        plt.tight_layout()
-        st.pyplot(fig)
-
-        st.header("Customer Segments by RFM Score")
-        segments_order = [
-            "Loyal Customer",
-            "Potential Loyalist",
-            "At Risk",
-            "Lost Customer",
-        ]
-        rfm_data["Customer_Segment"] = pd.Categorical(
-            rfm_data["Customer_Segment"], categories=segments_order, ordered=True
+            with tab:
+                show_chart(trace, create_bar_plot, catalog_panels[name], x, y, title)
+        st.caption(
+            "Item prices of the selected time span and filters, by the seller "
+            "and product of each item."
+        )
+    elif mtimes:
+        st.info(
+            "The sales data carries no seller or product IDs. Rebuild it with "
+            "dashboard/pipeline.py to see the seller and product panels."
         )
+    elif backend == "pandas":
+        st.info(f"Seller and product catalogs not found in {catalog_dir}.")
+    else:
+        st.info("Seller and product panels are available with the pandas backend.")
 
-        fig, ax = plt.subplots(figsize=(8, 5))
-        sns.countplot(data=rfm_data, x="Customer_Segment", order=segments_order, ax=ax)
-        for p in ax.patches:
-            ax.annotate(
-                f"{int(p.get_height())}",
-                (p.get_x() + p.get_width() / 2.0, p.get_height()),
-                ha="center",
-                va="baseline",
-                xytext=(0, 5),
-                textcoords="offset points",
-            )
-        ax.set(title="Customer Count per RFM Segment", xlabel=None, ylabel=None)
-        plt.tight_layout()
-        st.pyplot(fig)
+    # RFM Analysis
+    if not rfm_data.empty:
+        st.header("RFM Distribution")
+        show_chart(trace, create_rfm_distribution_plot, rfm_data)
+
+        st.header("Customer Segments by RFM Score")
+        show_chart(trace, create_segment_plot, rfm_data)
     else:
         st.info("Insufficient data to perform RFM analysis for the selected period.")
 
+    # Precomputed by a batch job; live data changes too often to keep it
+    if not live:
+        st.header("Customer Segments over Time")
+        history_path = rfm_history.history_path(data_path, fingerprint[1])
+        if history_path.exists():
+            history = load_rfm_history(
+                str(history_path), history_path.stat().st_mtime_ns
+            )
+            show_chart(trace, create_segment_history_plot, history)
+        else:
+            st.info(
+                "Run `python dashboard/rfm_history.py` to compute the monthly "
+                "segment history."
+            )
+
     # Show a sample of the filtered data
     with st.expander("View Sample Data"):
-        st.dataframe(filtered_df.head(10))
+        if backend == "duckdb":
+            st.dataframe(duckdb_backend.sample_orders(con, start_date, end_date))
+        elif backend == "streaming":
+            st.dataframe(metrics["sample"])
+        else:
+            st.dataframe(filtered["orders"].head(10))
+
+    # Full tables are written to disk in batches rather than held for a download
+    with st.expander("Export Data"):
+        if backend == "pandas":
+            table = st.selectbox(
+                "Table",
+                list(export.EXPORT_TABLES),
+                format_func=export.EXPORT_TABLES.get,
+                key="export_table",
+            )
+            fmt = st.radio(
+                "Format", export.EXPORT_FORMATS, horizontal=True, key="export_format"
+            )
+            compress = st.toggle("Compress", key="export_compress")
+            if st.button("Write export"):
+                if table == "rfm":
+                    batches = export.rfm_batches(rfm_data)
+                else:
+                    batches = export.table_batches(
+                        model,
+                        table,
+                        start_date,
+                        end_date,
+                        index if filtering else None,
+                        selections,
+                    )
+                name = export.export_name(table, fmt, compress)
+                export_dir = Path(os.environ.get(EXPORT_DIR_ENV, DEFAULT_EXPORT_DIR))
+                target = export_dir / f"{start_date}_{end_date}-{name}"
+                with st.spinner("Writing export..."):
+                    size = export.write_export(
+                        export.export_chunks(batches, fmt, compress), target
+                    )
+                st.success(f"Wrote {size / 2**20:.1f} MB to {target}")
+        else:
+            st.info("Export is available with the pandas backend.")
 
     st.caption("Copyright (c) Patuh Rujhan Al Istizhar 2025")
 
 
+def show_diagnostics(trace):
+    """Show the per-stage timings and memory of this rerun in the sidebar."""
+    with st.sidebar.expander("Diagnostics", expanded=True):
+        if not trace.stages:
+            st.write("Enable diagnostics to trace the next rerun.")
+            return
+        stages = pd.DataFrame(trace.stages)
+        stages["peak_mb"] = stages.pop("peak_bytes") / 2**20
+        st.dataframe(stages, hide_index=True)
+        for label, (before, after) in trace.memory.items():
+            st.write(
+                f"{label}: {after / 2**20:.1f} MB encoded, "
+                f"{before / 2**20:.1f} MB as strings"
+            )
+        charts = cache_info()
+        st.write(
+            f"Chart cache: {charts['charts']} charts, "
+            f"{charts['bytes'] / 2**20:.1f} of {charts['max_bytes'] / 2**20:.0f} MB"
+        )
+        results = result_cache.cache_info()
+        st.write(
+            f"Result cache: {results['results']} views, "
+            f"{results['bytes'] / 2**20:.1f} of {results['max_bytes'] / 2**20:.0f} MB, "
+            f"{results['hits']} hits, {results['misses']} misses"
+        )
+
+
+# Main app
+def main():
+    st.set_page_config(
+        page_title="E-Commerce Dashboard",
+        page_icon="📊",
+        layout="wide",
+    )
+    configure_logging()
+    start_metrics_server()
+
+    diagnostics = st.session_state.get("diagnostics", False)
+    trace = RerunTrace(diagnostics or env_enabled())
+    try:
+        render_dashboard(trace)
+    finally:
+        trace.finish()
+
+    st.sidebar.toggle("Show diagnostics", key="diagnostics")
+    if diagnostics:
+        show_diagnostics(trace)
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,300 @@
+import glob
+import hashlib
+import os
+import re
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from pyarrow import feather
+
+# Converted columnar tables of the source live here, named after its content hash
+CACHE_DIR = Path(__file__).parent / ".cache"
+
+# Bump when the layout of the cached tables changes so stale copies are rebuilt
+CACHE_FORMAT_VERSION = 4
+
+# The loaded frame is kept sorted on this column so date filters can bisect it
+SORT_COLUMN = "order_purchase_timestamp"
+
+NS_PER_DAY = 86_400 * 10**9
+
+# Written by pipeline.py next to its month partitions; stands in for the
+# partition directory when fingerprinting it
+MANIFEST_NAME = "_manifest.json"
+PARTITION_COLUMN = "purchase_month"
+
+# Olist exports write every timestamp in this exact layout
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+DATETIME_COLUMNS = [
+    "order_purchase_timestamp",
+    "order_approved_at",
+    "order_delivered_carrier_date",
+    "order_delivered_customer_date",
+    "order_estimated_delivery_date",
+]
+
+# 32-character hex IDs, held as integer codes per row plus one Arrow string
+# per distinct ID, which maps the codes back
+ID_COLUMNS = ["customer_unique_id", "order_id", "product_id", "seller_id"]
+
+# Explicit dtypes so the CSV parser never has to guess
+CSV_DTYPES = {
+    "customer_unique_id": "category",
+    "customer_city": "category",
+    "customer_state": "category",
+    "order_id": "category",
+    "product_id": "category",
+    "seller_id": "category",
+    "price": "float64",
+    "product_category_name_english": "category",
+    "payment_type": "category",
+    "payment_value": "float64",
+}
+
+
+def preprocess_dataframe(df):
+    """Process datetime columns consistently."""
+    if df.empty:
+        return df
+
+    for col in DATETIME_COLUMNS:
+        if col in df.columns and not pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = pd.to_datetime(df[col], format=TIMESTAMP_FORMAT, errors="coerce")
+
+    return df
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """Return the SHA-256 hex digest of a file, read in fixed-size chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@lru_cache(maxsize=16)
+def _cached_digest(path, mtime_ns, size):
+    # mtime and size are part of the key so an edited file is hashed again
+    return file_digest(path)
+
+
+def source_fingerprint(path):
+    """Return (mtime_ns, sha256) for a source file, hashing only when it changed.
+
+    A partitioned directory written by pipeline.py is fingerprinted through
+    its manifest, which changes whenever any partition is rebuilt.
+    """
+    if Path(path).is_dir():
+        path = Path(path) / MANIFEST_NAME
+    stat = os.stat(path)
+    return stat.st_mtime_ns, _cached_digest(str(path), stat.st_mtime_ns, stat.st_size)
+
+
+def apply_dtypes(df):
+    """Cast the known columns of ``df`` to their explicit dtypes."""
+    return df.astype({k: v for k, v in CSV_DTYPES.items() if k in df.columns})
+
+
+def encode_ids(df, columns=ID_COLUMNS):
+    """Encode the ID columns of ``df`` as categories with Arrow string labels.
+
+    Grouping and counting then run on the integer codes, and each distinct
+    ID is stored once in about 36 bytes instead of a Python string per row.
+    """
+    for column in columns:
+        if column in df.columns:
+            values = df[column].astype("category")
+            labels = values.cat.categories
+            if not labels.is_monotonic_increasing:
+                # The CSV parser merges its chunks' categories unsorted; codes
+                # in ID order keep the sorted factorizations of rfm.py
+                labels = labels.sort_values()
+                values = values.cat.reorder_categories(labels)
+            if labels.dtype != "string[pyarrow]":
+                values = values.cat.rename_categories(
+                    pd.Index(labels.astype("string[pyarrow]"))
+                )
+            df[column] = values
+    return df
+
+
+def merge_labels(old, new, sort=False):
+    """Merge two label Indexes for appending.
+
+    Returns the merged Index and, for ``old`` and ``new``, the arrays
+    mapping each label position to its merged position. With ``sort`` both
+    label sets must be sorted and the merged labels are too; otherwise new
+    labels follow the old ones.
+    """
+    if sort:
+        # New labels are placed by binary search instead of hashing all labels
+        old_labels = np.asarray(old, dtype=object)
+        new_labels = np.asarray(new, dtype=object)
+        at = np.searchsorted(old_labels, new_labels)
+        found = at < len(old)
+        found[found] = old_labels[at[found]] == new_labels[found]
+        added_at = at[~found]
+        old_map = np.arange(len(old)) + np.searchsorted(
+            added_at, np.arange(len(old)), side="right"
+        )
+        new_map = np.empty(len(new), dtype="int64")
+        new_map[found] = old_map[at[found]]
+        new_map[~found] = added_at + np.arange(len(added_at))
+        labels = np.insert(old_labels, added_at, new_labels[~found])
+    else:
+        existing = old.get_indexer(new)
+        added = existing < 0
+        old_map = np.arange(len(old))
+        new_map = existing
+        new_map[added] = len(old) + np.arange(added.sum())
+        labels = old.append(new[added])
+    return pd.Index(labels, dtype=old.dtype), old_map, new_map
+
+
+def merge_categories(base, other, sort=False):
+    """Merge the categories of two categorical Series for appending.
+
+    Returns the merged CategoricalDtype and, for ``base`` and ``other``,
+    the arrays mapping each of their category codes to its merged code
+    (see ``merge_labels``).
+    """
+    labels, base_map, other_map = merge_labels(
+        base.cat.categories, other.cat.categories, sort
+    )
+    return pd.CategoricalDtype(labels), base_map, other_map
+
+
+def id_memory_usage(df, columns=ID_COLUMNS):
+    """Bytes held by the ID columns of ``df`` as Python strings and as encoded."""
+    strings = encoded = 0
+    for column in columns:
+        if column in df.columns:
+            encoded += df[column].memory_usage(deep=True, index=False)
+            strings += df[column].astype(object).memory_usage(deep=True, index=False)
+    return int(strings), int(encoded)
+
+
+def read_csv_typed(path):
+    """Read the main CSV with explicit dtypes and fixed-format timestamps."""
+    df = pd.read_csv(path, dtype=CSV_DTYPES)
+    return encode_ids(preprocess_dataframe(df))
+
+
+def read_source(path):
+    """Read the main CSV or a directory of month partitions into one frame."""
+    if not Path(path).is_dir():
+        return read_csv_typed(path)
+    df = pd.read_parquet(path)
+    df = apply_dtypes(df.drop(columns=PARTITION_COLUMN, errors="ignore"))
+    return encode_ids(df)
+
+
+def write_parquet_atomic(df, target):
+    """Write ``df`` to ``target`` so readers never see a partial file."""
+    target = Path(target)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_suffix(f".{os.getpid()}.tmp")
+    df.to_parquet(tmp, index=False)
+    os.replace(tmp, target)
+
+
+def write_feather_atomic(df, target):
+    """Write ``df`` as one uncompressed Arrow IPC batch that can be mapped."""
+    target = Path(target)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_suffix(f".{os.getpid()}.tmp")
+    table = pa.Table.from_pandas(df, preserve_index=False).combine_chunks()
+    feather.write_feather(
+        table, tmp, compression="uncompressed", chunksize=max(len(table), 1)
+    )
+    os.replace(tmp, target)
+
+
+def map_feather(path):
+    """Read a file from ``write_feather_atomic`` as a view of its mapped pages.
+
+    Numeric, timestamp and category code columns point into the mapping, so
+    processes mapping the same file share one copy through the page cache.
+    The labels of the ID columns become Arrow strings without a Python
+    object per ID.
+    """
+    table = feather.read_table(str(path), memory_map=True)
+    if not table.num_rows:
+        return encode_ids(table.to_pandas())
+    ids = [column for column in table.column_names if column in ID_COLUMNS]
+    df = table.drop_columns(ids).to_pandas(split_blocks=True)
+    for column in ids:
+        # One batch per file, so every column is a single chunk
+        array = table.column(column).chunk(0)
+        labels = pd.Index(
+            pd.arrays.ArrowStringArray(array.dictionary.cast(pa.large_string()))
+        )
+        codes = array.indices
+        if codes.null_count:
+            # Missing IDs need the -1 code, so only these columns are copied
+            codes = codes.fill_null(-1)
+        df.insert(
+            table.column_names.index(column),
+            column,
+            pd.Categorical.from_codes(
+                codes.to_numpy(), dtype=pd.CategoricalDtype(labels)
+            ),
+        )
+    return df
+
+
+def prune_cache(path, digest, cache_dir=CACHE_DIR):
+    """Delete the cached tables of ``path`` built for other digests or versions.
+
+    Cached files are named ``{stem}-{digest16}-v{version}...``. Temporary
+    files still being written are left alone. Returns the number deleted.
+    """
+    stem = Path(path).stem
+    current = f"{digest[:16]}-v{CACHE_FORMAT_VERSION}"
+    pattern = re.compile(rf"{re.escape(stem)}-([0-9a-f]{{16}}-v\d+)[-.].*")
+    deleted = 0
+    for cached in Path(cache_dir).glob(f"{glob.escape(stem)}-*-v*"):
+        match = pattern.fullmatch(cached.name)
+        if not match or match[1] == current or cached.name.endswith(".tmp"):
+            continue
+        try:
+            # Processes mapping an old table keep their pages until they let go
+            cached.unlink(missing_ok=True)
+        except OSError:
+            continue
+        deleted += 1
+    return deleted
+
+
+def sort_by_timestamp(df, column=SORT_COLUMN):
+    """Sort rows by timestamp (missing values last) with a fresh RangeIndex."""
+    if column not in df.columns:
+        return df
+    return df.sort_values(column, kind="stable", na_position="last", ignore_index=True)
+
+
+def date_range_positions(df, start_date, end_date, column=SORT_COLUMN):
+    """Positions ``(lo, hi)`` of the rows dated within [start_date, end_date].
+
+    ``df`` must be sorted on ``column`` (see ``sort_by_timestamp``); the
+    bounds are found by binary search.
+    """
+    values = df[column].to_numpy()
+    start = np.datetime64(pd.Timestamp(start_date), "ns")
+    stop = np.datetime64(pd.Timestamp(end_date) + pd.Timedelta(days=1), "ns")
+    lo, hi = values.searchsorted([start, stop], side="left")
+    return int(lo), int(hi)
+
+
+def slice_date_range(df, start_date, end_date, column=SORT_COLUMN):
+    """Return the rows whose ``column`` date lies within [start_date, end_date].
+
+    The result is a positional slice, so no per-row mask is built.
+    """
+    lo, hi = date_range_positions(df, start_date, end_date, column)
+    return df.iloc[lo:hi]
@@ -0,0 +1,318 @@
+"""Run the dashboard queries in an embedded DuckDB over the source files.
+
+DuckDB scans the CSV or the month partitions directly, pushing the date
+range down into the scan, so only the panel rows and the per-customer RFM
+table reach pandas. The first query of a date range materializes its
+orders, items and payments in one scan, into a database file of its own
+in a temporary folder, so the tables live on disk rather than in the
+dashboard process. The other queries of the rerun, and later reruns over
+the same range, read those tables. The most recently used ranges are
+kept up to ``MAX_RANGE_BYTES`` per connection.
+
+Results match the star-schema pandas path: every item and payment is
+counted once per order, not once per joined row. Like star.py, this
+relies on an order's purchase time and customer being the same on every
+one of its rows, as they are in the Olist export.
+"""
+
+import shutil
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from aggregations import TOP_N_PANELS, empty_panels, format_panel
+from data_loader import SORT_COLUMN, TIMESTAMP_FORMAT
+from rfm import build_rfm, empty_rfm
+from star import PANEL_GRAINS
+
+# Columns of the main_data view and the SQL type each one is cast to
+VIEW_COLUMNS = {
+    "customer_unique_id": "VARCHAR",
+    "customer_city": "VARCHAR",
+    "customer_state": "VARCHAR",
+    "order_id": "VARCHAR",
+    "order_purchase_timestamp": "TIMESTAMP",
+    "order_item_id": "BIGINT",
+    "price": "DOUBLE",
+    "product_category_name_english": "VARCHAR",
+    "payment_type": "VARCHAR",
+    "payment_value": "DOUBLE",
+}
+
+# Disk space of the range databases kept per connection; the most recent
+# range is kept even when it alone is larger
+MAX_RANGE_BYTES = 512 * 2**20
+
+# One table per star-schema grain, built from the date-filtered rows; only
+# the first statement scans the source
+FILTERED_ROWS = [
+    f"""
+    CREATE TABLE {{rows}} AS SELECT * FROM main_data
+    WHERE order_id IS NOT NULL AND {SORT_COLUMN} >= $start AND {SORT_COLUMN} < $stop
+    """,
+    f"""
+    CREATE TABLE {{orders}} AS
+    SELECT DISTINCT ON (order_id)
+        order_id, customer_unique_id, customer_city, customer_state, {SORT_COLUMN}
+    FROM {{rows}} ORDER BY order_id, {SORT_COLUMN}
+    """,
+    """
+    CREATE TABLE {items} AS
+    SELECT DISTINCT order_id, order_item_id, product_category_name_english, price
+    FROM {rows}
+    """,
+    """
+    CREATE TABLE {payments} AS
+    SELECT DISTINCT order_id, payment_type, payment_value FROM {rows}
+    """,
+    "DROP TABLE {rows}",
+    "CHECKPOINT {database}",
+]
+
+PANEL_SQL = {
+    "nunique": "count(DISTINCT {measure})",
+    "sum": "coalesce(sum({measure}), 0)",
+    "count": "count(*)",
+}
+
+
+# Guards the bookkeeping below only; ranges are built under their own lock
+_lock = threading.Lock()
+# connection -> {"folder", "next": database number, "building": bounds -> lock,
+# "ranges": OrderedDict of bounds -> (tables, bytes)}
+_materialized = weakref.WeakKeyDictionary()
+
+
+def _literal(path):
+    return "'" + str(path).replace("'", "''") + "'"
+
+
+def connect(path):
+    """Open an in-memory database with a ``main_data`` view over ``path``."""
+    if Path(path).is_dir():
+        # Month partitions written by pipeline.py, already typed
+        scan = f"read_parquet({_literal(Path(path) / '*' / '*.parquet')})"
+        parse_time = "CAST({} AS TIMESTAMP)"
+    else:
+        scan = f"read_csv({_literal(path)}, header = true, all_varchar = true)"
+        # Unparseable times become NULL, like errors="coerce"
+        parse_time = f"try_strptime({{}}, '{TIMESTAMP_FORMAT}')"
+
+    columns = []
+    for column, sql_type in VIEW_COLUMNS.items():
+        if sql_type == "TIMESTAMP":
+            value = parse_time.format(column)
+        else:
+            value = f"TRY_CAST({column} AS {sql_type})"
+        columns.append(f"{value} AS {column}")
+
+    # Imported here so the other backends start without loading DuckDB
+    import duckdb
+
+    con = duckdb.connect()
+    con.execute(f"CREATE VIEW main_data AS SELECT {', '.join(columns)} FROM {scan}")
+    folder = tempfile.mkdtemp(prefix="dashboard-duckdb-")
+    weakref.finalize(con, shutil.rmtree, folder, ignore_errors=True)
+    with _lock:
+        _materialized[con] = {
+            "folder": folder,
+            "next": 0,
+            "building": {},
+            "ranges": OrderedDict(),
+        }
+    return con
+
+
+def _bounds(start_date, end_date):
+    start = pd.Timestamp(start_date)
+    stop = pd.Timestamp(end_date) + pd.Timedelta(days=1)
+    return {"start": start.to_pydatetime(), "stop": stop.to_pydatetime()}
+
+
+def _cached_tables(state, key):
+    # Caller holds _lock
+    if key in state["ranges"]:
+        state["ranges"].move_to_end(key)
+        return state["ranges"][key][0]
+    return None
+
+
+def _range_tables(con, bounds):
+    # Materialize the range once; other ranges stay usable while it builds
+    key = (bounds["start"], bounds["stop"])
+    with _lock:
+        state = _materialized[con]
+        if tables := _cached_tables(state, key):
+            return tables
+        building = state["building"].setdefault(key, threading.Lock())
+
+    with building:
+        with _lock:
+            if tables := _cached_tables(state, key):
+                return tables
+            database = f"range_{state['next']}"
+            state["next"] += 1
+        path = Path(state["folder"]) / f"{database}.duckdb"
+        tables = {
+            name: f"{database}.{name}"
+            for name in ["rows", "orders", "items", "payments"]
+        }
+        cursor = con.cursor()
+        try:
+            cursor.execute(f"ATTACH {_literal(path)} AS {database}")
+            for number, statement in enumerate(FILTERED_ROWS):
+                cursor.execute(
+                    statement.format(database=database, **tables),
+                    None if number else bounds,
+                )
+            size = cursor.execute(
+                "SELECT block_size * used_blocks FROM pragma_database_size() "
+                "WHERE database_name = $database",
+                {"database": database},
+            ).fetchone()[0]
+        except Exception:
+            with _lock:
+                del state["building"][key]
+            _drop_range(cursor, state["folder"], tables)
+            raise
+
+        with _lock:
+            ranges = state["ranges"]
+            ranges[key] = (tables, size)
+            del state["building"][key]
+            evicted = []
+            while (
+                len(ranges) > 1
+                and sum(kept for _, kept in ranges.values()) > MAX_RANGE_BYTES
+            ):
+                evicted.append(ranges.popitem(last=False)[1][0])
+    for old in evicted:
+        _drop_range(cursor, state["folder"], old)
+    return tables
+
+
+def _drop_range(cursor, folder, tables):
+    # Queries still reading the range fail with CatalogException and rebuild
+    database = tables["orders"].split(".")[0]
+    cursor.execute(f"DETACH DATABASE IF EXISTS {database}")
+    for path in Path(folder).glob(f"{database}.duckdb*"):
+        path.unlink(missing_ok=True)
+
+
+def _execute(con, start_date, end_date, query, params=None):
+    # ``query`` is formatted with the table name of every grain
+    import duckdb
+
+    bounds = _bounds(start_date, end_date)
+    tables = _range_tables(con, bounds)
+    try:
+        return con.cursor().execute(query.format(**tables), params)
+    except duckdb.CatalogException:
+        # Evicted by another session between the lookup and the query
+        key = (bounds["start"], bounds["stop"])
+        with _lock:
+            ranges = _materialized[con]["ranges"]
+            if key in ranges and ranges[key][0] == tables:
+                del ranges[key]
+        _drop_range(con.cursor(), _materialized[con]["folder"], tables)
+        tables = _range_tables(con, bounds)
+        return con.cursor().execute(query.format(**tables), params)
+
+
+def date_bounds(con):
+    """Earliest and latest purchase time of orders, as Timestamps."""
+    first, last = (
+        con.cursor()
+        .execute(
+            f"SELECT min({SORT_COLUMN}), max({SORT_COLUMN}) FROM main_data "
+            "WHERE order_id IS NOT NULL"
+        )
+        .fetchone()
+    )
+    if first is None:
+        return None, None
+    return pd.Timestamp(first), pd.Timestamp(last)
+
+
+def count_orders(con, start_date, end_date):
+    """Number of distinct orders purchased within the date range."""
+    query = "SELECT count(*) FROM {orders}"
+    return _execute(con, start_date, end_date, query).fetchone()[0]
+
+
+def sample_orders(con, start_date, end_date, limit=10):
+    """The first ``limit`` orders of the date range, one row per order."""
+    query = (
+        "SELECT order_id, customer_unique_id, customer_city, customer_state, "
+        f"{SORT_COLUMN} FROM {{orders}} ORDER BY {SORT_COLUMN}, order_id LIMIT $limit"
+    )
+    return _execute(con, start_date, end_date, query, {"limit": limit}).df()
+
+
+def query_top_n(con, start_date, end_date, n=5, panels=TOP_N_PANELS):
+    """Compute the top-N panels in SQL; same frames as ``compute_star_top_n``.
+
+    Distinct counts stay exact in approximate mode: over the materialized
+    range tables ``count(DISTINCT)`` is cheaper than building HyperLogLog
+    registers in SQL.
+    """
+    results = {}
+    for name, (dim, measure, metric, label, value_name, labeler) in panels.items():
+        value = PANEL_SQL[metric].format(measure=measure)
+        # Ties keep the order of the sorted group keys, as nlargest does
+        query = (
+            f"SELECT {dim}, {value} AS value FROM {{{PANEL_GRAINS[name]}}} "
+            f"WHERE {dim} IS NOT NULL GROUP BY {dim} "
+            f"ORDER BY value DESC, {dim} LIMIT $n"
+        )
+        top = _execute(con, start_date, end_date, query, {"n": n}).df()
+        if top.empty:
+            results[name] = empty_panels({name: panels[name]})[name]
+            continue
+        series = pd.Series(
+            top["value"].to_numpy(),
+            index=pd.Index(top[dim].to_numpy(dtype=object), name=dim),
+            name=measure or "count",
+        )
+        results[name] = format_panel(series, label, value_name, labeler)
+    return results
+
+
+def query_rfm(con, start_date, end_date, approximate=False):
+    """Compute the RFM table in SQL; same table as ``calculate_rfm_star``."""
+    query = f"""
+    WITH customer_orders AS (
+        SELECT customer_unique_id, max({SORT_COLUMN}) AS last_purchase,
+            count(*) AS frequency
+        FROM {{orders}} WHERE customer_unique_id IS NOT NULL
+        GROUP BY customer_unique_id
+    ),
+    customer_payments AS (
+        SELECT orders.customer_unique_id, sum(payments.payment_value) AS monetary
+        FROM {{payments}} AS payments JOIN {{orders}} AS orders USING (order_id)
+        WHERE orders.customer_unique_id IS NOT NULL
+        GROUP BY orders.customer_unique_id
+    )
+    SELECT customer_unique_id, last_purchase, frequency,
+        coalesce(monetary, 0) AS monetary
+    FROM customer_orders LEFT JOIN customer_payments USING (customer_unique_id)
+    ORDER BY customer_unique_id
+    """
+    customers = _execute(con, start_date, end_date, query).df()
+    if customers.empty:
+        return empty_rfm()
+
+    last_ns = customers["last_purchase"].to_numpy(dtype="datetime64[ns]").view("int64")
+    return build_rfm(
+        customers["customer_unique_id"].to_numpy(dtype=object),
+        np.arange(len(customers)),
+        last_ns,
+        customers["frequency"].to_numpy(dtype="int64"),
+        customers["monetary"].to_numpy(dtype="float64"),
+        approximate,
+    )
@@ -0,0 +1,280 @@
+"""Export the RFM customer table or the filtered rows as CSV or Parquet.
+
+Usage:
+    python dashboard/export.py rfm --output rfm.csv.gz --compress
+    python dashboard/export.py orders --output orders.parquet --format parquet \\
+        --start 2018-01-01 --end 2018-06-30 --state SP --payment-type boleto
+
+Rows are encoded batch by batch through generators of bytes: a CSV chunk
+(gzip-compressed with ``--compress``) or a Parquet row group (zstd with
+``--compress``) per batch. Filtered rows are cut from the sorted tables
+and the filter bitmaps one batch at a time, so memory stays at about one
+batch whatever the size of the export. The file is written under a
+temporary name and renamed once complete.
+"""
+
+import argparse
+import io
+import os
+import zlib
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from data_loader import TIMESTAMP_FORMAT, date_range_positions
+from filters import (
+    FILTER_COLUMNS,
+    FILTER_OPTIONS,
+    build_filter_index,
+    filter_mask,
+    filter_star,
+    selection_codes,
+)
+from rfm import calculate_rfm_star, customer_totals, rfm_from_totals
+from star import load_star_schema, slice_star
+
+# Rows encoded at a time; also the Parquet row group size
+BATCH_ROWS = 100_000
+
+# Exportable table -> dashboard label
+EXPORT_TABLES = {
+    "rfm": "RFM customers",
+    "orders": "Order rows",
+    "items": "Item rows",
+    "payments": "Payment rows",
+}
+EXPORT_FORMATS = ["csv", "parquet"]
+
+
+def export_name(table, fmt, compress=False):
+    """File name of an export, with the suffix its readers expect."""
+    if fmt == "csv":
+        return f"{table}.csv.gz" if compress else f"{table}.csv"
+    return f"{table}.parquet"
+
+
+def frame_batches(frame, batch_rows=BATCH_ROWS):
+    """Consecutive row slices of a frame already in memory."""
+    # An empty frame still gives one batch, for the CSV header and schema
+    for start in range(0, max(len(frame), 1), batch_rows):
+        yield frame.iloc[start : start + batch_rows]
+
+
+def rfm_batches(rfm, batch_rows=BATCH_ROWS):
+    """Batches of an RFM table, with the customer ID as a column."""
+    for batch in frame_batches(rfm, batch_rows):
+        yield batch.reset_index()
+
+
+def table_batches(
+    model,
+    table,
+    start_date,
+    end_date,
+    index=None,
+    selections=None,
+    batch_rows=BATCH_ROWS,
+):
+    """Batches of the rows of ``table`` within the range and the filters.
+
+    ``index`` is the ``build_filter_index`` of the model, needed only when
+    ``selections`` filter anything. Items and payments are labeled with
+    their ``order_id`` instead of the internal order code.
+    """
+    frame = model[table]
+    codes = selection_codes(index, selections) if selections else {}
+    lo, hi = date_range_positions(frame, start_date, end_date)
+
+    order_ids = None
+    if table != "orders":
+        # Order code -> position in the orders table, for the ID lookup
+        orders = model["orders"]
+        order_codes = orders["order_code"].to_numpy()
+        positions = np.full(int(order_codes.max()) + 1 if len(orders) else 0, -1)
+        positions[order_codes] = np.arange(len(orders))
+        order_ids = orders["order_id"]
+
+    for begin in range(lo, max(hi, lo + 1), batch_rows):
+        stop = min(begin + batch_rows, hi)
+        rows = frame.iloc[begin:stop]
+        if codes:
+            rows = rows[filter_mask(index, table, codes, begin, stop)]
+        if order_ids is not None:
+            # Only the batch's IDs are gathered; they stay categorical
+            found = positions[rows["order_code"].to_numpy()]
+            rows = rows.assign(order_id=order_ids.iloc[found].array)[
+                ["order_id", *rows.columns.drop(["order_code"])]
+            ]
+        else:
+            rows = rows.drop(columns="order_code")
+        yield rows
+
+
+def _plain_columns(batch):
+    # Categories are written as their labels; a batch's dictionary would hold
+    # every label of the table
+    return batch.astype(
+        {
+            column: "object"
+            for column, dtype in batch.dtypes.items()
+            if isinstance(dtype, pd.CategoricalDtype)
+        }
+    )
+
+
+def _arrow_schema(batch):
+    # Taken from the dtypes rather than the values, so a first batch that
+    # the filters left empty still types its category columns as strings
+    schema = pa.Schema.from_pandas(batch, preserve_index=False)
+    for i, field in enumerate(schema):
+        if pa.types.is_dictionary(field.type):
+            schema = schema.set(i, field.with_type(field.type.value_type))
+    return schema
+
+
+def csv_chunks(batches, compress=False):
+    """CSV bytes of each batch, with the header before the first one."""
+    gzip = zlib.compressobj(wbits=31) if compress else None
+    header = True
+    for batch in batches:
+        text = batch.to_csv(index=False, header=header, date_format=TIMESTAMP_FORMAT)
+        header = False
+        data = text.encode()
+        if gzip:
+            data = gzip.compress(data)
+        if data:
+            yield data
+    if gzip:
+        yield gzip.flush()
+
+
+class _ChunkSink(io.RawIOBase):
+    # Collects what the Parquet writer emits until it is drained, while
+    # reporting the total bytes written as the file position
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def parquet_chunks(batches, compress=False):
+    """Parquet bytes, one row group per non-empty batch, then the footer."""
+    sink = _ChunkSink()
+    writer = None
+    for batch in batches:
+        if writer is None:
+            writer = pq.ParquetWriter(
+                sink, _arrow_schema(batch), compression="zstd" if compress else "none"
+            )
+        if batch.empty:
+            continue
+        table = pa.Table.from_pandas(
+            _plain_columns(batch), schema=writer.schema, preserve_index=False
+        )
+        writer.write_table(table)
+        yield sink.drain()
+    if writer is not None:
+        writer.close()
+    yield sink.drain()
+
+
+def export_chunks(batches, fmt, compress=False):
+    """Encoded bytes of the batches in the given format."""
+    if fmt == "csv":
+        return csv_chunks(batches, compress)
+    if fmt == "parquet":
+        return parquet_chunks(batches, compress)
+    raise ValueError(f"unknown export format: {fmt}")
+
+
+def write_export(chunks, target):
+    """Write the chunks to ``target``; returns the bytes written."""
+    target = Path(target)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_name(f"{target.name}.{os.getpid()}.tmp")
+    size = 0
+    try:
+        with open(tmp, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+                size += len(chunk)
+        os.replace(tmp, target)
+    finally:
+        tmp.unlink(missing_ok=True)
+    return size
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("table", choices=list(EXPORT_TABLES))
+    parser.add_argument("--data", default="dashboard/main_data.csv")
+    parser.add_argument("--output", help="default: the table name in this folder")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+    parser.add_argument("--compress", action="store_true")
+    parser.add_argument("--start", help="first purchase date (default: earliest)")
+    parser.add_argument("--end", help="last purchase date (default: latest)")
+    parser.add_argument("--approximate", action="store_true", help="RFM bins only")
+    parser.add_argument("--batch-rows", type=int, default=BATCH_ROWS)
+    # One repeatable option per filter column, e.g. --state SP --state RJ
+    for column, name in FILTER_OPTIONS.items():
+        parser.add_argument(
+            f"--{name}",
+            dest=column,
+            action="append",
+            default=[],
+            help=f"keep only this {FILTER_COLUMNS[column][1].lower()}",
+        )
+    args = parser.parse_args(argv)
+
+    model = load_star_schema(args.data)
+    times = model["orders"]["order_purchase_timestamp"].dropna()
+    if times.empty:
+        parser.error("the dataset has no dated orders")
+    first, last = times.iloc[0].date(), times.iloc[-1].date()
+    start = pd.Timestamp(args.start).date() if args.start else first
+    end = pd.Timestamp(args.end).date() if args.end else last
+    selections = {column: getattr(args, column) for column in FILTER_OPTIONS}
+    filtering = any(selections.values())
+    index = build_filter_index(model) if filtering else None
+
+    if args.table == "rfm":
+        if not filtering and start <= first and end >= last:
+            rfm = rfm_from_totals(*customer_totals(model), args.approximate)
+        else:
+            # Same rows the dashboard scores for these filters
+            if filtering:
+                filtered = filter_star(model, index, start, end, selections)
+            else:
+                filtered = slice_star(model, start, end)
+            rfm = calculate_rfm_star(filtered, args.approximate)
+        batches = rfm_batches(rfm, args.batch_rows)
+    else:
+        batches = table_batches(
+            model, args.table, start, end, index, selections, args.batch_rows
+        )
+
+    target = args.output or export_name(args.table, args.format, args.compress)
+    size = write_export(export_chunks(batches, args.format, args.compress), target)
+    print(f"Wrote {target} ({size / 2**20:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
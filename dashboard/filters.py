@@ -0,0 +1,126 @@
+"""Slice the star-schema tables by state, category and payment type.
+
+Every filter column gets one bitmap per value and table, built once per
+loaded model: bit ``r`` of ``bitmaps[table][column][code]`` is set when row
+``r`` of ``table`` passes the filter ``column == value``. On the column's
+own table that is the row's value; on the other tables it is whether the
+row's order has any row with that value (an order of a selected state, an
+order with an item of a selected category, an order paid with a selected
+type).
+
+The bitmaps are packed eight rows per byte and built one value at a
+time, from the rows of that value found by sorting the column's codes
+once, so building them holds one unpacked row per table. A filter ORs the
+rows of its selected values, the filters are ANDed, and only the bytes of
+the date range (the tables are sorted by time) are touched.
+"""
+
+from functools import partial
+
+import numpy as np
+
+from data_loader import date_range_positions
+from mappings import CATEGORY_MAPPING, PAYMENT_MAPPING, STATE_MAPPING, map_labels
+
+# Filter column -> (table holding it, sidebar label, value labeler)
+FILTER_COLUMNS = {
+    "customer_state": (
+        "orders",
+        "State",
+        partial(map_labels, mapping=STATE_MAPPING),
+    ),
+    "product_category_name_english": (
+        "items",
+        "Product category",
+        partial(map_labels, mapping=CATEGORY_MAPPING),
+    ),
+    "payment_type": (
+        "payments",
+        "Payment type",
+        partial(map_labels, mapping=PAYMENT_MAPPING),
+    ),
+}
+
+# Filter column -> command-line option and query parameter name
+FILTER_OPTIONS = {
+    "customer_state": "state",
+    "product_category_name_english": "category",
+    "payment_type": "payment-type",
+}
+
+
+def build_filter_index(model, columns=FILTER_COLUMNS):
+    """Build the per-value bitmaps of every filter column for every table.
+
+    Returns ``{"values": {column: labels}, "bitmaps": {table: {column:
+    uint8 matrix}}}``; each matrix has one packed row per label.
+    """
+    n_codes = (
+        int(model["orders"]["order_code"].max()) + 1 if len(model["orders"]) else 0
+    )
+    values, bitmaps = {}, {table: {} for table in model}
+    for column, (home, *_) in columns.items():
+        source = model[home][column]
+        labels = source.cat.categories
+        values[column] = labels
+
+        # Rows of each value are one run of the stably sorted codes
+        codes = source.cat.codes.to_numpy()
+        rows = np.argsort(codes, kind="stable")
+        runs = np.searchsorted(codes[rows], np.arange(len(labels) + 1))
+        home_orders = model[home]["order_code"].to_numpy()[rows]
+
+        matrices = {
+            table: np.empty((len(labels), (len(frame) + 7) // 8), dtype="uint8")
+            for table, frame in model.items()
+        }
+        # Orders having at least one row with the current value
+        members = np.zeros(n_codes, dtype=bool)
+        for code in range(len(labels)):
+            run = slice(runs[code], runs[code + 1])
+            members[home_orders[run]] = True
+            for table, frame in model.items():
+                if table == home:
+                    passed = np.zeros(len(frame), dtype=bool)
+                    passed[rows[run]] = True
+                else:
+                    passed = members[frame["order_code"].to_numpy()]
+                matrices[table][code] = np.packbits(passed)
+            members[home_orders[run]] = False
+        for table, matrix in matrices.items():
+            bitmaps[table][column] = matrix
+    return {"values": values, "bitmaps": bitmaps}
+
+
+def selection_codes(index, selections):
+    """Codes of the selected labels per column; unfiltered columns are left out."""
+    return {
+        column: index["values"][column].get_indexer(labels)
+        for column, labels in selections.items()
+        if len(labels)
+    }
+
+
+def filter_mask(index, table, codes, lo, hi):
+    """Boolean mask of rows ``lo:hi`` of ``table`` passing every filter."""
+    byte_lo, byte_hi = lo // 8, (hi + 7) // 8
+    bits = None
+    for column, selected in codes.items():
+        matrix = index["bitmaps"][table][column][:, byte_lo:byte_hi]
+        passed = np.bitwise_or.reduce(matrix[selected[selected >= 0]], axis=0)
+        bits = passed if bits is None else bits & passed
+    if bits is None:
+        return np.ones(hi - lo, dtype=bool)
+    start = lo - byte_lo * 8
+    return np.unpackbits(bits)[start : start + hi - lo].view(bool)
+
+
+def filter_star(model, index, start_date, end_date, selections):
+    """Restrict every table to the date range and the selected values."""
+    codes = selection_codes(index, selections)
+    filtered = {}
+    for table, frame in model.items():
+        lo, hi = date_range_positions(frame, start_date, end_date)
+        rows = frame.iloc[lo:hi]
+        filtered[table] = rows[filter_mask(index, table, codes, lo, hi)]
+    return filtered
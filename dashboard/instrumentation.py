@@ -0,0 +1,175 @@
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from prometheus_client import Counter, Histogram, start_http_server
+from pythonjsonlogger.json import JsonFormatter
+
+# Trace every rerun (JSON logs and Prometheus metrics) when set to 1
+ENABLED_ENV = "DASHBOARD_INSTRUMENTATION"
+# Serve Prometheus metrics on this port when set
+METRICS_PORT_ENV = "DASHBOARD_METRICS_PORT"
+
+STAGE_SECONDS = Histogram(
+    "dashboard_stage_seconds",
+    "Wall time of one dashboard stage",
+    ["stage"],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+STAGE_PEAK_BYTES = Histogram(
+    "dashboard_stage_peak_bytes",
+    "Peak process-wide traced memory allocated during one dashboard stage "
+    "(approximate when stages of concurrent reruns overlap)",
+    ["stage"],
+    buckets=tuple(2**exp for exp in range(16, 36, 2)),
+)
+STAGE_ROWS = Counter(
+    "dashboard_stage_rows_total",
+    "Rows entering and leaving each dashboard stage",
+    ["stage", "direction"],
+)
+RERUNS = Counter("dashboard_traced_reruns_total", "Dashboard reruns traced")
+
+logger = logging.getLogger("dashboard.instrumentation")
+
+_lock = threading.Lock()
+_active_traces = 0
+# Traced stages running now, and started so far; the peak of tracemalloc is
+# process-wide, so it is reset only while no other stage is measuring
+_running_stages = 0
+_stage_starts = 0
+_metrics_server_started = False
+
+
+def env_enabled():
+    """Whether tracing is switched on for every rerun by the environment."""
+    return os.environ.get(ENABLED_ENV) == "1"
+
+
+def configure_logging():
+    """Send this module's records to stderr as one JSON object per line."""
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(JsonFormatter("%(asctime)s %(levelname)s %(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+
+def start_metrics_server():
+    """Expose Prometheus metrics once per process if a port is configured."""
+    global _metrics_server_started
+    port = os.environ.get(METRICS_PORT_ENV)
+    with _lock:
+        if port and not _metrics_server_started:
+            start_http_server(int(port))
+            _metrics_server_started = True
+
+
+def _start_tracing():
+    global _active_traces
+    with _lock:
+        if _active_traces == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        _active_traces += 1
+
+
+def _stop_tracing():
+    global _active_traces
+    with _lock:
+        _active_traces -= 1
+        if _active_traces == 0:
+            tracemalloc.stop()
+
+
+class RerunTrace:
+    """Per-rerun record of wall time, rows in/out and peak memory by stage.
+
+    When disabled, ``stage`` hands back a throwaway record and measures
+    nothing, so the instrumented code pays only for a context manager.
+    The peak is process-wide: a stage that overlaps a traced stage of
+    another rerun also counts that stage's allocations (and is marked
+    ``overlapped``), and allocations by untraced threads such as the
+    prewarm thread always count. Stages never wait for each other.
+    """
+
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.stages = []
+        # label -> (bytes before, bytes after) of a memory optimization
+        self.memory = {}
+        self._started = time.perf_counter()
+        if enabled:
+            _start_tracing()
+
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        """Measure the body as stage ``name``; set ``rows_out`` on the record.
+
+        Entering the same stage again within a rerun adds to its totals.
+        """
+        record = {"stage": name, "rows_in": rows_in, "rows_out": None}
+        if not self.enabled:
+            yield record
+            return
+
+        global _running_stages, _stage_starts
+        with _lock:
+            if _running_stages == 0:
+                tracemalloc.reset_peak()
+            overlapped = _running_stages > 0
+            _running_stages += 1
+            _stage_starts += 1
+            starts = _stage_starts
+            base, _ = tracemalloc.get_traced_memory()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            seconds = time.perf_counter() - start
+            with _lock:
+                _, peak = tracemalloc.get_traced_memory()
+                overlapped = overlapped or _stage_starts != starts
+                _running_stages -= 1
+            record["overlapped"] = overlapped
+            self._add(record, seconds, max(peak - base, 0))
+
+    def _add(self, record, seconds, peak):
+        for existing in self.stages:
+            if existing["stage"] == record["stage"]:
+                existing["seconds"] += seconds
+                existing["peak_bytes"] = max(existing["peak_bytes"], peak)
+                existing["overlapped"] = existing["overlapped"] or record["overlapped"]
+                for key in ["rows_in", "rows_out"]:
+                    if record[key] is not None:
+                        existing[key] = (existing[key] or 0) + record[key]
+                return
+        self.stages.append({**record, "seconds": seconds, "peak_bytes": peak})
+
+    def finish(self):
+        """Close the trace and publish it as a JSON log line and metrics."""
+        if not self.enabled:
+            return
+        self.enabled = False
+        _stop_tracing()
+
+        RERUNS.inc()
+        for record in self.stages:
+            STAGE_SECONDS.labels(record["stage"]).observe(record["seconds"])
+            STAGE_PEAK_BYTES.labels(record["stage"]).observe(record["peak_bytes"])
+            for direction in ["rows_in", "rows_out"]:
+                if record[direction] is not None:
+                    STAGE_ROWS.labels(record["stage"], direction[5:]).inc(
+                        record[direction]
+                    )
+        logger.info(
+            "dashboard rerun",
+            extra={
+                "total_seconds": time.perf_counter() - self._started,
+                "stages": self.stages,
+                "memory": self.memory,
+            },
+        )
@@ -0,0 +1,219 @@
+"""Keep the loaded dashboard data current while the source grows.
+
+A watchdog observer flags writes to the source CSV or partition folder.
+On the next rerun ``current`` reads only what was added since the last
+load: the complete lines appended to the CSV, or the month partitions that
+are new in the pipeline manifest. Those rows are merged into the
+star-schema tables, the daily rollups and the per-customer RFM totals.
+
+Any other change (an edited or truncated CSV, a rebuilt partition, or
+orders older than the newest one loaded) falls back to a full reload.
+"""
+
+import hashlib
+import io
+import json
+import threading
+from pathlib import Path
+
+import pandas as pd
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+
+from data_loader import (
+    CSV_DTYPES,
+    MANIFEST_NAME,
+    apply_dtypes,
+    encode_ids,
+    preprocess_dataframe,
+)
+from pipeline import partition_path
+from rfm import customer_totals, merge_customer_totals, recode_customer_totals
+from star import (
+    append_star_schema,
+    build_star_rollup,
+    extend_star_rollup,
+    load_star_schema,
+)
+
+# Events that can change the source; reading it only opens and closes files
+WRITE_EVENTS = {"created", "modified", "moved", "deleted", "closed"}
+
+
+def _prefix_hash(path, size, chunk_size=1 << 20):
+    # SHA-256 of the first ``size`` bytes, left open for appended bytes
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while size > 0 and (chunk := f.read(min(chunk_size, size))):
+            digest.update(chunk)
+            size -= len(chunk)
+    return digest
+
+
+def source_state(path):
+    """What a load of ``path`` covers: CSV bytes or manifest partitions."""
+    path = Path(path)
+    if path.is_dir():
+        manifest = path / MANIFEST_NAME
+        if not manifest.exists():
+            return {"partitions": {}}
+        return {"partitions": json.loads(manifest.read_text())["partitions"]}
+    with open(path, "rb") as f:
+        header = f.readline()
+    size = path.stat().st_size
+    return {
+        "header": header,
+        "size": size,
+        "prefix": _prefix_hash(path, size).hexdigest(),
+    }
+
+
+def read_delta(path, state):
+    """Rows added to ``path`` since ``state`` was taken, and the new state.
+
+    The rows are None when the source changed in any other way. A CSV
+    counts as appended to only if every byte loaded before is unchanged.
+    """
+    path = Path(path)
+    if path.is_dir():
+        current = source_state(path)
+        old, new = state["partitions"], current["partitions"]
+        if any(new.get(month) != digest for month, digest in old.items()):
+            return None, current
+        frames = [
+            pd.read_parquet(partition_path(path, month))
+            for month in sorted(set(new) - set(old))
+        ]
+        if not frames:
+            return pd.DataFrame(), current
+        return encode_ids(apply_dtypes(pd.concat(frames, ignore_index=True))), current
+
+    size = path.stat().st_size
+    if size < state["size"]:
+        return None, source_state(path)
+    prefix = _prefix_hash(path, state["size"])
+    if prefix.hexdigest() != state["prefix"]:
+        return None, source_state(path)
+    with open(path, "rb") as f:
+        f.seek(state["size"])
+        data = f.read(size - state["size"])
+    # A line still being written is left for the next refresh
+    end = state["size"] + data.rfind(b"\n") + 1
+    prefix.update(data[: end - state["size"]])
+    current = {**state, "size": end, "prefix": prefix.hexdigest()}
+    if end == state["size"]:
+        return pd.DataFrame(), current
+    rows = pd.read_csv(
+        io.BytesIO(state["header"] + data[: end - state["size"]]), dtype=CSV_DTYPES
+    )
+    return encode_ids(preprocess_dataframe(rows)), current
+
+
+class _SourceHandler(FileSystemEventHandler):
+    """Set ``changed`` when a file at or under ``path`` is written."""
+
+    def __init__(self, path, changed):
+        self.path = str(path)
+        self.changed = changed
+
+    def on_any_event(self, event):
+        paths = [event.src_path, getattr(event, "dest_path", "")]
+        if event.event_type in WRITE_EVENTS and any(
+            str(p).startswith(self.path) for p in paths
+        ):
+            self.changed.set()
+
+
+def watch(path, changed):
+    """Start a daemon observer that sets the ``changed`` event on writes."""
+    path = Path(path).resolve()
+    observer = Observer()
+    observer.daemon = True
+    observer.schedule(
+        _SourceHandler(path, changed),
+        str(path if path.is_dir() else path.parent),
+        recursive=path.is_dir(),
+    )
+    observer.start()
+    return observer
+
+
+def _load(live):
+    # The state is taken first: rows appended during the load are read again
+    # by the next refresh, found to repeat orders and trigger a reload
+    state = source_state(live["path"])
+    model = load_star_schema(live["path"], shared=live["shared"])
+    customers, totals = customer_totals(model)
+    live["source"] = state
+    live["version"] += 1
+    live["data"] = {
+        "model": model,
+        "rollup": build_star_rollup(model),
+        "customers": customers,
+        "totals": totals,
+        "version": live["version"],
+        "derived": {},
+    }
+
+
+def _merge(live, rows):
+    data = live["data"]
+    appended = append_star_schema(data["model"], rows)
+    if appended is None:
+        return False
+    model, delta, code_maps = appended
+    customers, delta_totals = customer_totals(delta)
+    totals = recode_customer_totals(
+        data["totals"], code_maps["customer_unique_id"], len(customers)
+    )
+    live["version"] += 1
+    live["data"] = {
+        "model": model,
+        "rollup": extend_star_rollup(data["rollup"], delta, code_maps),
+        "customers": customers,
+        "totals": merge_customer_totals(totals, delta_totals),
+        "version": live["version"],
+        "derived": {},
+    }
+    return True
+
+
+def open_live(path, shared=False):
+    """Load ``path`` and watch it; read the data through ``current``."""
+    live = {
+        "path": str(path),
+        "shared": shared,
+        "changed": threading.Event(),
+        "lock": threading.Lock(),
+        "version": 0,
+    }
+    _load(live)
+    live["observer"] = watch(path, live["changed"])
+    return live
+
+
+def current(live):
+    """The latest data, after merging what was added to the source.
+
+    Returns a dict of the star-schema ``model``, its daily ``rollup`` and
+    the RFM ``customers`` and ``totals`` (see ``customer_totals``). Each
+    refresh that changes the data replaces the dict and bumps its
+    ``version``, so a rerun holding it sees one version.
+    """
+    if live["changed"].is_set():
+        with live["lock"]:
+            if live["changed"].is_set():
+                live["changed"].clear()
+                rows, state = read_delta(live["path"], live["source"])
+                if rows is None or (len(rows) and not _merge(live, rows)):
+                    _load(live)
+                else:
+                    live["source"] = state
+    return live["data"]
+
+
+def derived(data, name, compute):
+    """``compute(data["model"])``, kept with this version of the data."""
+    if name not in data["derived"]:
+        data["derived"][name] = compute(data["model"])
+    return data["derived"][name]
@@ -0,0 +1,124 @@
+import datetime
+import os
+import threading
+
+import pandas as pd
+from cachetools import LRUCache
+
+# Memory budget of the computed-result cache in MiB
+MAX_MB_ENV = "DASHBOARD_RESULT_CACHE_MB"
+DEFAULT_MAX_MB = 64
+
+
+def _result_size(result):
+    # Deep size of the frames a result holds; the scalars are negligible
+    size = 0
+    for value in [*result.values(), *result.get("panels", {}).values()]:
+        if isinstance(value, (pd.DataFrame, pd.Series)):
+            size += int(value.memory_usage(deep=True).sum())
+    return max(size, 1)
+
+
+_lock = threading.Lock()
+_cache = LRUCache(
+    maxsize=int(float(os.environ.get(MAX_MB_ENV, DEFAULT_MAX_MB)) * 2**20),
+    getsizeof=_result_size,
+)
+_stats = {"hits": 0, "misses": 0}
+# Dataset version the cached entries belong to, and versions prewarmed
+_version = None
+_prewarmed = set()
+
+
+def result_key(version, start_date, end_date, selections, n, approximate):
+    """Hashable key of one dashboard view; empty filters are left out."""
+    filters = tuple(
+        (column, tuple(sorted(labels)))
+        for column, labels in sorted(selections.items())
+        if len(labels)
+    )
+    return version, start_date, end_date, filters, n, approximate
+
+
+def common_ranges(first, last):
+    """Full range, each calendar year and the last 30 and 90 days."""
+    ranges = [(first, last)]
+    for year in range(first.year, last.year + 1):
+        ranges.append(
+            (
+                max(first, datetime.date(year, 1, 1)),
+                min(last, datetime.date(year, 12, 31)),
+            )
+        )
+    for days in [30, 90]:
+        ranges.append((max(first, last - datetime.timedelta(days=days - 1)), last))
+    # Short spans repeat the same range
+    return list(dict.fromkeys(ranges))
+
+
+def use_version(version):
+    """Drop every entry of other dataset versions once a new one is seen."""
+    global _version
+    with _lock:
+        if version != _version:
+            for key in [key for key in _cache if key[0] != version]:
+                del _cache[key]
+            _version = version
+
+
+def get_result(key):
+    """The cached result of ``key``, or None; counts a hit or a miss."""
+    with _lock:
+        result = _cache.get(key)
+        _stats["hits" if result is not None else "misses"] += 1
+    return result
+
+
+def put_result(key, result):
+    """Keep ``result`` unless it alone exceeds the budget or is outdated."""
+    with _lock:
+        if key[0] == _version and _result_size(result) <= _cache.maxsize:
+            _cache[key] = result
+
+
+def cached_result(key, compute):
+    """Return the result of ``key``, calling ``compute()`` on a miss."""
+    result = get_result(key)
+    if result is None:
+        result = compute()
+        put_result(key, result)
+    return result
+
+
+def prewarm(version, keys, compute):
+    """Fill ``keys`` in a background thread, once per dataset version.
+
+    ``compute(key)`` must not touch Streamlit, as it runs outside a rerun.
+    Keys already cached are skipped and do not count as misses.
+    """
+    with _lock:
+        if version in _prewarmed:
+            return None
+        _prewarmed.add(version)
+
+    def fill():
+        for key in keys:
+            with _lock:
+                if key in _cache:
+                    continue
+            put_result(key, compute(key))
+
+    thread = threading.Thread(target=fill, name="result-cache-prewarm", daemon=True)
+    thread.start()
+    return thread
+
+
+def cache_info():
+    """Number of cached results, bytes held, the byte budget and hit counts."""
+    with _lock:
+        return {
+            "results": len(_cache),
+            "bytes": _cache.currsize,
+            "max_bytes": _cache.maxsize,
+            **_stats,
+        }
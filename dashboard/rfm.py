@@ -0,0 +1,286 @@
+import numpy as np
+import pandas as pd
+
+from aggregations import distinct_counts, factorize
+from data_loader import NS_PER_DAY
+from sketches import quantile_sketch, sketch_quantiles
+
+RFM_COLUMNS = [
+    "Recency",
+    "Frequency",
+    "Monetary",
+    "R_Score",
+    "F_Score",
+    "M_Score",
+    "RFM_Segment",
+    "RFM_Score",
+    "Customer_Segment",
+]
+
+# Customer segments from the lowest to the highest total RFM score
+CUSTOMER_SEGMENTS = ["Lost Customer", "At Risk", "Potential Loyalist", "Loyal Customer"]
+
+# Segment strings indexed by the arithmetic code R*100 + F*10 + M
+SEGMENT_LABELS = np.array([f"{code:03d}" for code in range(1000)], dtype=object)
+
+
+def empty_rfm():
+    """Return an empty RFM table with the full output schema."""
+    return pd.DataFrame(columns=RFM_COLUMNS)
+
+
+def quintile_scores(values, labels, approximate=False):
+    """Vectorized ``pd.qcut(values, 5, labels, duplicates="drop")``.
+
+    Raises ValueError, like ``qcut``, when duplicate edges leave fewer bins
+    than labels. With ``approximate`` the inner edges come from a quantile
+    sketch (see sketches.py) instead of an exact percentile.
+    """
+    quantiles = np.linspace(0, 1, 6)
+    if approximate:
+        edges = np.unique(sketch_quantiles(quantile_sketch(values), quantiles))
+    else:
+        edges = np.unique(np.percentile(values, quantiles * 100.0))
+    if len(edges) - 1 != len(labels):
+        raise ValueError("Bin labels must be one fewer than the number of bin edges")
+
+    # Right-closed bins with the lowest edge included, as in pd.cut
+    ids = np.searchsorted(edges, values, side="left")
+    ids[values == edges[0]] = 1
+    return np.asarray(labels, dtype="int64")[ids - 1]
+
+
+def first_ranks(values):
+    """Vectorized ``rank(method="first")``: ties keep their original order."""
+    ranks = np.empty(len(values), dtype="float64")
+    ranks[np.argsort(values, kind="stable")] = np.arange(1, len(values) + 1)
+    return ranks
+
+
+def _manual_scores(column_data, labels):
+    # Quantile-based manual binning for fewer than 5 unique values
+    percentiles = [0, 0.2, 0.4, 0.6, 0.8, 1.0]
+    bins = [column_data.quantile(p) for p in percentiles]
+    # Ensure bins are unique
+    bins = sorted(set(bins))
+    # If still not enough bins, fall back to equal bins
+    if len(bins) < 3:
+        bins = [
+            column_data.min(),
+            column_data.median(),
+            column_data.max(),
+        ]
+
+    if len(bins) >= 2:  # Need at least 2 bins
+        return pd.cut(
+            column_data,
+            bins=bins,
+            labels=labels[: len(bins) - 1],
+            include_lowest=True,
+        ).astype("int64")
+    return 3  # Neutral middle score if can't bin
+
+
+def score_rfm(rfm, approximate=False):
+    """Add R/F/M scores, segment code, total score and customer segment."""
+    for col, labels in [
+        ("Recency", [5, 4, 3, 2, 1]),  # Higher score for lower recency
+        ("Frequency", [1, 2, 3, 4, 5]),  # Higher score for higher frequency
+        ("Monetary", [1, 2, 3, 4, 5]),  # Higher score for higher monetary value
+    ]:
+        values = rfm[col].to_numpy()
+        try:
+            if col == "Recency":
+                # For recency, lower is better
+                scores = quintile_scores(values, labels, approximate)
+            else:
+                # For frequency and monetary, higher is better
+                # Use rank for frequency to handle potential duplicates
+                column_data = first_ranks(values) if col == "Frequency" else values
+
+                # Check if we have at least 5 unique values for qcut
+                if len(np.unique(column_data)) >= 5:
+                    scores = quintile_scores(column_data, labels, approximate)
+                else:
+                    scores = _manual_scores(
+                        pd.Series(column_data, index=rfm.index), labels
+                    )
+        except ValueError:
+            # Fallback to manual scoring if qcut fails
+            scores = 3  # Assign neutral score as fallback
+        rfm[f"{col[0]}_Score"] = np.broadcast_to(scores, len(rfm)).astype("int64")
+
+    r, f, m = (rfm[c].to_numpy() for c in ["R_Score", "F_Score", "M_Score"])
+    rfm["RFM_Segment"] = SEGMENT_LABELS[r * 100 + f * 10 + m]
+    rfm["RFM_Score"] = r + f + m
+
+    rfm["Customer_Segment"] = pd.cut(
+        rfm["RFM_Score"],
+        bins=[-1, 5, 8, 11, float("inf")],
+        labels=CUSTOMER_SEGMENTS,
+    )
+    return rfm
+
+
+def build_rfm(
+    customers,
+    customer_codes,
+    purchase_ns,
+    frequency,
+    monetary,
+    approximate=False,
+    reference_date=None,
+):
+    """Assemble and score the RFM table from per-customer code arrays.
+
+    ``customer_codes`` and ``purchase_ns`` describe one purchase per entry;
+    ``frequency`` and ``monetary`` are indexed by customer code. Recency is
+    counted in days to ``reference_date``, by default the latest purchase.
+    """
+    # Latest purchase per customer on int64 nanoseconds, then whole days
+    last_ns = pd.Series(purchase_ns).groupby(customer_codes).max()
+    last_day = last_ns.to_numpy() // NS_PER_DAY
+    observed = last_ns.index.to_numpy()
+    if reference_date is None:
+        reference_day = last_day.max()
+    else:
+        reference_day = pd.Timestamp(reference_date).value // NS_PER_DAY
+
+    rfm = pd.DataFrame(
+        {
+            "Recency": reference_day - last_day,
+            "Frequency": frequency[observed],
+            "Monetary": monetary[observed],
+        },
+        index=pd.Index(np.asarray(customers)[observed], name="customer_unique_id"),
+    )
+    return score_rfm(rfm, approximate)
+
+
+def _valid_purchases(df):
+    # Purchase times as datetime64 and the rows with a time and a customer
+    timestamps = df["order_purchase_timestamp"]
+    if not pd.api.types.is_datetime64_any_dtype(timestamps):
+        timestamps = pd.to_datetime(timestamps, errors="coerce")
+    valid = (timestamps.notna() & df["customer_unique_id"].notna()).to_numpy()
+    return timestamps.to_numpy(dtype="datetime64[ns]")[valid].view("int64"), valid
+
+
+def calculate_rfm(df, approximate=False):
+    """Compute per-customer RFM values and scores without modifying ``df``."""
+    if df.empty:
+        return empty_rfm()
+
+    purchase_ns, valid = _valid_purchases(df)
+    if not valid.any():
+        return empty_rfm()
+
+    valid_df = df.loc[valid]
+    customer_codes, customers = factorize(valid_df["customer_unique_id"], sort=True)
+    order_codes, orders = factorize(valid_df["order_id"])
+    n_customers = len(customers)
+
+    frequency = distinct_counts(customer_codes, order_codes, n_customers, len(orders))
+    monetary = np.bincount(
+        customer_codes,
+        weights=np.nan_to_num(valid_df["payment_value"].to_numpy(dtype="float64")),
+        minlength=n_customers,
+    )
+    return build_rfm(
+        customers, customer_codes, purchase_ns, frequency, monetary, approximate
+    )
+
+
+def customer_totals(model):
+    """Per-customer RFM inputs of the star-schema tables (see star.py).
+
+    Returns the customer labels and a dict of arrays indexed by customer
+    code: latest purchase in nanoseconds, order count and payment total.
+    Customers without a dated order have a count of 0.
+    """
+    orders, payments = model["orders"], model["payments"]
+    purchase_ns, valid = _valid_purchases(orders)
+    valid_orders = orders.loc[valid]
+    customer_codes, customers = factorize(valid_orders["customer_unique_id"], sort=True)
+    n_customers = len(customers)
+
+    # Orders are unique per row, so Frequency is a plain count
+    frequency = np.bincount(customer_codes, minlength=n_customers)
+    last_ns = np.full(n_customers, np.iinfo("int64").min)
+    np.maximum.at(last_ns, customer_codes, purchase_ns)
+
+    monetary = np.zeros(n_customers)
+    if valid.any():
+        # Payments reach their customer through a dense order code lookup,
+        # spanning both tables in case their slices cover different orders
+        order_codes = [orders["order_code"], payments["order_code"]]
+        first_code = min(int(codes.min()) for codes in order_codes if len(codes))
+        last_code = max(int(codes.max()) for codes in order_codes if len(codes))
+        lookup = np.full(last_code - first_code + 1, -1)
+        lookup[valid_orders["order_code"].to_numpy() - first_code] = customer_codes
+        payment_customers = lookup[payments["order_code"].to_numpy() - first_code]
+        paid = payment_customers >= 0
+        monetary = np.bincount(
+            payment_customers[paid],
+            weights=np.nan_to_num(
+                payments["payment_value"].to_numpy(dtype="float64")[paid]
+            ),
+            minlength=n_customers,
+        )
+    return customers, {
+        "last_ns": last_ns,
+        "frequency": frequency,
+        "monetary": monetary,
+    }
+
+
+def merge_customer_totals(totals, other):
+    """Combine the totals of two disjoint sets of orders on the same codes."""
+    return {
+        "last_ns": np.maximum(totals["last_ns"], other["last_ns"]),
+        "frequency": totals["frequency"] + other["frequency"],
+        "monetary": totals["monetary"] + other["monetary"],
+    }
+
+
+def recode_customer_totals(totals, code_map, n_customers):
+    """Move totals to new customer codes; ``code_map`` maps old codes to new."""
+    recoded = {
+        "last_ns": np.full(n_customers, np.iinfo("int64").min),
+        "frequency": np.zeros(n_customers, dtype="int64"),
+        "monetary": np.zeros(n_customers),
+    }
+    for key, values in recoded.items():
+        values[code_map] = totals[key]
+    return recoded
+
+
+def rfm_from_totals(customers, totals, approximate=False, reference_date=None):
+    """Score the customers that have orders in ``totals``.
+
+    Only the per-customer arrays are read: Recency is one subtraction from
+    the reference day and the quintile edges come from these values.
+    """
+    observed = np.flatnonzero(totals["frequency"])
+    if not len(observed):
+        return empty_rfm()
+    return build_rfm(
+        customers,
+        observed,
+        totals["last_ns"][observed],
+        totals["frequency"],
+        totals["monetary"],
+        approximate,
+        reference_date,
+    )
+
+
+def calculate_rfm_star(model, approximate=False):
+    """Compute the RFM table from the star-schema tables (see star.py).
+
+    Recency and Frequency come from the orders table and Monetary from the
+    payments table, so each payment is counted exactly once.
+    """
+    if model["orders"].empty:
+        return empty_rfm()
+    return rfm_from_totals(*customer_totals(model), approximate)
@@ -0,0 +1,94 @@
+"""Precompute the RFM segment counts at every month end with a process pool.
+
+Usage:
+    python dashboard/rfm_history.py --data dashboard/main_data.csv --workers 4
+
+For each month end, customers are scored on the orders purchased up to
+that day, with Recency counted to it. The workers memory-map the
+star-schema Arrow files (see ``load_star_schema``) instead of receiving
+the tables by pickle: a task sends one date and returns one row of segment
+counts. The table is saved next to the cached star schema, where the
+dashboard reads it.
+"""
+
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from data_loader import CACHE_DIR, SORT_COLUMN, source_fingerprint, write_parquet_atomic
+from rfm import CUSTOMER_SEGMENTS, customer_totals, rfm_from_totals
+from star import load_star_schema, slice_star, star_path
+
+HISTORY_COLUMNS = ["month", *CUSTOMER_SEGMENTS]
+
+# Tables mapped by each worker process
+_model = None
+
+
+def history_path(path, digest, cache_dir=CACHE_DIR):
+    """Location of the snapshot table for a source digest."""
+    return star_path(path, digest, "rfm-history", cache_dir)
+
+
+def month_ends(model):
+    """Last day of every month from the first to the last purchase."""
+    times = model["orders"][SORT_COLUMN].dropna()
+    if times.empty:
+        return []
+    months = pd.period_range(times.iloc[0], times.iloc[-1], freq="M")
+    return list(months.to_timestamp(how="end").normalize())
+
+
+def segment_counts(model, month_end):
+    """Customers per segment, scored on the orders up to ``month_end``."""
+    first = model["orders"][SORT_COLUMN].iloc[0]
+    totals = customer_totals(slice_star(model, first, month_end))
+    rfm = rfm_from_totals(*totals, reference_date=month_end)
+    counts = rfm["Customer_Segment"].value_counts()
+    return [month_end, *(int(counts.get(segment, 0)) for segment in CUSTOMER_SEGMENTS)]
+
+
+def _init_worker(path, digest, cache_dir):
+    global _model
+    _model = load_star_schema(path, digest, cache_dir, shared=True)
+
+
+def _snapshot(month_end):
+    return segment_counts(_model, month_end)
+
+
+def build_history(path, workers=None, cache_dir=CACHE_DIR):
+    """Compute and save the month-end segment counts of ``path``."""
+    _, digest = source_fingerprint(path)
+    # Writes the Arrow files once; the workers then map the same pages
+    dates = month_ends(load_star_schema(path, digest, cache_dir, shared=True))
+
+    # Spawned workers start without the parent's Arrow thread pools, which
+    # a forked child could inherit mid-use
+    with ProcessPoolExecutor(
+        workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(str(path), digest, cache_dir),
+    ) as pool:
+        rows = list(pool.map(_snapshot, dates))
+
+    history = pd.DataFrame(rows, columns=HISTORY_COLUMNS)
+    write_parquet_atomic(history, history_path(path, digest, cache_dir))
+    return history
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data", default="dashboard/main_data.csv")
+    parser.add_argument("--workers", type=int, help="default: one per CPU core")
+    args = parser.parse_args(argv)
+
+    history = build_history(args.data, args.workers)
+    print(history.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""Keep the per-customer RFM inputs on disk and update them from new orders.
+
+Usage:
+    python dashboard/rfm_state.py --data dashboard/main_data.csv \\
+        --reference-date 2018-09-01
+
+The state is one row per customer: latest purchase, order count and payment
+total (see ``customer_totals``), plus the digest of the source it was built
+from and the part of the source it covers (see refresh.py). A sync with an
+unchanged digest reads nothing; otherwise it reads only the orders appended
+since the last one, or rebuilds the state when the source changed in any
+other way. The RFM table is scored from the state alone, so its cost grows
+with the number of customers rather than the number of order rows.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from data_loader import (
+    CACHE_DIR,
+    SORT_COLUMN,
+    merge_labels,
+    sort_by_timestamp,
+    source_fingerprint,
+)
+from refresh import read_delta, source_state
+from rfm import (
+    customer_totals,
+    merge_customer_totals,
+    recode_customer_totals,
+    rfm_from_totals,
+)
+from star import build_star_schema, load_star_schema
+
+# Bump when the saved layout changes; older state files are rebuilt
+STATE_FORMAT_VERSION = 3
+STATE_METADATA_KEY = b"rfm_state"
+
+
+def state_path(path, cache_dir=CACHE_DIR):
+    """Location of the RFM state kept for a source."""
+    source = hashlib.blake2b(str(Path(path).resolve()).encode(), digest_size=8)
+    return Path(cache_dir) / f"{Path(path).name}-{source.hexdigest()}-rfm.parquet"
+
+
+def _compact(customers, totals, source, digest):
+    # Only customers with a dated order are kept
+    observed = np.flatnonzero(totals["frequency"])
+    return {
+        "customers": customers[observed],
+        "totals": {key: values[observed] for key, values in totals.items()},
+        "source": source,
+        "digest": digest,
+    }
+
+
+def build_state(model, source, digest):
+    """State of the star-schema tables ``model``, loaded from ``source``."""
+    return _compact(*customer_totals(model), source, digest)
+
+
+def update_state(state, path, digest):
+    """Merge the orders added to ``path`` since ``state`` was taken.
+
+    ``digest`` is the source digest the result is recorded under. Returns
+    None when the source changed in any other way, or when a new order is
+    no later than the latest purchase in the state (it may already be
+    counted); the state must then be rebuilt.
+    """
+    rows, source = read_delta(path, state["source"])
+    if rows is None:
+        return None
+    if not len(rows):
+        return {**state, "source": source, "digest": digest}
+
+    delta = build_star_schema(sort_by_timestamp(rows))
+    earliest = delta["orders"][SORT_COLUMN].min()
+    last_ns = state["totals"]["last_ns"]
+    if pd.notna(earliest) and len(last_ns) and earliest.value <= last_ns.max():
+        return None
+
+    customers, totals = customer_totals(delta)
+    labels, state_map, delta_map = merge_labels(
+        state["customers"], customers, sort=True
+    )
+    totals = merge_customer_totals(
+        recode_customer_totals(state["totals"], state_map, len(labels)),
+        recode_customer_totals(totals, delta_map, len(labels)),
+    )
+    return _compact(labels, totals, source, digest)
+
+
+def save_state(state, target):
+    """Write ``state`` to ``target`` so readers never see a partial file."""
+    source = dict(state["source"])
+    if "header" in source:
+        source["header"] = source["header"].decode("latin-1")
+    metadata = {
+        "version": STATE_FORMAT_VERSION,
+        "source": source,
+        "digest": state["digest"],
+    }
+    totals = state["totals"]
+    table = pa.table(
+        {
+            "customer_unique_id": pa.array(
+                np.asarray(state["customers"], dtype=object), pa.string()
+            ),
+            "last_purchase": pa.array(totals["last_ns"], pa.timestamp("ns")),
+            "frequency": pa.array(totals["frequency"], pa.int64()),
+            "monetary": pa.array(totals["monetary"], pa.float64()),
+        },
+        metadata={STATE_METADATA_KEY: json.dumps(metadata)},
+    )
+    target = Path(target)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_suffix(f".{os.getpid()}.tmp")
+    pq.write_table(table, tmp)
+    os.replace(tmp, target)
+
+
+def load_state(target):
+    """Read a state written by ``save_state``; None if it is outdated."""
+    table = pq.read_table(target)
+    metadata = json.loads(table.schema.metadata[STATE_METADATA_KEY])
+    if metadata["version"] != STATE_FORMAT_VERSION:
+        return None
+    source = metadata["source"]
+    if "header" in source:
+        source["header"] = source["header"].encode("latin-1")
+    return {
+        "customers": pd.Index(
+            table["customer_unique_id"].to_pandas(), dtype="string[pyarrow]"
+        ),
+        "totals": {
+            "last_ns": table["last_purchase"].to_numpy().view("int64"),
+            "frequency": table["frequency"].to_numpy(),
+            "monetary": table["monetary"].to_numpy(),
+        },
+        "source": source,
+        "digest": metadata["digest"],
+    }
+
+
+def sync_state(path, target=None, digest=None, cache_dir=CACHE_DIR):
+    """Bring the state saved for ``path`` up to date, save it and return it.
+
+    ``digest`` is the source's current digest (see ``source_fingerprint``).
+    """
+    if digest is None:
+        _, digest = source_fingerprint(path)
+    target = Path(target or state_path(path, cache_dir))
+    state = load_state(target) if target.exists() else None
+    if state is not None and state["digest"] == digest:
+        return state
+    if state is not None:
+        updated = update_state(state, path, digest)
+        if updated is not None:
+            save_state(updated, target)
+            return updated
+
+    # The source is read after its state is taken: rows appended meanwhile
+    # are read again by the next sync, found not to be newer and rebuilt
+    source = source_state(path)
+    state = build_state(load_star_schema(path, cache_dir=cache_dir), source, digest)
+    save_state(state, target)
+    return state
+
+
+def rfm_from_state(state, approximate=False, reference_date=None):
+    """Score the RFM table of a state, with Recency up to ``reference_date``."""
+    return rfm_from_totals(
+        state["customers"], state["totals"], approximate, reference_date
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data", default="dashboard/main_data.csv")
+    parser.add_argument("--state", help="state file (default: in the cache folder)")
+    parser.add_argument(
+        "--reference-date", help="date Recency is counted to (default: latest)"
+    )
+    parser.add_argument("--approximate", action="store_true")
+    args = parser.parse_args(argv)
+
+    state = sync_state(args.data, args.state)
+    rfm = rfm_from_state(state, args.approximate, args.reference_date)
+    print(f"{len(rfm)} customers")
+    segments = rfm["Customer_Segment"].value_counts(sort=False)
+    print(f"\nCustomer segments\n{segments.to_string()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+import numpy as np
+import pandas as pd
+
+from aggregations import TOP_N_PANELS, empty_panels, factorize, format_panel
+from data_loader import NS_PER_DAY, SORT_COLUMN
+
+
+def _day_number(value):
+    # Days since the Unix epoch for a date, datetime or Timestamp
+    return int(np.datetime64(pd.Timestamp(value), "D").astype("int64"))
+
+
+def day_code_sets(day_idx, group_codes, key_codes, n_days, n_groups, n_keys):
+    """Build the distinct (group, key) code sets for every day.
+
+    Returns ``(offsets, groups, keys, n_keys)``. Entries are sorted by day,
+    group and key, so each (day, group) holds one sorted run of key codes, the
+    layout of a roaring array container. Day ``d`` spans
+    ``offsets[d]:offsets[d + 1]``, which makes a date range a single slice.
+    """
+    valid = (group_codes >= 0) & (key_codes >= 0)
+    n_pairs = n_groups * n_keys
+
+    pairs = group_codes[valid] * n_keys + key_codes[valid]
+    cells = np.unique(day_idx[valid] * n_pairs + pairs)
+    days, pairs = np.divmod(cells, n_pairs)
+
+    offsets = np.searchsorted(days, np.arange(n_days + 1), side="left")
+    groups, keys = np.divmod(pairs, n_keys)
+    return offsets, groups.astype("int32"), keys.astype("uint32"), n_keys
+
+
+def build_daily_rollup(df, panels=TOP_N_PANELS):
+    """Pre-aggregate the top-N panel metrics per purchase day.
+
+    Row counts and sums are held as dense (day x group) arrays; distinct
+    counts keep the per-day code sets from ``day_code_sets`` so merging any
+    run of days stays exact.
+    """
+    timestamps = df[SORT_COLUMN].to_numpy(dtype="datetime64[ns]")
+    valid = ~np.isnat(timestamps)
+    frame = df.loc[valid]
+    if frame.empty:
+        return {"first_day": 0, "day_rows": np.zeros(0, dtype="int64"), "panels": {}}
+
+    days = timestamps[valid].view("int64") // NS_PER_DAY
+    first_day = int(days.min())
+    day_idx = days - first_day
+    n_days = int(day_idx.max()) + 1
+
+    codes = {}
+    code_sets = {}
+
+    def get_codes(column, sort=False):
+        if column not in codes:
+            codes[column] = factorize(frame[column], sort=sort)
+        return codes[column]
+
+    rollup_panels = {}
+    for name, (dim, measure, metric, _, _, _) in panels.items():
+        group_codes, uniques = get_codes(dim, sort=True)
+        n_groups = len(uniques)
+        entry = {"uniques": np.asarray(uniques)}
+
+        if metric == "nunique":
+            if (dim, measure) not in code_sets:
+                key_codes, keys = get_codes(measure)
+                code_sets[(dim, measure)] = day_code_sets(
+                    day_idx, group_codes, key_codes, n_days, n_groups, len(keys)
+                )
+            entry["sets"] = code_sets[(dim, measure)]
+        else:
+            has_group = group_codes >= 0
+            cells = day_idx[has_group] * n_groups + group_codes[has_group]
+            size = n_days * n_groups
+            entry["rows"] = np.bincount(cells, minlength=size).reshape(n_days, -1)
+            if metric == "sum":
+                weights = frame[measure].to_numpy(dtype="float64")[has_group]
+                entry["values"] = np.bincount(
+                    cells, weights=np.nan_to_num(weights), minlength=size
+                ).reshape(n_days, -1)
+            else:
+                entry["values"] = entry["rows"]
+        rollup_panels[name] = entry
+
+    return {
+        "first_day": first_day,
+        "day_rows": np.bincount(day_idx, minlength=n_days),
+        "panels": rollup_panels,
+    }
+
+
+def query_rollup(rollup, start_date, end_date, n=5, panels=TOP_N_PANELS):
+    """Answer the top-N panels for a date range by merging day buckets.
+
+    Returns the same dict of DataFrames as ``compute_top_n`` on the rows of
+    that range.
+    """
+    n_days = len(rollup["day_rows"])
+    lo = min(max(_day_number(start_date) - rollup["first_day"], 0), n_days)
+    hi = min(max(_day_number(end_date) - rollup["first_day"] + 1, lo), n_days)
+    if rollup["day_rows"][lo:hi].sum() == 0:
+        return empty_panels(panels)
+
+    results = {}
+    for name, (dim, measure, _, label, value_name, labeler) in panels.items():
+        entry = rollup["panels"][name]
+        uniques = entry["uniques"]
+
+        if "sets" in entry:
+            offsets, groups, keys, n_keys = entry["sets"]
+            start, stop = offsets[lo], offsets[hi]
+            # A key seen on several days counts once per group
+            pairs = pd.unique(
+                groups[start:stop].astype("int64") * n_keys + keys[start:stop]
+            )
+            values = np.bincount(pairs // n_keys, minlength=len(uniques))
+            observed = values > 0
+        else:
+            values = entry["values"][lo:hi].sum(axis=0)
+            observed = entry["rows"][lo:hi].sum(axis=0) > 0
+
+        series = pd.Series(
+            values[observed],
+            index=pd.Index(uniques[observed], name=dim),
+            name=measure or "count",
+        )
+        results[name] = format_panel(series.nlargest(n), label, value_name, labeler)
+
+    return results
+
+
+def _merge_code_sets(sets, delta_sets, shift, group_map, key_map, n_days, n_groups):
+    # Base days keep their order; from the first shared day on, the runs of
+    # both sides are merged and de-duplicated
+    offsets, groups, keys, n_keys = sets
+    groups = group_map[groups]
+    if key_map is None:
+        # Keys without fixed codes (order codes) are new in the delta
+        n_merged = n_keys + delta_sets[3]
+        delta_keys = delta_sets[2].astype("int64") + n_keys
+    else:
+        keys = key_map[keys]
+        n_merged = delta_sets[3]
+        delta_keys = delta_sets[2]
+    days = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    split = offsets[min(shift, len(offsets) - 1)]
+
+    delta_offsets = delta_sets[0]
+    delta_days = np.repeat(np.arange(len(delta_offsets) - 1), np.diff(delta_offsets))
+    n_pairs = n_groups * n_merged
+    cells = np.unique(
+        np.concatenate(
+            [
+                (days[split:] * n_groups + groups[split:]) * n_merged + keys[split:],
+                ((delta_days + shift) * n_groups + delta_sets[1]) * n_merged
+                + delta_keys,
+            ]
+        )
+    )
+    tail_days, pairs = np.divmod(cells, n_pairs)
+    tail_groups, tail_keys = np.divmod(pairs, n_merged)
+
+    days = np.concatenate([days[:split], tail_days])
+    return (
+        np.searchsorted(days, np.arange(n_days + 1), side="left"),
+        np.concatenate([groups[:split], tail_groups]).astype("int32"),
+        np.concatenate([keys[:split], tail_keys]).astype("uint32"),
+        n_merged,
+    )
+
+
+def extend_daily_rollup(rollup, frame, code_maps, panels=TOP_N_PANELS):
+    """Add the rows of ``frame``, dated no earlier than the rollup's last day.
+
+    ``frame`` holds categorical dimensions on the categories the rollup's
+    rows were re-coded to; ``code_maps`` maps each re-coded column to the
+    new codes of its old categories. The result answers queries like
+    ``build_daily_rollup`` over the rows of both.
+    """
+    delta = build_daily_rollup(frame, panels)
+    n_base = len(rollup["day_rows"])
+    if not n_base:
+        return delta
+    first_day = rollup["first_day"]
+    shift = delta["first_day"] - first_day if len(delta["day_rows"]) else n_base
+    n_days = max(n_base, shift + len(delta["day_rows"]))
+
+    day_rows = np.zeros(n_days, dtype="int64")
+    day_rows[:n_base] += rollup["day_rows"]
+    day_rows[shift : shift + len(delta["day_rows"])] += delta["day_rows"]
+
+    merged_sets = {}
+    extended = {}
+    for name, (dim, measure, metric, _, _, _) in panels.items():
+        entry = rollup["panels"][name]
+        uniques = np.asarray(factorize(frame[dim], sort=True)[1])
+        group_map = code_maps.get(dim, np.arange(len(entry["uniques"])))
+        new = delta["panels"].get(name)
+        result = {"uniques": uniques}
+
+        if "sets" in entry:
+            if (dim, measure) not in merged_sets:
+                if new:
+                    delta_sets = new["sets"]
+                else:
+                    n_keys = len(factorize(frame[measure])[1])
+                    delta_sets = (
+                        np.zeros(1, dtype="int64"),
+                        np.zeros(0, dtype="int32"),
+                        np.zeros(0, dtype="uint32"),
+                        n_keys,
+                    )
+                merged_sets[(dim, measure)] = _merge_code_sets(
+                    entry["sets"],
+                    delta_sets,
+                    shift,
+                    group_map,
+                    code_maps.get(measure),
+                    n_days,
+                    len(uniques),
+                )
+            result["sets"] = merged_sets[(dim, measure)]
+        else:
+            for key in ["rows", "values"]:
+                if key == "values" and metric == "count":
+                    result["values"] = result["rows"]
+                    continue
+                values = np.zeros((n_days, len(uniques)), dtype=entry[key].dtype)
+                values[:n_base, group_map] += entry[key]
+                if new:
+                    values[shift : shift + len(new[key])] += new[key]
+                result[key] = values
+        extended[name] = result
+
+    return {"first_day": first_day, "day_rows": day_rows, "panels": extended}
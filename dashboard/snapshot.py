@@ -0,0 +1,106 @@
+"""Prebuild what the dashboard loads at startup, e.g. when building an image.
+
+Usage:
+    python dashboard/snapshot.py --data dashboard/main_data.csv --shared
+
+Writes the star-schema tables of the source to the cache folder (as Arrow
+files with ``--shared``, for DASHBOARD_SHARED_DATA=1) and a small JSON
+record of the source's modification time, size and digest and its first
+and last purchase. While the source is unchanged, a starting dashboard
+takes its fingerprint and the date picker bounds from the record instead
+of hashing the source and scanning the purchase dates.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import pandas as pd
+
+from data_loader import (
+    CACHE_DIR,
+    CACHE_FORMAT_VERSION,
+    MANIFEST_NAME,
+    SORT_COLUMN,
+    source_fingerprint,
+)
+from star import load_star_schema
+
+
+def snapshot_path(path, cache_dir=CACHE_DIR):
+    """Location of the snapshot record kept for a source."""
+    source = hashlib.blake2b(str(Path(path).resolve()).encode(), digest_size=8)
+    return Path(cache_dir) / f"{Path(path).name}-{source.hexdigest()}-snapshot.json"
+
+
+def _stat(path):
+    # A partitioned directory changes through its manifest, as in
+    # source_fingerprint
+    if Path(path).is_dir():
+        path = Path(path) / MANIFEST_NAME
+    return os.stat(path)
+
+
+def build_snapshot(path, shared=False, cache_dir=CACHE_DIR):
+    """Build the cached tables of ``path`` and write its snapshot record."""
+    size = _stat(path).st_size
+    mtime_ns, digest = source_fingerprint(path)
+    model = load_star_schema(path, digest, cache_dir, shared=shared)
+    times = model["orders"][SORT_COLUMN].dropna()
+    record = {
+        "version": CACHE_FORMAT_VERSION,
+        "mtime_ns": mtime_ns,
+        "size": size,
+        "digest": digest,
+        "first_purchase": times.iloc[0].isoformat() if len(times) else None,
+        "last_purchase": times.iloc[-1].isoformat() if len(times) else None,
+    }
+
+    target = snapshot_path(path, cache_dir)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_suffix(f".{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(record, indent=2))
+    os.replace(tmp, target)
+    return record
+
+
+def read_snapshot(path, cache_dir=CACHE_DIR):
+    """The snapshot record of ``path``, or None if missing or out of date.
+
+    ``bounds`` holds the first and last purchase as Timestamps (or None).
+    """
+    target = snapshot_path(path, cache_dir)
+    if not target.exists():
+        return None
+    record = json.loads(target.read_text())
+    stat = _stat(path)
+    if (record["version"], record["mtime_ns"], record["size"]) != (
+        CACHE_FORMAT_VERSION,
+        stat.st_mtime_ns,
+        stat.st_size,
+    ):
+        return None
+    record["bounds"] = tuple(
+        pd.Timestamp(record[key]) if record[key] else None
+        for key in ["first_purchase", "last_purchase"]
+    )
+    return record
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data", default="dashboard/main_data.csv")
+    parser.add_argument(
+        "--shared", action="store_true", help="write mappable Arrow tables"
+    )
+    args = parser.parse_args(argv)
+
+    record = build_snapshot(args.data, args.shared)
+    print(f"Snapshot of {args.data}: {record['digest'][:16]}")
+    print(f"Purchases from {record['first_purchase']} to {record['last_purchase']}")
+
+
+if __name__ == "__main__":
+    main()
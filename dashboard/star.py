@@ -0,0 +1,275 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from aggregations import TOP_N_PANELS, compute_top_n
+from data_loader import (
+    CACHE_DIR,
+    CACHE_FORMAT_VERSION,
+    ID_COLUMNS,
+    SORT_COLUMN,
+    encode_ids,
+    map_feather,
+    merge_categories,
+    prune_cache,
+    read_source,
+    slice_date_range,
+    sort_by_timestamp,
+    source_fingerprint,
+    write_feather_atomic,
+    write_parquet_atomic,
+)
+from rollup import build_daily_rollup, extend_daily_rollup, query_rollup
+from sketches import approx_distinct_panels, key_hashes
+
+# table -> columns besides order_code, and the columns identifying one row
+STAR_TABLES = {
+    "orders": (
+        [
+            "order_id",
+            "customer_unique_id",
+            "customer_city",
+            "customer_state",
+            SORT_COLUMN,
+        ],
+        ["order_code"],
+    ),
+    "items": (
+        [
+            SORT_COLUMN,
+            "order_item_id",
+            "product_id",
+            "seller_id",
+            "product_category_name_english",
+            "price",
+        ],
+        ["order_code", "order_item_id", "product_category_name_english", "price"],
+    ),
+    "payments": (
+        [SORT_COLUMN, "payment_type", "payment_value"],
+        ["order_code", "payment_type", "payment_value"],
+    ),
+}
+
+# Each panel is aggregated at the grain its metric belongs to
+PANEL_GRAINS = {
+    "top_cities": "orders",
+    "top_states": "orders",
+    "top_categories_orders": "items",
+    "top_categories_revenue": "items",
+    "payment_counts": "payments",
+    "payment_revenue": "payments",
+}
+
+# Child tables reference orders through the integer order code
+STAR_PANELS = {
+    name: (dim, "order_code" if measure == "order_id" else measure, *rest)
+    for name, (dim, measure, *rest) in TOP_N_PANELS.items()
+}
+
+
+def build_star_schema(df):
+    """Split the flat main_data rows into orders, items and payments tables.
+
+    The flat file repeats every item once per payment of its order (and every
+    payment once per item). Here each fact lives once at its own grain, keyed
+    by a dense int32 order code. ``df`` must be sorted by purchase time, so
+    codes follow purchase order and every table stays sorted by time.
+    """
+    df = df.dropna(subset=["order_id"])
+    codes, _ = pd.factorize(df["order_id"])
+    df = df.assign(order_code=codes.astype("int32"))
+
+    model = {}
+    for table, (columns, key) in STAR_TABLES.items():
+        present = [col for col in columns if col in df.columns]
+        model[table] = (
+            df[["order_code", *present]]
+            .drop_duplicates(subset=key)
+            .sort_values("order_code", kind="stable", ignore_index=True)
+        )
+    return model
+
+
+def append_star_schema(model, df):
+    """Add the flat rows ``df``, holding orders newer than any in ``model``.
+
+    Returns ``(merged, delta, code_maps)``: the merged tables, the tables of
+    ``df`` on the merged categories and codes, and per re-coded column the
+    map from its old category codes to the new ones. Returns None when
+    ``df`` repeats an order of ``model`` or predates its latest purchase;
+    the tables must then be rebuilt.
+    """
+    delta = build_star_schema(sort_by_timestamp(df))
+    orders = model["orders"]
+    latest = orders[SORT_COLUMN].max()
+    earliest = delta["orders"][SORT_COLUMN].min()
+    if pd.notna(latest) and pd.notna(earliest) and earliest < latest:
+        return None
+
+    # Appended orders take the codes after every existing one
+    next_code = int(orders["order_code"].max()) + 1 if len(orders) else 0
+    merged, code_maps = {}, {}
+    for table, base in model.items():
+        rows = delta[table].assign(order_code=delta[table]["order_code"] + next_code)
+        for column in base.select_dtypes("category").columns:
+            dtype, base_map, rows_map = merge_categories(
+                base[column], rows[column], sort=column in ID_COLUMNS
+            )
+            code_maps[column] = base_map
+            base = base.assign(**{column: _recode(base[column], base_map, dtype)})
+            rows[column] = _recode(rows[column], rows_map, dtype)
+        if table == "orders":
+            known = np.zeros(len(rows["order_id"].cat.categories), dtype=bool)
+            known[code_maps["order_id"]] = True
+            if known[rows["order_id"].cat.codes.to_numpy()].any():
+                return None
+
+        # Undated rows stay at the end, where sort_by_timestamp put them
+        n_base = int(base[SORT_COLUMN].notna().sum())
+        n_rows = int(rows[SORT_COLUMN].notna().sum())
+        parts = [base[:n_base], rows[:n_rows], base[n_base:], rows[n_rows:]]
+        merged[table] = pd.DataFrame(
+            {column: _stack([part[column] for part in parts]) for column in base}
+        )
+        delta[table] = rows
+    return merged, delta, code_maps
+
+
+def _recode(values, code_map, dtype):
+    codes = values.cat.codes.to_numpy()
+    return pd.Categorical.from_codes(
+        np.where(codes >= 0, code_map[codes], -1), dtype=dtype
+    )
+
+
+def _stack(parts):
+    # Categoricals of one dtype are stacked by code; pd.concat would hash the
+    # labels of every part to compare their categories
+    if isinstance(parts[0].dtype, pd.CategoricalDtype):
+        return pd.Categorical.from_codes(
+            np.concatenate([part.cat.codes.to_numpy() for part in parts]),
+            dtype=parts[0].dtype,
+        )
+    return np.concatenate([part.to_numpy() for part in parts])
+
+
+def star_path(path, digest, table, cache_dir=CACHE_DIR, suffix=".parquet"):
+    """Location of one cached star-schema table for a source digest."""
+    stem = f"{Path(path).stem}-{digest[:16]}-v{CACHE_FORMAT_VERSION}"
+    return Path(cache_dir) / f"{stem}-{table}{suffix}"
+
+
+def load_star_schema(path, digest=None, cache_dir=CACHE_DIR, shared=False):
+    """Load the star-schema tables for a source, building them on first use.
+
+    With ``shared`` the tables are kept as Arrow IPC files and memory-mapped
+    (see ``map_feather``), so every process serving the dashboard reads
+    the same pages instead of holding its own copy. Building the tables
+    deletes those cached for other contents of the source (``prune_cache``).
+    """
+    if digest is None:
+        _, digest = source_fingerprint(path)
+
+    suffix = ".arrow" if shared else ".parquet"
+    targets = {
+        table: star_path(path, digest, table, cache_dir, suffix)
+        for table in STAR_TABLES
+    }
+    if not all(target.exists() for target in targets.values()):
+        model = build_star_schema(sort_by_timestamp(read_source(path)))
+        for table, target in targets.items():
+            if shared:
+                write_feather_atomic(model[table], target)
+            else:
+                write_parquet_atomic(model[table], target)
+        prune_cache(path, digest, cache_dir)
+        if not shared:
+            return model
+
+    if shared:
+        # The freshly built copy is dropped in favour of the mapped one
+        return {table: map_feather(target) for table, target in targets.items()}
+    return {
+        table: encode_ids(pd.read_parquet(target)) for table, target in targets.items()
+    }
+
+
+def slice_star(model, start_date, end_date):
+    """Restrict every table to orders purchased within the date range."""
+    return {
+        table: slice_date_range(frame, start_date, end_date)
+        for table, frame in model.items()
+    }
+
+
+def _grain_panels(grain, panels=STAR_PANELS):
+    return {name: spec for name, spec in panels.items() if PANEL_GRAINS[name] == grain}
+
+
+def compute_star_top_n(model, n=5):
+    """Compute every top-N panel, each on the table of its own grain."""
+    results = {}
+    for grain in STAR_TABLES:
+        results.update(compute_top_n(model[grain], n, _grain_panels(grain)))
+    return {name: results[name] for name in STAR_PANELS}
+
+
+def build_star_rollup(model):
+    """Build one daily rollup per grain."""
+    return {
+        grain: build_daily_rollup(model[grain], _grain_panels(grain))
+        for grain in STAR_TABLES
+    }
+
+
+def extend_star_rollup(rollups, delta, code_maps):
+    """Add the tables returned by ``append_star_schema`` to the rollups."""
+    return {
+        grain: extend_daily_rollup(
+            rollup, delta[grain], code_maps, _grain_panels(grain)
+        )
+        for grain, rollup in rollups.items()
+    }
+
+
+def query_star_rollup(rollups, start_date, end_date, n=5, panels=STAR_PANELS):
+    """Answer the top-N panels for a date range from the per-grain rollups."""
+    results = {}
+    for grain, rollup in rollups.items():
+        results.update(
+            query_rollup(rollup, start_date, end_date, n, _grain_panels(grain, panels))
+        )
+    return {name: results[name] for name in panels}
+
+
+def _distinct_panels(panels=STAR_PANELS):
+    return {
+        name: (PANEL_GRAINS[name], spec)
+        for name, spec in panels.items()
+        if spec[2] == "nunique"
+    }
+
+
+def star_key_hashes(model):
+    """Hash the key column of every distinct-count panel once per dataset."""
+    return {
+        (grain, spec[1]): key_hashes(model[grain][spec[1]])
+        for grain, spec in _distinct_panels().values()
+    }
+
+
+def approx_star_top_n(model, hashes, rollups, start_date, end_date, n=5):
+    """Every top-N panel, with the distinct counts estimated by HyperLogLog.
+
+    The rollups answer only the summed and counted panels, so the exact
+    distinct counts are not computed as well.
+    """
+    distinct = _distinct_panels()
+    exact = {name: spec for name, spec in STAR_PANELS.items() if name not in distinct}
+    results = query_star_rollup(rollups, start_date, end_date, n, exact)
+    results.update(
+        approx_distinct_panels(model, hashes, start_date, end_date, n, distinct)
+    )
+    return {name: results[name] for name in STAR_PANELS}
@@ -0,0 +1,270 @@
+"""Compute the dashboard metrics chunk by chunk for data larger than memory.
+
+Usage:
+    python dashboard/streaming.py --data dashboard/main_data.csv --chunksize 500000
+
+Each chunk is reduced to mergeable partial states: per-group sums and row
+counts, distinct (group, customer) code sets for the customer counts, and
+per-customer last purchase, order count and payment sum for RFM. Peak
+memory is one chunk plus the states, which grow with the number of groups
+and customers rather than with the number of rows.
+
+Rows of one order must be adjacent in the source, as the pipeline and the
+notebook write them. The last order of every chunk is held back until the
+next one, so each order is reduced in a single piece; that keeps the
+star-schema de-duplication of items and payments exact without a global
+set of seen orders.
+"""
+
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from aggregations import TOP_N_PANELS, empty_panels, format_panel
+from data_loader import CSV_DTYPES, SORT_COLUMN, preprocess_dataframe
+from rfm import build_rfm, empty_rfm
+from star import PANEL_GRAINS, STAR_TABLES
+
+DEFAULT_CHUNKSIZE = 500_000
+
+SAMPLE_ROWS = 10
+
+# Chunks are parsed without categories so the codes of different chunks agree
+CHUNK_DTYPES = {
+    column: "object" if dtype == "category" else dtype
+    for column, dtype in CSV_DTYPES.items()
+}
+
+
+def read_chunks(path, chunksize=DEFAULT_CHUNKSIZE, columns=None):
+    """Yield the CSV or the month partitions of ``path`` as typed chunks."""
+    if Path(path).is_dir():
+        for part in sorted(Path(path).glob("*/*.parquet")):
+            for batch in pq.ParquetFile(part).iter_batches(chunksize, columns=columns):
+                chunk = batch.to_pandas()
+                for column in chunk.select_dtypes("category").columns:
+                    chunk[column] = chunk[column].astype(object)
+                yield chunk
+    else:
+        yield from (
+            preprocess_dataframe(chunk)
+            for chunk in pd.read_csv(
+                path, dtype=CHUNK_DTYPES, usecols=columns, chunksize=chunksize
+            )
+        )
+
+
+def read_orders(path, chunksize=DEFAULT_CHUNKSIZE):
+    """Yield chunks that never split the rows of one order between them."""
+    carry = None
+    for chunk in read_chunks(path, chunksize):
+        if carry is not None:
+            chunk = pd.concat([carry, chunk], ignore_index=True)
+        order_ids = chunk["order_id"].to_numpy()
+        # Start of the trailing run of rows that share the last order id
+        tail = len(chunk)
+        while tail > 0 and order_ids[tail - 1] == order_ids[-1]:
+            tail -= 1
+        carry = chunk.iloc[tail:]
+        if tail:
+            yield chunk.iloc[:tail]
+    if carry is not None and len(carry):
+        yield carry
+
+
+def date_bounds(path, chunksize=DEFAULT_CHUNKSIZE):
+    """Earliest and latest purchase time of orders, reading two columns."""
+    first = last = None
+    for chunk in read_chunks(path, chunksize, columns=["order_id", SORT_COLUMN]):
+        times = chunk.loc[chunk["order_id"].notna(), SORT_COLUMN].dropna()
+        if len(times):
+            first = times.min() if first is None else min(first, times.min())
+            last = times.max() if last is None else max(last, times.max())
+    return first, last
+
+
+def empty_state(panels=TOP_N_PANELS):
+    """Partial state before any chunk has been merged."""
+    return {
+        "orders": 0,
+        # panel -> per-group values; for customer counts, the groups seen and
+        # the distinct group_code << 32 | customer_code pairs
+        "values": {name: pd.Series(dtype="float64") for name in panels},
+        "groups": {},
+        "pairs": {},
+        # customer ids in code order, and per-code RFM inputs
+        "customers": pd.Index([], dtype=object),
+        "last_ns": np.zeros(0, dtype="int64"),
+        "frequency": np.zeros(0, dtype="int64"),
+        "monetary": np.zeros(0, dtype="float64"),
+        "sample": None,
+    }
+
+
+def _extend_codes(index, values):
+    # Codes of ``values`` in ``index``, appending the values it lacks
+    codes = index.get_indexer(values)
+    new = codes < 0
+    if new.any():
+        index = index.append(pd.Index(pd.unique(values[new]), dtype=object))
+        codes = index.get_indexer(values)
+    return index, codes
+
+
+def _customer_codes(state, customers):
+    # Dense customer codes, growing the per-customer arrays for new customers
+    state["customers"], codes = _extend_codes(state["customers"], customers)
+    grow = len(state["customers"]) - len(state["last_ns"])
+    if grow:
+        for key, fill in [("last_ns", np.iinfo("int64").min), ("frequency", 0)]:
+            state[key] = np.concatenate([state[key], np.full(grow, fill)])
+        state["monetary"] = np.concatenate([state["monetary"], np.zeros(grow)])
+    return codes
+
+
+def merge_chunk(state, chunk, start_date, end_date, panels=TOP_N_PANELS):
+    """Reduce one chunk of whole orders within the date range into ``state``."""
+    start = pd.Timestamp(start_date)
+    stop = pd.Timestamp(end_date) + pd.Timedelta(days=1)
+    times = chunk[SORT_COLUMN]
+    chunk = chunk.loc[chunk["order_id"].notna() & (times >= start) & (times < stop)]
+    if chunk.empty:
+        return state
+
+    grains = {
+        table: chunk.drop_duplicates(subset=["order_id", *key[1:]])
+        for table, (_, key) in STAR_TABLES.items()
+    }
+    orders = grains["orders"]
+    state["orders"] += len(orders)
+
+    ordered = orders[orders["customer_unique_id"].notna()]
+    customer_codes = _customer_codes(state, ordered["customer_unique_id"].to_numpy())
+
+    for name, (dim, measure, metric, *_) in panels.items():
+        table = grains[PANEL_GRAINS[name]]
+        table = table[table[dim].notna()]
+        if metric == "nunique" and measure == "customer_unique_id":
+            # Customers recur across chunks: keep their distinct codes per group
+            groups, group_codes = _extend_codes(
+                state["groups"].get(name, pd.Index([], dtype=object)),
+                table[dim].to_numpy(),
+            )
+            has_key = table[measure].notna().to_numpy()
+            keys = _customer_codes(state, table[measure].to_numpy()[has_key])
+            pairs = (group_codes[has_key].astype("int64") << 32) | keys
+            state["groups"][name] = groups
+            state["pairs"][name] = pd.unique(
+                np.concatenate([state["pairs"].get(name, pairs[:0]), pairs])
+            )
+            continue
+        if metric == "nunique":
+            # Every order is in exactly one chunk, so distinct orders add up
+            values = table.groupby(dim)[measure].nunique()
+        elif metric == "sum":
+            values = table.groupby(dim)[measure].sum()
+        else:
+            values = table.groupby(dim).size()
+        state["values"][name] = state["values"][name].add(values, fill_value=0)
+
+    purchase_ns = ordered[SORT_COLUMN].to_numpy(dtype="datetime64[ns]").view("int64")
+    np.maximum.at(state["last_ns"], customer_codes, purchase_ns)
+    np.add.at(state["frequency"], customer_codes, 1)
+
+    # Payments reach their customer through the order
+    order_customers = pd.Series(customer_codes, index=ordered["order_id"].to_numpy())
+    payments = grains["payments"]
+    payment_customers = payments["order_id"].map(order_customers)
+    paid = payment_customers.notna().to_numpy()
+    np.add.at(
+        state["monetary"],
+        payment_customers[paid].to_numpy(dtype="int64"),
+        np.nan_to_num(payments["payment_value"].to_numpy(dtype="float64")[paid]),
+    )
+
+    # Keep the earliest orders seen so far, in the star schema's order
+    sample = pd.concat([state["sample"], orders])
+    state["sample"] = sample.sort_values(SORT_COLUMN, kind="stable").head(SAMPLE_ROWS)
+    return state
+
+
+def finish_top_n(state, n=5, panels=TOP_N_PANELS):
+    """Turn the merged state into top-N panel frames like ``compute_top_n``."""
+    results = {}
+    for name, (dim, measure, metric, label, value_name, labeler) in panels.items():
+        if name in state["pairs"]:
+            groups = state["groups"][name]
+            counts = np.bincount(state["pairs"][name] >> 32, minlength=len(groups))
+            values = pd.Series(counts, index=groups)
+        else:
+            values = state["values"][name]
+            if metric != "sum":
+                values = values.astype("int64")
+        if values.empty:
+            results[name] = empty_panels({name: panels[name]})[name]
+            continue
+        values = values.sort_index().rename_axis(dim).rename(measure or "count")
+        results[name] = format_panel(values.nlargest(n), label, value_name, labeler)
+    return results
+
+
+def finish_rfm(state):
+    """Score the merged per-customer state like ``calculate_rfm_star``."""
+    customers = state["customers"].to_numpy()
+    if not len(customers):
+        return empty_rfm()
+
+    order = np.argsort(customers, kind="stable")
+    return build_rfm(
+        customers[order],
+        np.arange(len(order)),
+        state["last_ns"][order],
+        state["frequency"][order],
+        state["monetary"][order],
+    )
+
+
+def stream_metrics(path, start_date, end_date, n=5, chunksize=DEFAULT_CHUNKSIZE):
+    """One pass over ``path``: order count, panels, RFM table and sample rows."""
+    state = empty_state()
+    for chunk in read_orders(path, chunksize):
+        merge_chunk(state, chunk, start_date, end_date)
+
+    sample = state["sample"]
+    if sample is None:
+        sample = pd.DataFrame(columns=STAR_TABLES["orders"][0])
+    return {
+        "orders": state["orders"],
+        "panels": finish_top_n(state, n),
+        "rfm": finish_rfm(state),
+        "sample": sample[STAR_TABLES["orders"][0]].reset_index(drop=True),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data", default="dashboard/main_data.csv")
+    parser.add_argument("--start", help="first purchase date (default: earliest)")
+    parser.add_argument("--end", help="last purchase date (default: latest)")
+    parser.add_argument("-n", type=int, default=5)
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE)
+    args = parser.parse_args(argv)
+
+    start, end = args.start, args.end
+    if start is None or end is None:
+        first, last = date_bounds(args.data, args.chunksize)
+        start, end = start or first.date(), end or last.date()
+
+    metrics = stream_metrics(args.data, start, end, args.n, args.chunksize)
+    print(f"{metrics['orders']} orders from {start} to {end}")
+    for name, panel in metrics["panels"].items():
+        print(f"\n{name}\n{panel.to_string(index=False)}")
+    segments = metrics["rfm"]["Customer_Segment"].value_counts(sort=False)
+    print(f"\nCustomer segments\n{segments.to_string()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""Generate synthetic Olist-shaped data with the columns of main_data.csv.
+
+Usage:
+    python dashboard/synthetic.py --rows 1000000 --output synthetic.csv
+"""
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from data_loader import TIMESTAMP_FORMAT
+from mappings import CATEGORY_MAPPING
+
+# Approximate share of customers per state in the public dataset
+STATE_WEIGHTS = {
+    "SP": 41.9, "RJ": 12.9, "MG": 11.7, "RS": 5.5, "PR": 5.1, "SC": 3.7,
+    "BA": 3.4, "DF": 2.2, "ES": 2.0, "GO": 2.0, "PE": 1.7, "CE": 1.3,
+    "PA": 1.0, "MT": 0.9, "MA": 0.8, "MS": 0.7, "PB": 0.5, "PI": 0.5,
+    "RN": 0.5, "AL": 0.4, "SE": 0.3, "TO": 0.3, "RO": 0.3, "AM": 0.1,
+    "AC": 0.1, "AP": 0.1, "RR": 0.1,
+}  # fmt: skip
+
+CITY_STATES = {
+    "sao paulo": "SP",
+    "rio de janeiro": "RJ",
+    "belo horizonte": "MG",
+    "brasilia": "DF",
+    "curitiba": "PR",
+}
+
+PAYMENT_WEIGHTS = {
+    "credit_card": 0.739,
+    "boleto": 0.190,
+    "voucher": 0.056,
+    "debit_card": 0.015,
+}
+
+N_CITIES = 4_100
+FIRST_PURCHASE = pd.Timestamp("2016-09-04")
+LAST_PURCHASE = pd.Timestamp("2018-10-17")
+
+# Lower bound on the average rows per order after the items x payments fan-out,
+# so enough orders are drawn before trimming to the requested row count
+ROWS_PER_ORDER = 1.1
+
+
+def _hex_ids(values, prefix):
+    # 32-character lowercase hex ids, like the Olist keys
+    return [f"{prefix}{value:031x}" for value in values]
+
+
+def _zipf_weights(n, exponent=1.1):
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    return weights / weights.sum()
+
+
+def generate_main_data(rows, seed=0):
+    """Return a deterministic frame of ``rows`` main_data.csv-style rows.
+
+    Cities follow a Zipf distribution (São Paulo first), states and payment
+    types follow the public dataset's shares, and about 3% of customers
+    place repeat orders. Orders carry one or more items and payments, and
+    each order contributes items x payments rows like the merged file.
+    """
+    rng = np.random.default_rng(seed)
+    n_orders = max(int(rows / ROWS_PER_ORDER), 1)
+
+    # Customers: most buy once, a small pool of regulars takes a skewed tail
+    n_customers = max(int(n_orders * 0.97), 1)
+    n_regulars = max(n_customers // 100, 1)
+    regular = rng.choice(n_regulars, n_orders, p=_zipf_weights(n_regulars, 0.7))
+    order_customer = np.where(
+        rng.random(n_orders) < 0.97,
+        rng.permutation(n_orders) % n_customers,
+        rng.permutation(n_customers)[regular],
+    )
+
+    states = np.array(list(STATE_WEIGHTS))
+    state_p = np.array(list(STATE_WEIGHTS.values()))
+    cities = np.array(
+        list(CITY_STATES)
+        + [f"cidade {i:04d}" for i in range(N_CITIES - len(CITY_STATES))]
+    )
+    city_states = np.concatenate(
+        [
+            np.array(list(CITY_STATES.values())),
+            rng.choice(states, N_CITIES - len(CITY_STATES), p=state_p / state_p.sum()),
+        ]
+    )
+    customer_city = rng.choice(N_CITIES, n_customers, p=_zipf_weights(N_CITIES))
+
+    # Purchases grow over time: sample a rising density across the period
+    span = (LAST_PURCHASE - FIRST_PURCHASE).total_seconds()
+    offsets = np.sqrt(rng.random(n_orders)) * span
+    purchase = FIRST_PURCHASE + pd.to_timedelta(offsets.astype("int64"), unit="s")
+
+    # Fan-out: items per order and payments per order
+    n_items = rng.geometric(0.88, n_orders)
+    n_payments = np.where(rng.random(n_orders) < 0.03, rng.integers(2, 4, n_orders), 1)
+    fanout = n_items * n_payments
+    order_row = np.repeat(np.arange(n_orders), fanout)[:rows]
+
+    # Position of each row inside its order's items x payments grid
+    start = np.repeat(np.cumsum(fanout) - fanout, fanout)[:rows]
+    cell = np.arange(len(order_row)) - start
+    item_no = cell // n_payments[order_row] + 1
+    payment_no = cell % n_payments[order_row]
+
+    categories = np.array(list(CATEGORY_MAPPING) + ["Unknown"])
+    item_category = rng.choice(
+        len(categories), (n_orders, 4), p=_zipf_weights(len(categories), 0.9)
+    )
+    item_price = np.round(rng.lognormal(4.2, 0.9, (n_orders, 4)), 2)
+    capped_item = np.minimum(item_no - 1, 3)
+
+    payment_types = np.array(list(PAYMENT_WEIGHTS))
+    payment_p = np.array(list(PAYMENT_WEIGHTS.values()))
+    order_payment = rng.choice(
+        len(payment_types), (n_orders, 3), p=payment_p / payment_p.sum()
+    )
+    order_total = item_price.sum(axis=1) * rng.uniform(1.05, 1.25, n_orders)
+    payment_value = np.round(order_total / n_payments, 2)
+
+    customer = order_customer[order_row]
+    city = customer_city[customer]
+    return pd.DataFrame(
+        {
+            "customer_unique_id": _hex_ids(customer, "c"),
+            "customer_city": cities[city],
+            "customer_state": city_states[city],
+            "order_id": _hex_ids(order_row, "a"),
+            "order_purchase_timestamp": purchase[order_row].strftime(TIMESTAMP_FORMAT),
+            "order_item_id": item_no,
+            "price": item_price[order_row, capped_item],
+            "product_category_name_english": categories[
+                item_category[order_row, capped_item]
+            ],
+            "payment_type": payment_types[order_payment[order_row, payment_no]],
+            "payment_value": payment_value[order_row],
+        }
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="synthetic_main_data.csv")
+    args = parser.parse_args(argv)
+
+    generate_main_data(args.rows, args.seed).to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""Monthly new-customer and category-order trends from month pre-aggregates.
+
+``build_trends`` runs once per loaded model. It indexes the month of every
+customer's first purchase and counts, per purchase month, the customers
+new that month and the distinct orders of every product category. A date
+range then selects a few dozen monthly rows instead of regrouping every
+order line. Months are whole: a range ending mid-month shows that month's
+full count.
+"""
+
+import numpy as np
+import pandas as pd
+
+from aggregations import distinct_counts, factorize
+from data_loader import SORT_COLUMN
+from mappings import CATEGORY_MAPPING, map_labels
+
+
+def month_numbers(timestamps):
+    """Months since the Unix epoch per timestamp; missing ones get -1."""
+    values = timestamps.to_numpy(dtype="datetime64[ns]")
+    months = values.astype("datetime64[M]").astype("int64")
+    months[np.isnat(values)] = -1
+    return months
+
+
+def _month_number(value):
+    return int(np.datetime64(pd.Timestamp(value), "M").astype("int64"))
+
+
+def month_span(start_date, end_date):
+    """First and last day of the whole months overlapping a date range."""
+    start = pd.Timestamp(start_date).to_period("M")
+    end = pd.Timestamp(end_date).to_period("M")
+    return start.start_time.date(), end.end_time.date()
+
+
+def monthly_counts(model, trends):
+    """New customers and per-category orders of ``model`` on the trend months.
+
+    ``model`` may be a slice of the tables the trends were built on: a
+    customer counts as new in a month when one of its orders there falls
+    in the month of its first purchase overall.
+    """
+    first_month, n_months = trends["first_month"], len(trends["months"])
+    orders, items = model["orders"], model["items"]
+
+    months = month_numbers(orders[SORT_COLUMN]) - trends["start_month"]
+    customers, _ = factorize(orders["customer_unique_id"])
+    valid = (months >= 0) & (customers >= 0)
+    new = np.zeros(len(orders), dtype=bool)
+    new[valid] = months[valid] == first_month[customers[valid]]
+    new_customers = distinct_counts(
+        months[new], customers[new], n_months, len(first_month)
+    )
+
+    # Distinct orders per (month, category) cell, as one flat group code
+    n_categories = len(trends["categories"])
+    months = month_numbers(items[SORT_COLUMN]) - trends["start_month"]
+    categories, _ = factorize(items["product_category_name_english"])
+    categories = np.where(categories >= 0, trends["category_codes"][categories], -1)
+    valid = (months >= 0) & (categories >= 0)
+    order_codes = items["order_code"].to_numpy(dtype="int64")
+    cells = np.where(valid, months * n_categories + categories, -1)
+    category_orders = distinct_counts(
+        cells,
+        order_codes,
+        n_months * n_categories,
+        int(order_codes.max()) + 1 if len(order_codes) else 0,
+    ).reshape(n_months, n_categories)
+    return {"new_customers": new_customers, "category_orders": category_orders}
+
+
+def build_trends(model):
+    """Index first purchases and pre-aggregate the trend metrics per month."""
+    orders = model["orders"]
+    months = month_numbers(orders[SORT_COLUMN])
+    customers, customer_ids = factorize(orders["customer_unique_id"])
+    valid = (months >= 0) & (customers >= 0)
+    if not valid.any():
+        start_month, n_months = 0, 0
+    else:
+        start_month = int(months[valid].min())
+        n_months = int(months[valid].max()) - start_month + 1
+
+    # Month of each customer's first purchase, counted from start_month
+    first_month = np.full(len(customer_ids), np.iinfo("int64").max)
+    np.minimum.at(first_month, customers[valid], months[valid] - start_month)
+
+    # Raw categories sharing a display label are counted as one
+    labels = map_labels(
+        pd.Series(model["items"]["product_category_name_english"].cat.categories),
+        mapping=CATEGORY_MAPPING,
+    )
+    category_codes, categories = pd.factorize(labels)
+
+    trends = {
+        "start_month": start_month,
+        "months": pd.date_range(
+            np.datetime64(start_month, "M"), periods=n_months, freq="MS"
+        ),
+        "first_month": first_month,
+        "category_codes": category_codes,
+        "categories": categories,
+    }
+    trends.update(monthly_counts(model, trends))
+    return trends
+
+
+def query_trends(trends, start_date, end_date, n=5, counts=None):
+    """Trend frames of the months overlapping a date range.
+
+    ``counts`` are the ``monthly_counts`` of a filtered slice, cut to the
+    ``month_span`` of the range so its edge months are whole; by default
+    the pre-aggregates of the whole model are used. Returns the new
+    customers per month and the monthly orders of the top-``n`` categories
+    over the range.
+    """
+    counts = counts or trends
+    n_months = len(trends["months"])
+    lo = min(max(_month_number(start_date) - trends["start_month"], 0), n_months)
+    hi = min(max(_month_number(end_date) - trends["start_month"] + 1, lo), n_months)
+    months = trends["months"][lo:hi]
+
+    new_customers = pd.DataFrame(
+        {"Month": months, "New Customers": counts["new_customers"][lo:hi]}
+    )
+
+    # An order lies in one month, so monthly distinct counts add up exactly
+    category_orders = counts["category_orders"][lo:hi]
+    totals = category_orders.sum(axis=0)
+    top = np.argsort(-totals, kind="stable")[:n]
+    top = top[totals[top] > 0]
+    category_trends = pd.DataFrame(
+        {
+            "Month": np.tile(months, len(top)),
+            "Category": np.repeat(trends["categories"][top], len(months)),
+            "Orders": category_orders[:, top].T.ravel(),
+        }
+    )
+    return {"new_customers": new_customers, "category_trends": category_trends}
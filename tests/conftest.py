@@ -0,0 +1,33 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# The dashboard modules import each other as top-level modules
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "dashboard"))
+
+from data_loader import read_source
+from star import load_star_schema
+from synthetic import generate_main_data
+
+SYNTHETIC_ROWS = 3_000
+
+
+@pytest.fixture(scope="session")
+def data_path(tmp_path_factory):
+    """A synthetic main_data.csv shared by the whole session."""
+    path = tmp_path_factory.mktemp("data") / "main_data.csv"
+    generate_main_data(SYNTHETIC_ROWS).to_csv(path, index=False)
+    return path
+
+
+@pytest.fixture(scope="session")
+def flat(data_path):
+    """The typed, time-sorted rows of ``data_path``."""
+    return read_source(data_path)
+
+
+@pytest.fixture(scope="session")
+def model(data_path, tmp_path_factory):
+    """The star-schema tables of ``data_path``, cached in a scratch folder."""
+    return load_star_schema(data_path, cache_dir=tmp_path_factory.mktemp("cache"))
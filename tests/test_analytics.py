@@ -0,0 +1,78 @@
+import json
+import threading
+import urllib.request
+
+import pytest
+from pandas.testing import assert_frame_equal
+
+from analytics import compute_report, make_server, report_json
+from rfm import calculate_rfm_star, customer_totals
+from star import build_star_rollup, build_star_schema, compute_star_top_n
+
+
+@pytest.fixture(scope="module")
+def dataset(model):
+    # What open_dataset returns, on the scratch-cached model
+    customers, totals = customer_totals(model)
+    return {
+        "model": model,
+        "rollup": build_star_rollup(model),
+        "customers": customers,
+        "totals": totals,
+        "key_hashes": None,
+        "filter_index": None,
+    }
+
+
+SELECTIONS = [
+    {"customer_state": ["SP"]},
+    {"customer_state": ["RJ", "MG"], "payment_type": ["boleto"]},
+    {"product_category_name_english": ["health_beauty", "toys"]},
+    {"product_category_name_english": ["toys"], "payment_type": ["credit_card"]},
+]
+
+
+@pytest.mark.parametrize("selections", SELECTIONS)
+def test_filtered_report_matches_filtered_rows(dataset, flat, selections):
+    mask = True
+    for column, labels in selections.items():
+        mask = mask & flat[column].isin(labels)
+    # The flat rows of the selected values hold every fact the filters keep
+    expected = build_star_schema(flat[mask])
+
+    report = compute_report(dataset, n=10, selections=selections)
+    assert report["orders"] == len(expected["orders"])
+    assert report["filters"] == dict(sorted(selections.items()))
+    for name, panel in compute_star_top_n(expected, 10).items():
+        assert_frame_equal(report["panels"][name], panel, check_dtype=False)
+    assert_frame_equal(report["rfm"], calculate_rfm_star(expected))
+
+
+def test_empty_selections_do_not_filter(dataset):
+    unfiltered = compute_report(dataset)
+    report = compute_report(dataset, selections={"customer_state": []})
+    assert report["filters"] == {}
+    assert report["orders"] == unfiltered["orders"]
+
+
+def test_unknown_filter_column(dataset):
+    with pytest.raises(ValueError):
+        compute_report(dataset, selections={"customer_city": ["sao paulo"]})
+
+
+def test_http_filters(dataset):
+    server = make_server(dataset, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        url = (
+            f"http://127.0.0.1:{server.server_port}/metrics"
+            "?n=3&state=SP&state=RJ&payment-type=boleto"
+        )
+        with urllib.request.urlopen(url) as response:
+            body = json.load(response)
+    finally:
+        server.shutdown()
+    selections = {"customer_state": ["SP", "RJ"], "payment_type": ["boleto"]}
+    expected = report_json(compute_report(dataset, n=3, selections=selections))
+    assert body == json.loads(json.dumps(expected))
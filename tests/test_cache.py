@@ -0,0 +1,37 @@
+import shutil
+
+import pandas as pd
+
+from data_loader import source_fingerprint
+from star import STAR_TABLES, load_star_schema, star_path
+
+
+def test_rebuild_deletes_superseded_tables(data_path, tmp_path):
+    source = tmp_path / "main_data.csv"
+    shutil.copy(data_path, source)
+    cache_dir = tmp_path / "cache"
+    load_star_schema(source, cache_dir=cache_dir)
+    load_star_schema(source, cache_dir=cache_dir, shared=True)
+    # Files of another source, an older layout and a write in progress
+    kept = [
+        "other-0123456789abcdef-v1-orders.parquet",
+        "main_data-0123456789abcdef-v4-orders.parquet.123.tmp",
+    ]
+    stale = ["main_data-0123456789abcdef-v1.parquet"]
+    for name in kept + stale:
+        (cache_dir / name).touch()
+
+    # The source gains its first rows again at the end
+    rows = pd.read_csv(source, nrows=10)
+    rows.to_csv(source, mode="a", header=False, index=False)
+    model = load_star_schema(source, cache_dir=cache_dir)
+
+    _, digest = source_fingerprint(source)
+    current = {
+        star_path(source, digest, table, cache_dir).name for table in STAR_TABLES
+    }
+    assert {path.name for path in cache_dir.iterdir()} == current | set(kept)
+    # Only the star tables are cached and read back
+    reloaded = load_star_schema(source, cache_dir=cache_dir)
+    for table in STAR_TABLES:
+        assert len(reloaded[table]) == len(model[table])
@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from catalog import PRODUCT_BUCKETS, build_catalog_index, query_catalog
+from data_loader import encode_ids
+from star import build_star_schema, slice_star
+
+N_SELLERS = 40
+N_PRODUCTS = 60
+
+
+@pytest.fixture(scope="module")
+def items_model(flat):
+    # Every item row gets a seller and a product; a few of each are missing
+    # from the catalogs below
+    rng = np.random.default_rng(7)
+    ids = flat.assign(
+        seller_id=[f"s{i:02d}" for i in rng.integers(0, N_SELLERS, len(flat))],
+        product_id=[f"p{i:02d}" for i in rng.integers(0, N_PRODUCTS, len(flat))],
+    )
+    return build_star_schema(encode_ids(ids))
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    rng = np.random.default_rng(11)
+    sellers = pd.DataFrame(
+        {
+            "seller_id": [f"s{i:02d}" for i in range(N_SELLERS - 5)],
+            "seller_city": rng.choice(["sao paulo", "curitiba", "ibitinga"], 35),
+            "seller_state": rng.choice(["SP", "PR", "MG", "RJ"], 35),
+        }
+    ).astype("string")
+    products = pd.DataFrame(
+        {
+            "product_id": pd.array(
+                [f"p{i:02d}" for i in range(N_PRODUCTS - 5)], dtype="string"
+            ),
+            "weight": rng.integers(0, 5, 55),
+            "size": rng.integers(0, 5, 55),
+        }
+    )
+    return {"sellers": sellers, "products": products}
+
+
+def _naive_panels(items, catalog):
+    # The same panels by merging the item rows with the catalogs
+    items = items.assign(
+        seller_id=items["seller_id"].astype("string"),
+        product_id=items["product_id"].astype("string"),
+        price=items["price"].fillna(0.0),
+    )
+    sold = items.merge(catalog["sellers"], on="seller_id")
+    panels = {}
+    for column in ["seller_state", "seller_city"]:
+        grouped = sold.groupby(column)
+        panels[f"{column}_active"] = grouped["seller_id"].nunique()
+        panels[f"{column}_revenue"] = grouped["price"].sum()
+    merged = items.merge(catalog["products"], on="product_id")
+    for name, (_, labels) in PRODUCT_BUCKETS.items():
+        revenue = merged.groupby(name)["price"].sum()
+        panels[f"{name}_revenue"] = revenue.reindex(range(len(labels)), fill_value=0)
+    return panels
+
+
+@pytest.mark.parametrize(
+    "start, end",
+    [
+        ("2016-01-01", "2019-01-01"),
+        ("2017-01-01", "2017-12-31"),
+        # Before the first purchase: every panel is empty
+        ("2015-01-01", "2015-12-31"),
+    ],
+)
+def test_catalog_panels_match_naive_merge(items_model, catalog, start, end):
+    index = build_catalog_index(items_model, catalog)
+    sliced = slice_star(items_model, start, end)
+    panels = query_catalog(index, sliced, n=50)
+    expected = _naive_panels(sliced["items"], catalog)
+
+    for column in ["seller_state", "seller_city"]:
+        for metric, value_name in [
+            ("active", "Number of Sellers"),
+            ("revenue", "Total Revenue"),
+        ]:
+            got = panels[f"{column}_{metric}"]
+            # Labels are mapped for display; compare values in ranked order
+            want = expected[f"{column}_{metric}"].sort_values(ascending=False)
+            assert len(got) == len(want)
+            np.testing.assert_allclose(got[value_name].to_numpy(), want.to_numpy())
+    for name in PRODUCT_BUCKETS:
+        np.testing.assert_allclose(
+            panels[f"{name}_revenue"]["Total Revenue"].to_numpy(),
+            expected[f"{name}_revenue"].to_numpy(),
+        )
+
+
+def test_catalog_index_needs_item_ids(model, catalog):
+    # The synthetic main_data.csv carries no seller or product IDs
+    assert build_catalog_index(model, catalog) is None
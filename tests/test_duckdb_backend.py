@@ -0,0 +1,105 @@
+import datetime
+import threading
+from pathlib import Path
+
+import pytest
+from pandas.testing import assert_frame_equal
+
+import duckdb_backend
+from rfm import calculate_rfm_star
+from star import compute_star_top_n, slice_star
+
+START, END = datetime.date(2017, 6, 1), datetime.date(2018, 5, 31)
+
+
+def range_tables(con):
+    query = "SELECT database_name || '.' || table_name FROM duckdb_tables()"
+    return sorted(name for (name,) in con.execute(query).fetchall())
+
+
+@pytest.fixture
+def con(data_path):
+    return duckdb_backend.connect(data_path)
+
+
+def test_range_materialized_once(con):
+    duckdb_backend.count_orders(con, START, END)
+    tables = range_tables(con)
+    assert tables == ["range_0.items", "range_0.orders", "range_0.payments"]
+
+    # The other queries of a rerun read the same tables
+    duckdb_backend.query_top_n(con, START, END)
+    duckdb_backend.query_rfm(con, START, END)
+    duckdb_backend.sample_orders(con, START, END)
+    assert range_tables(con) == tables
+
+
+def test_ranges_kept_within_size(con):
+    days = [datetime.date(2018, 1, day) for day in range(1, 8)]
+    for day in days:
+        duckdb_backend.count_orders(con, day, day)
+    assert len(range_tables(con)) == 3 * len(days)
+
+
+def test_least_recent_range_evicted(con, model, monkeypatch):
+    # Every range is over the budget, so only the most recent one is kept
+    monkeypatch.setattr(duckdb_backend, "MAX_RANGE_BYTES", 0)
+    days = [datetime.date(2018, 1, day) for day in range(1, 8)]
+    for day in days:
+        duckdb_backend.count_orders(con, day, day)
+    assert range_tables(con) == ["range_6.items", "range_6.orders", "range_6.payments"]
+    folder = duckdb_backend._materialized[con]["folder"]
+    assert [path.name for path in Path(folder).iterdir()] == ["range_6.duckdb"]
+
+    # An evicted range is rebuilt and still matches the pandas path
+    filtered = slice_star(model, days[0], days[0])
+    assert duckdb_backend.count_orders(con, days[0], days[0]) == len(filtered["orders"])
+
+
+def test_materialized_tables_match_pandas_path(con, model):
+    filtered = slice_star(model, START, END)
+    for _ in range(2):
+        assert_frame_equal(
+            duckdb_backend.query_top_n(con, START, END)["top_cities"],
+            compute_star_top_n(filtered)["top_cities"],
+            check_dtype=False,
+        )
+        assert_frame_equal(
+            duckdb_backend.query_rfm(con, START, END),
+            calculate_rfm_star(filtered),
+            check_dtype=False,
+        )
+
+
+def test_evicted_between_lookup_and_query(con):
+    expected = duckdb_backend.count_orders(con, START, END)
+    # Another session dropped the tables after this one looked them up
+    for name in range_tables(con):
+        con.execute(f"DROP TABLE {name}")
+    assert duckdb_backend.count_orders(con, START, END) == expected
+
+
+def test_build_does_not_block_other_ranges(con, monkeypatch):
+    other = datetime.date(2018, 1, 1)
+    expected = duckdb_backend.count_orders(con, START, END)
+    started, release = threading.Event(), threading.Event()
+    literal = duckdb_backend._literal
+
+    def slow_literal(path):
+        # Holds the build of a new range open at its ATTACH
+        if str(path).endswith(".duckdb"):
+            started.set()
+            release.wait(5)
+        return literal(path)
+
+    monkeypatch.setattr(duckdb_backend, "_literal", slow_literal)
+    worker = threading.Thread(
+        target=duckdb_backend.count_orders, args=(con, other, other)
+    )
+    worker.start()
+    started.wait(5)
+    # A cached range answers while the other one is being built
+    assert duckdb_backend.count_orders(con, START, END) == expected
+    assert worker.is_alive()
+    release.set()
+    worker.join()
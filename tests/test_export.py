@@ -0,0 +1,68 @@
+import io
+
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+from pandas.testing import assert_frame_equal
+
+from export import export_chunks, main, table_batches
+from filters import build_filter_index, filter_star
+
+START, END = pd.Timestamp("2016-01-01").date(), pd.Timestamp("2019-01-01").date()
+
+# Few rows spread over many batches: most batches, the first included,
+# are empty after filtering
+SPARSE = {"customer_state": ["RR", "SE"]}
+
+
+@pytest.fixture(scope="module")
+def index(model):
+    return build_filter_index(model)
+
+
+def _expected(model, index, table, selections):
+    rows = filter_star(model, index, START, END, selections)[table]
+    if table == "orders":
+        return rows.drop(columns="order_code")
+    ids = model["orders"].set_index("order_code")["order_id"]
+    return rows.assign(order_id=ids.loc[rows["order_code"]].to_numpy())[
+        ["order_id", *rows.columns.drop("order_code")]
+    ]
+
+
+@pytest.mark.parametrize("table", ["orders", "items", "payments"])
+@pytest.mark.parametrize("selections", [SPARSE, {"customer_state": ["XX"]}])
+def test_sparse_filter_parquet_round_trip(model, index, table, selections):
+    batches = table_batches(model, table, START, END, index, selections, 50)
+    data = b"".join(export_chunks(batches, "parquet"))
+    got = pq.read_table(io.BytesIO(data)).to_pandas()
+
+    expected = _expected(model, index, table, selections).reset_index(drop=True)
+    assert list(got.columns) == list(expected.columns)
+    assert_frame_equal(
+        got, expected.astype(got.dtypes.to_dict()), check_categorical=False
+    )
+
+
+def test_cli_sparse_filter(model, data_path, tmp_path, monkeypatch):
+    # The session's model, instead of a cache in dashboard/.cache
+    monkeypatch.setattr("export.load_star_schema", lambda path: model)
+    target = tmp_path / "orders.parquet"
+    main(
+        [
+            "orders",
+            "--data",
+            str(data_path),
+            "--output",
+            str(target),
+            "--format",
+            "parquet",
+            "--state",
+            "RR",
+            "--batch-rows",
+            "50",
+        ]
+    )
+    orders = pq.read_table(target).to_pandas()
+    assert len(orders) > 0
+    assert (orders["customer_state"] == "RR").all()
@@ -0,0 +1,45 @@
+import threading
+
+import numpy as np
+
+from instrumentation import RerunTrace
+
+BUFFER_BYTES = 8 * 2**20
+
+
+def test_concurrent_stages_do_not_wait_or_reset_peaks():
+    first, second = RerunTrace(True), RerunTrace(True)
+    allocated, released = threading.Event(), threading.Event()
+
+    def allocate():
+        with first.stage("aggregate"):
+            buffer = np.ones(BUFFER_BYTES, dtype=np.uint8)
+            del buffer
+            allocated.set()
+            # Held open until the other rerun's stage has run to its end
+            released.wait(5)
+
+    worker = threading.Thread(target=allocate)
+    worker.start()
+    allocated.wait(5)
+    with second.stage("filter"):
+        pass
+    released.set()
+    worker.join()
+    first.finish()
+    second.finish()
+
+    # The second stage ran while the first was still open
+    assert second.stages[0]["seconds"] < 1
+    assert first.stages[0]["peak_bytes"] >= BUFFER_BYTES
+    assert first.stages[0]["overlapped"] and second.stages[0]["overlapped"]
+
+
+def test_lone_stage_is_not_overlapped():
+    trace = RerunTrace(True)
+    with trace.stage("filter"):
+        buffer = np.ones(BUFFER_BYTES, dtype=np.uint8)
+        del buffer
+    trace.finish()
+    assert trace.stages[0]["peak_bytes"] >= BUFFER_BYTES
+    assert not trace.stages[0]["overlapped"]
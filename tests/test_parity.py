@@ -0,0 +1,138 @@
+"""Every backend against the pandas path on the same synthetic rows."""
+
+import datetime
+
+import pytest
+from pandas.testing import assert_frame_equal
+
+import duckdb_backend
+import streaming
+from aggregations import (
+    compute_top_n,
+    get_payment_counts,
+    get_payment_revenue,
+    get_top_categories_by_orders,
+    get_top_categories_by_revenue,
+    get_top_cities,
+    get_top_states,
+)
+from rfm import calculate_rfm, calculate_rfm_star, customer_totals, rfm_from_totals
+from star import (
+    build_star_rollup,
+    build_star_schema,
+    compute_star_top_n,
+    query_star_rollup,
+    slice_star,
+)
+
+GET_FUNCTIONS = {
+    "top_cities": get_top_cities,
+    "top_states": get_top_states,
+    "top_categories_orders": get_top_categories_by_orders,
+    "top_categories_revenue": get_top_categories_by_revenue,
+    "payment_counts": get_payment_counts,
+    "payment_revenue": get_payment_revenue,
+}
+
+RANGES = [
+    (datetime.date(2016, 1, 1), datetime.date(2019, 1, 1)),
+    (datetime.date(2017, 3, 1), datetime.date(2018, 2, 28)),
+    (datetime.date(2018, 8, 1), datetime.date(2018, 8, 1)),
+    # Before the first purchase: every panel is empty
+    (datetime.date(2015, 1, 1), datetime.date(2015, 12, 31)),
+]
+
+
+def assert_panels_equal(expected, actual):
+    assert list(actual) == list(expected)
+    for name, panel in expected.items():
+        assert_frame_equal(
+            actual[name].reset_index(drop=True),
+            panel.reset_index(drop=True),
+            check_dtype=False,
+            check_index_type=False,
+            obj=name,
+        )
+
+
+def single_row_orders(flat):
+    # Orders without the items x payments fan-out, where the flat rows and
+    # the star-schema tables hold the same facts
+    sizes = flat.groupby("order_id", observed=True)["order_id"].transform("size")
+    return flat[sizes == 1]
+
+
+@pytest.mark.parametrize("n", [1, 5, 50])
+def test_compute_top_n_matches_get_functions(flat, n):
+    panels = compute_top_n(flat, n)
+    assert_panels_equal(
+        {name: get(flat, n) for name, get in GET_FUNCTIONS.items()}, panels
+    )
+
+
+def test_compute_top_n_empty(flat):
+    assert_panels_equal(
+        {name: get(flat.iloc[:0]) for name, get in GET_FUNCTIONS.items()},
+        compute_top_n(flat.iloc[:0]),
+    )
+
+
+def test_star_matches_flat_rows(flat):
+    rows = single_row_orders(flat)
+    assert_panels_equal(
+        compute_top_n(rows), compute_star_top_n(build_star_schema(rows))
+    )
+
+
+@pytest.mark.parametrize("start, end", RANGES)
+def test_rollup_matches_pandas_path(model, start, end):
+    expected = compute_star_top_n(slice_star(model, start, end))
+    assert_panels_equal(
+        expected, query_star_rollup(build_star_rollup(model), start, end)
+    )
+
+
+@pytest.mark.parametrize("start, end", RANGES)
+def test_streaming_matches_pandas_path(model, data_path, start, end):
+    filtered = slice_star(model, start, end)
+    # Small chunks split orders across chunk boundaries
+    result = streaming.stream_metrics(data_path, start, end, chunksize=257)
+    assert result["orders"] == len(filtered["orders"])
+    assert_panels_equal(compute_star_top_n(filtered), result["panels"])
+    assert_frame_equal(result["rfm"], calculate_rfm_star(filtered), check_dtype=False)
+
+
+@pytest.mark.parametrize("start, end", RANGES)
+def test_duckdb_matches_pandas_path(model, data_path, start, end):
+    filtered = slice_star(model, start, end)
+    con = duckdb_backend.connect(data_path)
+    assert duckdb_backend.count_orders(con, start, end) == len(filtered["orders"])
+    assert_panels_equal(
+        compute_star_top_n(filtered), duckdb_backend.query_top_n(con, start, end)
+    )
+    assert_frame_equal(
+        duckdb_backend.query_rfm(con, start, end),
+        calculate_rfm_star(filtered),
+        check_dtype=False,
+    )
+
+
+def test_rfm_star_matches_calculate_rfm(flat):
+    rows = single_row_orders(flat)
+    expected = calculate_rfm(rows)
+    assert len(expected) > 0
+    assert_frame_equal(calculate_rfm_star(build_star_schema(rows)), expected)
+
+
+def test_rfm_from_totals_matches_calculate_rfm_star(model):
+    assert_frame_equal(
+        rfm_from_totals(*customer_totals(model)), calculate_rfm_star(model)
+    )
+
+
+def test_rfm_empty_range(flat, model):
+    start, end = RANGES[-1]
+    expected = calculate_rfm(flat.iloc[:0])
+    actual = calculate_rfm_star(slice_star(model, start, end))
+    assert expected.empty and actual.empty
+    assert list(actual.columns) == list(expected.columns)
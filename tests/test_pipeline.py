@@ -0,0 +1,95 @@
+import pandas as pd
+
+from data_loader import MANIFEST_NAME
+from pipeline import RAW_TABLES, partition_path, run_pipeline
+
+
+def write_raw(folder, orders):
+    # Two months of orders; p2 has no category and p3 no English one
+    tables = {
+        "customers": pd.DataFrame(
+            {
+                "customer_id": ["c1", "c2", "c3"],
+                "customer_unique_id": ["u1", "u2", "u3"],
+                "customer_city": ["sao paulo", "curitiba", "rio de janeiro"],
+                "customer_state": ["SP", "PR", "RJ"],
+            }
+        ),
+        "orders": orders,
+        "items": pd.DataFrame(
+            {
+                "order_id": ["o1", "o2", "o3"],
+                "order_item_id": [1, 1, 1],
+                "product_id": ["p1", "p2", "p3"],
+                "seller_id": ["s1", "s1", "s2"],
+                "price": [10.0, None, 30.0],
+            }
+        ),
+        "payments": pd.DataFrame(
+            {
+                "order_id": ["o1", "o2", "o3"],
+                "payment_type": ["boleto", "credit_card", "voucher"],
+                "payment_value": [10.0, 20.0, 30.0],
+            }
+        ),
+        "products": pd.DataFrame(
+            {
+                "product_id": ["p1", "p2", "p3"],
+                "product_category_name": ["brinquedos", None, "pc_gamer"],
+            }
+        ),
+        "translation": pd.DataFrame(
+            {
+                "product_category_name": ["brinquedos"],
+                "product_category_name_english": ["toys"],
+            }
+        ),
+    }
+    for table, frame in tables.items():
+        frame.to_csv(folder / RAW_TABLES[table][0], index=False)
+
+
+ORDERS = pd.DataFrame(
+    {
+        "order_id": ["o1", "o2", "o3"],
+        "customer_id": ["c1", "c2", "c3"],
+        "order_purchase_timestamp": [
+            "2018-01-05 10:00:00",
+            "2018-01-20 11:00:00",
+            "2018-02-03 12:00:00",
+        ],
+    }
+)
+
+
+def test_unknown_categories_kept_like_the_notebook(tmp_path):
+    write_raw(tmp_path, ORDERS)
+    output = tmp_path / "main_data"
+    run_pipeline(tmp_path, output)
+
+    rows = pd.read_parquet(output).sort_values("order_id")
+    assert rows["order_id"].tolist() == ["o1", "o2", "o3"]
+    assert rows["product_category_name_english"].tolist() == [
+        "toys",
+        "Unknown",
+        "Unknown",
+    ]
+    # Only the missing price takes the median
+    assert rows["price"].tolist() == [10.0, 20.0, 30.0]
+
+
+def test_stale_partition_already_removed(tmp_path):
+    write_raw(tmp_path, ORDERS)
+    output = tmp_path / "main_data"
+    run_pipeline(tmp_path, output)
+
+    # February's only order is gone, and so is its partition folder
+    partition_path(output, "2018-02").unlink()
+    partition_path(output, "2018-02").parent.rmdir()
+    write_raw(tmp_path, ORDERS.iloc[:2])
+    run_pipeline(tmp_path, output)
+
+    assert sorted(path.name for path in output.iterdir()) == [
+        MANIFEST_NAME,
+        "purchase_month=2018-01",
+    ]
@@ -0,0 +1,38 @@
+import shutil
+
+import pandas as pd
+
+from refresh import read_delta, source_state
+
+
+def _copy(data_path, tmp_path):
+    source = tmp_path / "main_data.csv"
+    shutil.copy(data_path, source)
+    return source
+
+
+def test_appended_rows_are_read(data_path, tmp_path):
+    source = _copy(data_path, tmp_path)
+    state = source_state(source)
+    pd.read_csv(source, nrows=5).to_csv(source, mode="a", header=False, index=False)
+
+    rows, current = read_delta(source, state)
+    assert len(rows) == 5
+    assert current == source_state(source)
+    # Nothing more was added since
+    rows, _ = read_delta(source, current)
+    assert rows is not None and rows.empty
+
+
+def test_edit_in_the_middle_is_not_an_append(data_path, tmp_path):
+    source = _copy(data_path, tmp_path)
+    state = source_state(source)
+    data = bytearray(source.read_bytes())
+    # A same-length edit far from the end: the last byte of a middle line
+    middle = data.index(b"\n", len(data) // 2) - 1
+    data[middle : middle + 1] = b"9" if data[middle : middle + 1] != b"9" else b"8"
+    source.write_bytes(bytes(data))
+
+    rows, current = read_delta(source, state)
+    assert rows is None
+    assert current == source_state(source)
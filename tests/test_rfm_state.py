@@ -0,0 +1,39 @@
+import shutil
+
+import numpy as np
+
+from rfm import customer_totals
+from rfm_state import sync_state
+from star import load_star_schema
+
+
+def _monetary(state):
+    return state["totals"]["monetary"].sum()
+
+
+def test_same_size_edit_rebuilds_state(data_path, tmp_path):
+    source = tmp_path / "main_data.csv"
+    shutil.copy(data_path, source)
+    sync_state(source, cache_dir=tmp_path)
+
+    # A payment of a middle row gains a leading 9, in place of a digit of
+    # its price, so the file keeps its length
+    lines = source.read_bytes().split(b"\n")
+    header = lines[0].split(b",")
+    price, payment = header.index(b"price"), header.index(b"payment_value")
+    row = len(lines) // 2
+    while not all(lines[row].split(b",")[col] for col in [price, payment]):
+        row += 1
+    fields = lines[row].split(b",")
+    fields[price] = fields[price][1:]
+    fields[payment] = b"9" + fields[payment]
+    lines[row] = b",".join(fields)
+    size = source.stat().st_size
+    source.write_bytes(b"\n".join(lines))
+    assert source.stat().st_size == size
+
+    state = sync_state(source, cache_dir=tmp_path)
+    _, totals = customer_totals(load_star_schema(source, cache_dir=tmp_path))
+    np.testing.assert_allclose(_monetary(state), totals["monetary"].sum())
+    # Saved under the new digest, so the next sync reads nothing
+    assert sync_state(source, cache_dir=tmp_path)["digest"] == state["digest"]
@@ -0,0 +1,137 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from rfm import calculate_rfm_star
+from sketches import (
+    HLL_BOUND,
+    HLL_EXACT_BELOW,
+    QUANTILE_ALPHA,
+    hll_or_exact,
+    key_hashes,
+    quantile_sketch,
+    sketch_quantiles,
+)
+from star import (
+    approx_star_top_n,
+    build_star_rollup,
+    compute_star_top_n,
+    load_star_schema,
+    star_key_hashes,
+)
+from synthetic import generate_main_data
+
+# Enough rows that the largest states, cities and categories pass the
+# HyperLogLog threshold
+LARGE_ROWS = 60_000
+START, END = datetime.date(2016, 1, 1), datetime.date(2019, 1, 1)
+
+
+@pytest.fixture(scope="module")
+def large_model(tmp_path_factory):
+    folder = tmp_path_factory.mktemp("large")
+    path = folder / "main_data.csv"
+    generate_main_data(LARGE_ROWS).to_csv(path, index=False)
+    return load_star_schema(path, cache_dir=folder)
+
+
+def distinct_keys_per_group(sizes, seed=0):
+    # Group codes and unique integer keys, shuffled like rows of a table
+    rng = np.random.default_rng(seed)
+    groups = np.repeat(np.arange(len(sizes)), sizes)
+    keys = rng.permutation(len(groups))
+    order = rng.permutation(len(groups))
+    return groups[order], pd.Series(keys[order])
+
+
+def test_small_groups_are_exact():
+    sizes = [1, 2, 3, 4, 5, 10, 50, 500, HLL_EXACT_BELOW - 1]
+    groups, keys = distinct_keys_per_group(sizes)
+    # Every key twice: rows, not keys, decide the exact fallback
+    groups = np.concatenate([groups, groups])
+    keys = pd.concat([keys, keys], ignore_index=True)
+    counts = hll_or_exact(groups, key_hashes(keys), keys, len(sizes))
+    assert counts.tolist() == sizes
+
+
+def test_large_groups_within_bound():
+    rng = np.random.default_rng(1)
+    sizes = rng.integers(HLL_EXACT_BELOW, 40_000, 200)
+    groups, keys = distinct_keys_per_group(sizes)
+    counts = hll_or_exact(groups, key_hashes(keys), keys, len(sizes))
+    errors = np.abs(counts - sizes) / sizes
+    # The bound holds for about 95% of estimates
+    assert np.mean(errors <= HLL_BOUND) >= 0.95
+    assert errors.max() < 2 * HLL_BOUND
+
+
+def test_many_rows_few_keys_are_exact():
+    keys = pd.Series(np.tile(np.arange(7), HLL_EXACT_BELOW))
+    groups = np.zeros(len(keys), dtype="int64")
+    assert hll_or_exact(groups, key_hashes(keys), keys, 1).tolist() == [7]
+
+
+def test_missing_groups_are_skipped():
+    keys = pd.Series(pd.Categorical(["a", "b", "c", "a", None]))
+    groups = np.array([0, 0, -1, 1, 1])
+    groups = np.where(key_hashes(keys) != 0, groups, -1)
+    assert hll_or_exact(groups, key_hashes(keys), keys, 2).tolist() == [2, 1]
+
+
+def test_approx_panels_match_exact_on_small_data(model):
+    # Every group of the synthetic data is below the HyperLogLog threshold
+    hashes = star_key_hashes(model)
+    approx = approx_star_top_n(model, hashes, build_star_rollup(model), START, END, 50)
+    exact = compute_star_top_n(model, 50)
+    for name, panel in exact.items():
+        pd.testing.assert_frame_equal(approx[name], panel, check_dtype=False)
+
+
+def test_approx_panels_within_bound_on_synthetic_data(large_model):
+    hashes = star_key_hashes(large_model)
+    rollups = build_star_rollup(large_model)
+    # Every group, so both sides hold the same ones; display labels can
+    # repeat, so groups are paired by label and then by count
+    n = 100_000
+    approx = approx_star_top_n(large_model, hashes, rollups, START, END, n)
+    exact = compute_star_top_n(large_model, n)
+
+    estimated = 0
+    for name in ["top_cities", "top_states", "top_categories_orders"]:
+        value, label = exact[name].columns
+        counts = exact[name].sort_values([label, value])[value].to_numpy()
+        estimates = approx[name].sort_values([label, value])[value].to_numpy()
+        errors = np.abs(estimates - counts) / counts
+        assert (errors <= HLL_BOUND).all(), name
+        # Small groups are exact, so only the large ones can be off
+        assert (errors[counts < HLL_EXACT_BELOW] == 0).all(), name
+        estimated += (counts >= HLL_EXACT_BELOW).sum()
+    assert estimated >= 3
+
+
+def test_rfm_quintile_edges_within_alpha_on_synthetic_data(large_model):
+    rfm = calculate_rfm_star(large_model)
+    quantiles = np.linspace(0, 1, 6)
+    for column in ["Recency", "Monetary"]:
+        values = rfm[column].to_numpy(dtype="float64")
+        estimates = sketch_quantiles(quantile_sketch(values), quantiles)
+        exact = np.quantile(values, quantiles, method="lower")
+        np.testing.assert_allclose(estimates, exact, rtol=QUANTILE_ALPHA, atol=0)
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_quantiles_within_alpha(seed):
+    values = np.random.default_rng(seed).lognormal(4, 1.5, 50_000)
+    values[:100] = 0
+    quantiles = np.linspace(0, 1, 21)
+    estimates = sketch_quantiles(quantile_sketch(values), quantiles)
+    exact = np.quantile(values, quantiles, method="lower")
+    np.testing.assert_allclose(estimates, exact, rtol=QUANTILE_ALPHA, atol=0)
+
+
+def test_zero_key_is_not_missing():
+    hashes = key_hashes(pd.Series([0, 1, 2]))
+    assert (hashes != 0).all()
+    assert key_hashes(pd.Series([0.0, np.nan]))[1] == 0
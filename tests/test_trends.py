@@ -0,0 +1,35 @@
+import datetime
+
+import pytest
+from pandas.testing import assert_frame_equal
+
+from analytics import select_rows
+from trends import build_trends, month_span, monthly_counts, query_trends
+
+
+def test_month_span():
+    assert month_span(datetime.date(2017, 2, 14), datetime.date(2017, 3, 3)) == (
+        datetime.date(2017, 2, 1),
+        datetime.date(2017, 3, 31),
+    )
+
+
+@pytest.mark.parametrize(
+    "start, end",
+    [
+        (datetime.date(2017, 2, 14), datetime.date(2017, 11, 20)),
+        (datetime.date(2018, 3, 10), datetime.date(2018, 3, 12)),
+    ],
+)
+def test_every_state_selected_matches_unfiltered(model, start, end):
+    # Selecting every value keeps every row, so the edge months stay whole
+    trends = build_trends(model)
+    dataset = {"model": model, "filter_index": None}
+    states = list(model["orders"]["customer_state"].cat.categories)
+    selections = {"customer_state": states}
+    months = select_rows(dataset, *month_span(start, end), selections)
+    filtered = query_trends(trends, start, end, 5, monthly_counts(months, trends))
+
+    expected = query_trends(trends, start, end, 5)
+    for name, frame in expected.items():
+        assert_frame_equal(filtered[name], frame)